@@ -1,31 +1,190 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from typing import List
-from app.models.job import Job, JobCreate
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+from datetime import datetime
+from app.models.job import (
+    Job, JobCreate, JobBatchCreate, JobBatchItemResult, JobBatchResult, JobListItem, JobPriority, JobResult,
+    WorkflowCreate, WorkflowResult, WorkflowStatus,
+)
+from app.models.schedule import Schedule, ScheduleCreate
+from app.models.dead_letter import (
+    DeadLetterFilter, DeadLetterGroup, DeadLetterOperation, DeadLetterPurge, DeadLetterRequeue,
+)
+from app.models.worker import ScalingRecommendation, WorkerInfo
+from app.models.stats import Timeseries
 from app.services.queue_service import queue_service
+from app.services.fair_queue import fair_queue
+from app.services.dependencies import DependencyError
+from app.services.payload_store import PayloadTooLarge, payload_store
+from app.services.schedule_service import schedule_service
+from app.services.dead_letter import dead_letter_queue, dead_letter_query
+from app.services.worker_registry import worker_registry
+from app.services.job_stats import job_stats
 from app.services.rate_limiter import rate_limiter
+from app.services.result_store import result_store, ResultExpired
+from app.services.events import TERMINAL_STATUSES, event_bus, event_broadcaster, parse_stream_id
 from app.core.database import db
-from app.core.redis import redis_client
+from app.core.queues import QUEUES
+from app.core.config import settings
+from app.core.serialization import FastJSONResponse, dumps
 from bson import ObjectId
-import asyncio
-import json
+import base64
+import math
 
 router = APIRouter()
 
 @router.post("/jobs", response_model=Job, status_code=201)
-async def create_job(job: JobCreate):
+async def create_job(job: JobCreate, response: Response):
     # Rate Limiting
-    if not await rate_limiter.is_allowed(job.user_id):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    limit = await rate_limiter.check(job.user_id, job.type)
+    if not limit.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=limit.headers())
+    response.headers.update(limit.headers())
     
-    return await queue_service.enqueue_job(job)
+    try:
+        if not job.idempotency_key:
+            return await queue_service.enqueue_job(job)
+        enqueued, created = await queue_service.enqueue_idempotent(job)
+    except DependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not created:
+        # A retry (or a debounced repeat): answer with the job the key already maps to
+        response.status_code = 200
+        response.headers["Idempotent-Replayed"] = "true"
+    return enqueued
+
+@router.post("/jobs/batch", response_model=JobBatchResult, status_code=201)
+async def create_jobs_batch(batch: JobBatchCreate, response: Response):
+    if len(batch.jobs) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.MAX_BATCH_SIZE} jobs")
+
+    # Rate Limiting: every job in the batch counts against its user's (and type's) quota.
+    # A group is admitted as far as the tokens go; the rest is rejected per item.
+    groups = {}
+    for index, job in enumerate(batch.jobs):
+        groups.setdefault((job.user_id, job.type), []).append(index)
+
+    accepted = []
+    results = []
+    tightest = None
+    for (user_id, job_type), indexes in groups.items():
+        limit = await rate_limiter.check_batch(user_id, job_type, len(indexes))
+        if tightest is None or not limit.allowed or (tightest.allowed and (limit.remaining or 0) < (tightest.remaining or 0)):
+            tightest = limit
+        accepted.extend(indexes[:limit.admitted])
+        results.extend(
+            JobBatchItemResult(index=i, status="rejected", error="Rate limit exceeded") for i in indexes[limit.admitted:]
+        )
+
+    if not accepted:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=tightest.headers())
+    response.headers.update(tightest.headers())
+
+    accepted.sort()
+    try:
+        enqueued = await queue_service.enqueue_many([batch.jobs[i] for i in accepted])
+    except DependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for item in enqueued:
+        item.index = accepted[item.index]
+        results.append(item)
+
+    results.sort(key=lambda r: r.index)
+    ok = sum(1 for r in results if r.job_id)
+    return JobBatchResult(accepted=ok, rejected=len(results) - ok, results=results)
+
+@router.post("/workflows", response_model=WorkflowResult, status_code=201)
+async def create_workflow(workflow: WorkflowCreate, response: Response):
+    if len(workflow.jobs) > settings.MAX_WORKFLOW_SIZE:
+        raise HTTPException(status_code=413, detail=f"Workflow exceeds {settings.MAX_WORKFLOW_SIZE} jobs")
+
+    # Rate Limiting: all or nothing, a partial DAG would never finish
+    groups = {}
+    for job in workflow.jobs:
+        groups[(job.user_id, job.type)] = groups.get((job.user_id, job.type), 0) + 1
+    for (user_id, job_type), count in groups.items():
+        limit = await rate_limiter.check(user_id, job_type, cost=math.ceil(count * settings.RATE_LIMIT_BATCH_COST))
+        if not limit.allowed and limit.retry_after is None:
+            # More jobs than the bucket ever holds: waiting won't help, so no Retry-After
+            raise HTTPException(status_code=413, detail="Workflow exceeds the rate limit capacity", headers=limit.headers())
+        if not limit.allowed:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=limit.headers())
+        response.headers.update(limit.headers())
+
+    try:
+        return await queue_service.enqueue_workflow(workflow)
+    except DependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@router.get("/workflows/{workflow_id}", response_model=WorkflowStatus)
+async def get_workflow(workflow_id: str):
+    pipeline = [{"$match": {"workflow_id": workflow_id}}, {"$group": {"_id": "$status", "n": {"$sum": 1}}}]
+    counts = {row["_id"]: row["n"] async for row in db.db["jobs"].aggregate(pipeline)}
+    if not counts:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return WorkflowStatus(workflow_id=workflow_id, total=sum(counts.values()), counts=counts)
 
-@router.get("/jobs", response_model=List[Job])
-async def list_jobs(limit: int = 50):
-    cursor = db.db["jobs"].find().sort("created_at", -1).limit(limit)
-    jobs = await cursor.to_list(length=limit)
-    for j in jobs:
-        j["_id"] = str(j["_id"])
-    return jobs
+# Keys a job row may have in list responses; documents also hold internal ones (e.g. scheduled_for)
+JOB_FIELDS = tuple(field.alias or name for name, field in JobListItem.model_fields.items())
+
+def _job_rows(jobs: List[dict], headers: dict) -> FastJSONResponse:
+    # Rows come from MongoDB already in Job shape: pick the known keys and encode them
+    # as they are instead of validating every row (and its payload) against JobListItem
+    rows = [{name: job[name] for name in JOB_FIELDS if name in job} for job in jobs]
+    return FastJSONResponse(rows, headers=headers)
+
+def _encode_cursor(job: dict) -> str:
+    raw = f"{job['created_at'].isoformat()}|{job['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/jobs", response_model=List[JobListItem], response_model_exclude_unset=True)
+async def list_jobs(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    job_type: Optional[str] = Query(None, alias="type"),
+    priority: Optional[JobPriority] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. status,type,user_id)"),
+):
+    # Equality filters first, so each query maps onto a (filter, created_at, _id) index
+    query = {}
+    if status:
+        query["status"] = status
+    if user_id:
+        query["user_id"] = user_id
+    if job_type:
+        query["type"] = job_type
+    if priority:
+        query["priority"] = int(priority)
+
+    # Keyset pagination: continue strictly after the last (created_at, _id) of the previous page
+    if cursor:
+        created_at, last_id = _decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+
+    projection = None
+    if fields:
+        projection = {f.strip(): 1 for f in fields.split(",") if f.strip()}
+        projection["created_at"] = 1 # Needed to build the next cursor
+
+    results = db.db["jobs"].find(query, projection).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+    jobs = await results.to_list(length=limit)
+    headers = {"X-Next-Cursor": _encode_cursor(jobs[-1])} if len(jobs) == limit else {}
+    return _job_rows(jobs, headers)
 
 @router.get("/jobs/{job_id}", response_model=Job)
 async def get_job(job_id: str):
@@ -37,18 +196,99 @@ async def get_job(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
         
     job["_id"] = str(job["_id"])
+    await payload_store.resolve([job])
     return job
 
+@router.get("/jobs/{job_id}/result", response_model=JobResult, response_model_exclude_none=True)
+async def get_job_result(
+    job_id: str,
+    response: Response,
+    wait: float = Query(0, ge=0, description="Seconds to long-poll for the job to finish"),
+):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    try:
+        if wait:
+            result = await result_store.wait_for_result(job_id, min(wait, settings.RESULT_WAIT_MAX))
+        else:
+            result = await result_store.get_result(job_id)
+    except ResultExpired:
+        raise HTTPException(status_code=410, detail="Result expired")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if result["status"] not in TERMINAL_STATUSES:
+        response.status_code = 202 # Not finished yet
+    return result
+
 @router.get("/stats")
 async def get_stats():
-    # Gather stats from Redis
-    queues = ["queue:immediate:high", "queue:immediate:normal", "queue:immediate:low", "queue:dead_letter"]
-    stats = {}
-    for q in queues:
-        stats[q] = await redis_client.llen(q)
-    
-    stats["delayed"] = await redis_client.zcard("queue:delayed")
-    return stats
+    # Gather stats from Redis (one pipelined round trip)
+    return await queue_service.queue_depths()
+
+@router.get("/stats/timeseries", response_model=Timeseries)
+async def get_stats_timeseries(
+    type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = Query(None, description="Default: an hour before end"),
+    end: Optional[datetime] = Query(None, description="Default: now"),
+    step: int = Query(60, ge=60, description="Seconds per point, a multiple of 60"),
+):
+    """Throughput, failure rate and execution-time percentiles over time, for
+    all jobs or one type or user, read from per-minute counters (no MongoDB scan)."""
+    if type and user_id:
+        raise HTTPException(status_code=400, detail="Filter by type or by user_id, not both")
+    dimension = f"type:{type}" if type else f"user:{user_id}" if user_id else "all"
+    try:
+        return await job_stats.timeseries(dimension, start, end, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/workers", response_model=List[WorkerInfo])
+async def list_workers():
+    return await worker_registry.workers()
+
+@router.get("/workers/scaling", response_model=ScalingRecommendation)
+async def get_scaling():
+    # For autoscalers: recommended worker count from backlog, arrival rate and execution times
+    depths = await queue_service.queue_depths()
+    return await worker_registry.scaling(sum(depths[q] for q in QUEUES))
+
+@router.get("/dlq", response_model=List[JobListItem], response_model_exclude_unset=True)
+async def list_dead_letters(
+    filters: DeadLetterFilter = Depends(),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+):
+    # Newest first along the status_id index; the cursor is the last _id seen
+    query = dead_letter_query(filters)
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(cursor)}
+    projection = {"payload": 0} # Can be large; fetch the job itself for it
+    jobs = await db.db["jobs"].find(query, projection).sort("_id", -1).limit(limit).to_list(length=limit)
+    headers = {"X-Next-Cursor": str(jobs[-1]["_id"])} if len(jobs) == limit else {}
+    return _job_rows(jobs, headers)
+
+@router.get("/dlq/groups", response_model=List[DeadLetterGroup])
+async def dead_letter_groups(filters: DeadLetterFilter = Depends(), limit: int = Query(50, ge=1, le=500)):
+    return await dead_letter_queue.groups(filters, limit)
+
+@router.post("/dlq/requeue", response_model=DeadLetterOperation, status_code=202)
+async def requeue_dead_letters(request: DeadLetterRequeue):
+    """Requeue matching jobs in the background, at most `rate` jobs per second."""
+    return await dead_letter_queue.start("requeue", request, limit=request.limit, rate=request.rate)
+
+@router.post("/dlq/purge", response_model=DeadLetterOperation, status_code=202)
+async def purge_dead_letters(request: DeadLetterPurge):
+    return await dead_letter_queue.start("purge", request, limit=request.limit)
+
+@router.get("/dlq/operations/{operation_id}", response_model=DeadLetterOperation)
+async def get_dead_letter_operation(operation_id: str):
+    operation = await dead_letter_queue.operation(operation_id)
+    if not operation:
+        raise HTTPException(status_code=404, detail="Operation not found")
+    return operation
 
 @router.post("/jobs/{job_id}/retry")
 async def retry_job(job_id: str):
@@ -71,46 +311,105 @@ async def boost_job(job_id: str):
         raise HTTPException(status_code=400, detail="Job cannot be boosted (must be queued/delayed)")
     return {"status": "Job boosted ⚡"}
 
+@router.post("/schedules", response_model=Schedule, status_code=201)
+async def create_schedule(schedule: ScheduleCreate):
+    return await schedule_service.create(schedule)
+
+@router.get("/schedules", response_model=List[Schedule])
+async def list_schedules(user_id: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    return await schedule_service.list(user_id, limit)
+
+@router.get("/schedules/{schedule_id}", response_model=Schedule)
+async def get_schedule(schedule_id: str):
+    if not ObjectId.is_valid(schedule_id):
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    schedule = await schedule_service.get(schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+@router.post("/schedules/{schedule_id}/pause")
+async def pause_schedule(schedule_id: str):
+    if not ObjectId.is_valid(schedule_id) or not await schedule_service.set_enabled(schedule_id, False):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"status": "Schedule paused"}
+
+@router.post("/schedules/{schedule_id}/resume")
+async def resume_schedule(schedule_id: str):
+    if not ObjectId.is_valid(schedule_id) or not await schedule_service.set_enabled(schedule_id, True):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"status": "Schedule resumed"}
+
+@router.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: str):
+    if not ObjectId.is_valid(schedule_id) or not await schedule_service.delete(schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"status": "Schedule deleted"}
+
 @router.get("/cron/process")
 async def process_jobs_cron():
     """
     Vercel Cron Handler: Simulates the worker by processing a few jobs.
     Since Vercel has timeouts, we process only one batch.
     """
-    from app.worker import process_job
-    import asyncio
-    
-    # Try to pop a job from high priority then normal
-    # This is a 'serverless worker' simulation
-    
-    did_work = False
-    
-    # 1. High Priority
-    job_id_str = await redis_client.lpop("queue:immediate:high")
-    if job_id_str:
-        await process_job(job_id_str)
-        did_work = True
-        
-    # 2. Normal Priority (if we have time/capacity)
-    if not did_work:
-        job_id_str = await redis_client.lpop("queue:immediate")
-        if job_id_str:
-            await process_job(job_id_str)
-            did_work = True
-            
-    return {"status": "Cron run completed", "did_work": did_work}
+    from app.worker import Worker # Imported on demand: the API itself never runs jobs
+    from app.services.handlers import handler_registry
+
+    # Worker.start() isn't run here, so load the real handlers (once per instance)
+    handler_registry.discover()
+    # This is a 'serverless worker' simulation: one non-blocking scripted pop
+    # (priority order + aging), up to WORKER_PREFETCH jobs
+    worker = Worker()
+    popped = await fair_queue.dequeue(
+        QUEUES, "cron", count=worker.prefetch, aging=settings.QUEUE_AGING_SECONDS
+    )
+    if len(popped) == 1:
+        queue_name, job_id = popped[0]
+        await worker.process_job(job_id, queue_name)
+    elif popped:
+        await worker.process_batch(popped)
+    await job_stats.flush() # No flusher runs here
+
+    return {"status": "Cron run completed", "did_work": bool(popped), "processed": len(popped)}
+
+async def _replay(websocket: WebSocket, last_event_id: str) -> Optional[str]:
+    """Send the events the client missed since its last seen event; returns the id of the last one sent."""
+    last_sent = None
+    limit = settings.EVENTS_REPLAY_LIMIT
+    events = await event_bus.read_since(last_event_id, limit + 1)
+    for event in events[:limit]:
+        await websocket.send_text(dumps(event).decode())
+        last_sent = event["event_id"]
+    if len(events) > limit:
+        # Live events follow, so the ones after last_sent would be skipped silently
+        await websocket.send_text(dumps({
+            "type": "replay_truncated", "last_event_id": last_sent,
+            "msg": f"Replay stopped after {limit} events; reconnect with this last_event_id for the rest",
+        }).decode())
+    return last_sent
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, last_event_id: Optional[str] = None):
     await websocket.accept()
-    pubsub = redis_client.pubsub()
-    await pubsub.subscribe("events:jobs")
+    if last_event_id:
+        try:
+            parse_stream_id(last_event_id)
+        except ValueError:
+            await websocket.close(code=1008, reason="Invalid last_event_id")
+            return
+    # Subscribe before replaying so nothing published in between is missed
+    sub = event_broadcaster.subscribe()
     
     try:
+        # Resume: replay what the client missed since its last seen event
+        last_sent = await _replay(websocket, last_event_id) if last_event_id else None
+        
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True)
-            if message:
-                await websocket.send_text(message["data"])
-            await asyncio.sleep(0.01)
+            for event_id, text in await sub.get():
+                if last_sent and parse_stream_id(event_id) <= parse_stream_id(last_sent):
+                    continue # Already sent during replay
+                await websocket.send_text(text)
     except WebSocketDisconnect:
-        await pubsub.unsubscribe("events:jobs")
+        pass
+    finally:
+        event_broadcaster.unsubscribe(sub)
@@ -1,24 +1,164 @@
+import os
+import socket
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Redis Job Scheduler"
     
     # Redis (Standard)
+    REDIS_URL: str | None = None  # redis:// or rediss:// (e.g. Upstash's TCP endpoint); overrides the host settings below
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str | None = None
+    REDIS_MAX_CONNECTIONS: int = 50  # Command pool size per process
+    REDIS_BLOCKING_MAX_CONNECTIONS: int = 10  # Separate pool for BRPOP / XREAD BLOCK
+    REDIS_POOL_TIMEOUT: float = 5.0  # Seconds to wait for a free pooled connection
+    REDIS_CONNECT_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0  # Read timeout for (non-blocking) commands
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # Ping idle connections before reuse after this many seconds
+    # Queue shards: more Redis nodes (redis:// URLs) that share the job queues with the one above
+    REDIS_SHARD_URLS: list[str] = []
+    REDIS_SHARD_VNODES: int = 64  # Points per shard on the consistent-hash ring
 
-    # Redis (Upstash HTTP - Optional)
+    # Redis (Upstash HTTP - Optional; used for the main Redis unless REDIS_URL is set)
     UPSTASH_REDIS_REST_URL: str | None = None
     UPSTASH_REDIS_REST_TOKEN: str | None = None
     
     # MongoDB
     MONGO_URL: str = "mongodb://mongo:27017"
     MONGO_DB_NAME: str = "job_scheduler"
+    MONGO_ENSURE_INDEXES: bool = True  # Create the job indexes on API startup
+    MONGO_TLS: bool | None = None  # None: on for mongodb+srv:// URLs (e.g. Atlas), off otherwise
+    MONGO_TLS_ALLOW_INVALID_CERTIFICATES: bool = False
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int | None = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int | None = None  # Max wait for a pooled connection (None: unbounded)
     
+    # Observability
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json | text
+    WORKER_METRICS_PORT: int | None = 9100  # Prometheus endpoint of the worker (None disables it)
+
+    # API
+    MAX_BATCH_SIZE: int = 5000  # Max jobs per POST /api/jobs/batch request
+    HEALTH_CHECK_TIMEOUT: float = 2.0  # Per-dependency timeout of GET /health
+    HEALTH_POOL_SATURATION_WARN: float = 0.9  # /health reports "degraded" from this pool usage up
+
+    # Rate limiting (token bucket: RATE_LIMIT_REQUESTS per RATE_LIMIT_WINDOW seconds)
+    RATE_LIMIT_REQUESTS: int = 10
+    RATE_LIMIT_WINDOW: int = 60
+    RATE_LIMIT_TYPE_LIMITS: dict[str, int] = {}  # Extra per-user limit for specific job types
+    RATE_LIMIT_BATCH_COST: float = 1.0  # Tokens charged per job in a batch submission
+    RATE_LIMIT_LOCAL_PRECHECK: bool = True  # Shed requests in-process while a recent denial still holds
+
+    # Events (Redis Stream + WebSocket fan-out)
+    EVENTS_STREAM_MAXLEN: int = 10000  # Approximate cap on the events:jobs stream
+    EVENTS_CLIENT_BUFFER: int = 256  # Max buffered events per WebSocket before coalescing/dropping
+    EVENTS_REPLAY_LIMIT: int = 1000  # Max events replayed when a client resumes
+
     # Worker
-    WORKER_ID: str = "worker-1"
+    # Must be unique per worker process
+    WORKER_ID: str = Field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}")
+    WORKER_CONCURRENCY: int = 1  # Max in-flight jobs per worker process
+    WORKER_EXECUTOR: str = "async"  # async | thread | process, for job types without a registered handler
+    WORKER_EXECUTOR_MAX_WORKERS: int | None = None  # Thread pool size (each process-mode job runs in a process of its own)
+    JOB_HANDLER_MODULES: list[str] = []  # Extra modules to import for handler registration
+    WORKER_TYPE_CAP_DEFER: float = 1.0  # Seconds to push back a job whose type is at its concurrency cap
+    WORKER_SHUTDOWN_TIMEOUT: float = 30.0  # Seconds to drain in-flight jobs on shutdown
+    WORKER_PREFETCH: int = 1  # >1: pop up to this many jobs at once and process them as a batch (short jobs)
+    JOB_LOCK_TTL: int = 60  # Default lease of lock:job:{id}; renewed while the job runs
+    JOB_LOCK_RENEW_INTERVAL: float = 10.0  # Also how often running jobs are checked for cancellation
+
+    # Job metadata cache (job:{id} hashes in Redis)
+    JOB_CACHE_TTL: int = 86400
+    JOB_STATE_CONSISTENCY: str = "strong"  # strong: write MongoDB inline | eventual: batched write-behind
+    JOB_FLUSH_INTERVAL: float = 1.0
+    JOB_FLUSH_BATCH_SIZE: int = 500
+
+    # Job payloads
+    JOB_PAYLOAD_INLINE_MAX_BYTES: int = 16384  # Larger payloads (as JSON) are stored in GridFS, referenced by payload_ref
+    JOB_PAYLOAD_MAX_BYTES: int = 10485760  # Larger payloads are rejected (413, or a failed batch item)
+
+    # Idempotent submission (idempotency_key / debounce on JobCreate)
+    IDEMPOTENCY_TTL: int = 86400  # Seconds a key keeps returning the same job
+    DEBOUNCE_MAX_DELAY: float = 300.0  # Longest a debounced job can be pushed back by repeats
+
+    # Dead letter queue management (bulk requeue / purge)
+    DLQ_CHUNK_SIZE: int = 1000  # Jobs per find + update_many + pipeline
+    DLQ_REQUEUE_RATE: float = 500.0  # Default jobs/second a bulk requeue pushes back onto the queues
+    DLQ_OPERATION_TTL: int = 86400  # Seconds a bulk operation's progress stays readable
+    DLQ_INTERVAL: float = 1.0  # Seconds between the elected worker's checks for new bulk operations
+    DLQ_LEASE_TTL: int = 60
+
+    # Job dependencies
+    DEPENDENCY_RELEASE_BATCH: int = 1000  # Children released (or failed) per script call
+    MAX_WORKFLOW_SIZE: int = 10000
+
+    # Job results (small ones in Redis, large ones in blob storage)
+    RESULT_TTL: int = 86400  # Seconds a Redis-backed result is kept
+    RESULT_INLINE_MAX_BYTES: int = 65536  # Larger JSON results go to blob storage
+    RESULT_BLOB_BACKEND: str = "gridfs"  # gridfs | file
+    RESULT_BLOB_DIR: str = "./results"  # For RESULT_BLOB_BACKEND=file (shared volume)
+    RESULT_WAIT_MAX: float = 60.0  # Longest long-poll allowed on GET /jobs/{id}/result
+
+    # Retention of completed jobs (one elected worker applies it)
+    RETENTION_ENABLED: bool = True  # Whether this worker takes part in the election
+    RETENTION_DAYS: int = 30  # 0 keeps completed jobs forever
+    RETENTION_MODE: str = "purge"  # purge | archive (move to jobs_archive)
+    RETENTION_INTERVAL: int = 3600
+    RETENTION_BATCH_SIZE: int = 1000
+    RETENTION_LEASE_TTL: int = 60
+
+    # Delayed-job promoter (one elected worker runs it)
+    PROMOTER_ENABLED: bool = True  # Whether this worker takes part in the election
+    PROMOTER_INTERVAL: float = 1.0
+    PROMOTER_BATCH_SIZE: int = 1000
+    PROMOTER_LEASE_TTL: int = 10
+
+    # Recurring schedules (one elected worker materializes them into queue:delayed)
+    SCHEDULER_ENABLED: bool = True  # Whether this worker takes part in the election
+    SCHEDULER_INTERVAL: float = 5.0
+    SCHEDULER_LOOKAHEAD: int = 60  # Seconds of upcoming runs to materialize ahead of time
+    SCHEDULER_BATCH_SIZE: int = 500  # Schedules per pass
+    SCHEDULER_MAX_FIRES: int = 100  # Runs per schedule per pass (bounds catch-up and tight intervals)
+    SCHEDULER_LEASE_TTL: int = 30
+
+    # Reliable Queue (in-flight tracking + lease reaper)
+    RELIABLE_QUEUE: bool = False
+    LEASE_TTL: int = 60  # Seconds a popped job stays leased without a heartbeat
+    LEASE_HEARTBEAT_INTERVAL: int = 15
+    REAPER_INTERVAL: int = 10
+    REAPER_BATCH_SIZE: int = 1000
+
+    # Fair scheduling (per-tenant sub-queues, see ARCHITECTURE.md)
+    FAIR_SCHEDULING: bool = False
+    QUEUE_AGING_SECONDS: float = 30.0  # Serve a lower priority once it has waited this long (0 = strict priority)
+    QUEUE_IDLE_WAIT: int = 1  # Seconds an idle worker blocks on the wake-up signal
+
+    # Worker registry & autoscaling signals (GET /api/workers, GET /api/workers/scaling)
+    WORKER_HEARTBEAT_INTERVAL: float = 5.0
+    WORKER_HEARTBEAT_TTL: int = 20  # A worker missing heartbeats for this long counts as gone
+    WORKER_HEARTBEAT_MAX_JOB_IDS: int = 50  # Current job ids listed per heartbeat
+    SCALING_WINDOW: int = 300  # Seconds of arrivals and execution times the recommendation looks at
+    SCALING_TARGET_UTILIZATION: float = 0.8  # Busy fraction of worker slots to plan for
+    SCALING_DRAIN_SECONDS: float = 300.0  # Clear the current backlog within this long
+    SCALING_MIN_WORKERS: int = 1
+    SCALING_MAX_WORKERS: int = 100
+
+    # Job analytics: per-minute counters and latency histograms (GET /api/stats/timeseries)
+    STATS_FLUSH_INTERVAL: float = 5.0  # Seconds a worker buffers observations before adding them in Redis
+    STATS_BUCKET_TTL: int = 172800  # Seconds the minute buckets are kept
+    STATS_PER_USER: bool = True  # Also keep buckets per user_id
+    STATS_MAX_POINTS: int = 1440  # Most points in one timeseries response
+    STATS_READ_BATCH: int = 1200  # Minute buckets read per pipeline (timeseries and rollups)
+    STATS_ROLLUP_ENABLED: bool = False  # Fold complete hours into the `stats_rollups` collection (one elected worker)
+    STATS_ROLLUP_INTERVAL: int = 300
+    STATS_ROLLUP_LEASE_TTL: int = 60
     
     class Config:
         case_sensitive = True
@@ -1,26 +1,147 @@
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.monitoring import ConnectionPoolListener
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Every list query sorts by (created_at, _id) descending, optionally after an equality filter
+JOB_INDEXES = [
+    IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="status_created_at_id"),
+    IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created_at_id"),
+    IndexModel(
+        [("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="user_status_created_at_id",
+    ),
+    # Retention: completed jobs oldest first by completion time
+    IndexModel([("status", ASCENDING), ("completed_at", ASCENDING)], name="status_completed_at"),
+    # Walks one status in _id order (dead letter requeue/purge)
+    IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_id"),
+    IndexModel([("workflow_id", ASCENDING), ("status", ASCENDING)], name="workflow_status", sparse=True),
+    # One job per schedule fire time, so a restarted or second scheduler can't double-fire
+    IndexModel(
+        [("schedule_id", ASCENDING), ("scheduled_for", ASCENDING)],
+        name="schedule_fire_unique", unique=True,
+        partialFilterExpression={"schedule_id": {"$exists": True}},
+    ),
+    # Backstop for idempotency keys whose Redis reservation expired or raced
+    IndexModel(
+        [("user_id", ASCENDING), ("idempotency_key", ASCENDING)],
+        name="user_idempotency_key_unique", unique=True,
+        partialFilterExpression={"idempotency_key": {"$type": "string"}},
+    ),
+    IndexModel([("type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="type_created_at_id"),
+    IndexModel([("priority", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="priority_created_at_id"),
+]
+
+# The scheduler scans enabled schedules by their next fire time
+SCHEDULE_INDEXES = [
+    IndexModel([("enabled", ASCENDING), ("next_run_at", ASCENDING)], name="enabled_next_run_at"),
+    IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created_at"),
+]
+
+STATS_ROLLUP_INDEXES = [
+    IndexModel([("dimension", ASCENDING), ("hour", ASCENDING)], name="dimension_hour"),
+]
+
+class PoolStats(ConnectionPoolListener):
+    """Counts connection checkouts, since pymongo has no public pool counters."""
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "max_connections": settings.MONGO_MAX_POOL_SIZE,
+            "open": self.open,
+            "in_use": self.checked_out,
+            "waiting": self.waiting,
+            "saturation": round(self.checked_out / settings.MONGO_MAX_POOL_SIZE, 3) if settings.MONGO_MAX_POOL_SIZE else 0.0,
+        }
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open = max(0, self.open - 1)
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        self.waiting = max(0, self.waiting - 1)
+
+    def connection_checked_out(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out = max(0, self.checked_out - 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+def use_tls() -> bool:
+    if settings.MONGO_TLS is not None:
+        return settings.MONGO_TLS
+    return settings.MONGO_URL.startswith("mongodb+srv://")
+
 class Database:
     client: AsyncIOMotorClient = None
     db = None
 
+    def __init__(self):
+        self.pool_stats = PoolStats()
+
     def connect(self):
-        import certifi
-        # Vercel/AWS Lambda needs Certifi for reliable SSL
-        # Fallback: Allow invalid certs if handshake fails
-        self.client = AsyncIOMotorClient(
-            settings.MONGO_URL,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            tlsCAFile=certifi.where()
+        # Motor connects in the background, so this returns without any network round trip
+        options = dict(
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[self.pool_stats],
         )
+        if use_tls():
+            # Vercel/AWS Lambda needs Certifi for reliable SSL; only loaded when TLS is on
+            import certifi
+            options.update(
+                tls=True,
+                tlsCAFile=certifi.where(),
+                tlsAllowInvalidCertificates=settings.MONGO_TLS_ALLOW_INVALID_CERTIFICATES,
+            )
+        self.client = AsyncIOMotorClient(settings.MONGO_URL, **options)
         self.db = self.client[settings.MONGO_DB_NAME]
-        print("Connected to MongoDB")
+        logger.info("Connected to MongoDB", extra={"tls": use_tls(), "max_pool_size": settings.MONGO_MAX_POOL_SIZE})
+
+    async def ensure_indexes(self):
+        # create_indexes is a no-op for indexes that already exist
+        names = await self.db["jobs"].create_indexes(JOB_INDEXES)
+        names += await self.db["schedules"].create_indexes(SCHEDULE_INDEXES)
+        names += await self.db["stats_rollups"].create_indexes(STATS_ROLLUP_INDEXES)
+        logger.info("MongoDB indexes ready: %s", ", ".join(names))
 
     def close(self):
         self.client.close()
-        print("Disconnected from MongoDB")
+        logger.info("Disconnected from MongoDB")
 
 db = Database()
 
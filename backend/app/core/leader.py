@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from app.core.redis import LuaScript
+
+logger = logging.getLogger(__name__)
+
+# Take the lease if it's free, or extend it if we already hold it
+ACQUIRE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+RESIGN_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class LeaderLease:
+    """Redis-based leader election: one owner holds `leader:{name}` until it
+    stops renewing it within `ttl` seconds."""
+
+    def __init__(self, name: str, owner: str, ttl: int):
+        self.key = f"leader:{name}"
+        self.owner = owner
+        self.ttl = ttl
+        self._acquire = LuaScript(ACQUIRE_LUA)
+        self._resign = LuaScript(RESIGN_LUA)
+
+    async def acquire(self) -> bool:
+        return bool(await self._acquire(keys=[self.key], args=[self.owner, int(self.ttl * 1000)]))
+
+    async def resign(self):
+        await self._resign(keys=[self.key], args=[self.owner])
+
+async def run_as_leader(name: str, owner: str, ttl: int, interval: float, step: Callable[[], Awaitable[Optional[bool]]]):
+    """Run `step` every `interval` seconds for as long as `owner` holds the
+    `name` lease; the other candidates keep retrying to take it over.
+
+    A step must return within the lease TTL. One that stops early with work
+    left returns True and runs again right after the lease is renewed.
+    """
+    lease = LeaderLease(name, owner, ttl)
+    try:
+        while True:
+            more = False
+            try:
+                if await lease.acquire():
+                    more = bool(await step())
+            except Exception as e:
+                logger.error("Leader task %s failed: %s", name, e, extra={"leader": name})
+            if not more:
+                await asyncio.sleep(interval)
+    finally:
+        try:
+            await lease.resign()
+        except Exception:
+            pass
@@ -0,0 +1,35 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets from sub-millisecond Redis calls up to long-running jobs
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+ENQUEUE_STAGE_SECONDS = Histogram(
+    "job_enqueue_stage_seconds", "Time spent per enqueue stage", ["stage"], buckets=FAST_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds", "Time from job creation to pop by a worker", ["queue"], buckets=SLOW_BUCKETS
+)
+JOB_EXECUTION_SECONDS = Histogram(
+    "job_execution_seconds", "Handler execution time", ["type", "outcome"], buckets=SLOW_BUCKETS
+)
+MONGO_UPDATE_SECONDS = Histogram(
+    "job_mongo_update_seconds", "Latency of job status writes to MongoDB", ["mode"], buckets=FAST_BUCKETS
+)
+JOB_RETRIES = Counter("job_retries_total", "Failed jobs scheduled for retry", ["type"])
+JOB_DEAD_LETTERED = Counter("job_dead_lettered_total", "Jobs moved to the dead letter queue", ["type"])
+JOB_CLAIM_SKIPPED = Counter(
+    "job_claim_skipped_total", "Popped entries not executed (lock contention, cancelled, stale)", ["reason"]
+)
+QUEUE_DEPTH = Gauge("job_queue_depth", "Entries per Redis queue", ["queue"])
+APP_STARTUP_SECONDS = Gauge("app_startup_seconds", "Time spent starting up, by phase", ["component", "phase"])
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
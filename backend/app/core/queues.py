@@ -0,0 +1,48 @@
+# Redis queue keys (see ARCHITECTURE.md)
+from typing import Optional
+from app.core.config import settings
+
+HIGH_QUEUE = "queue:immediate:high"
+NORMAL_QUEUE = "queue:immediate:normal"
+LOW_QUEUE = "queue:immediate:low"
+DEAD_LETTER_QUEUE = "queue:dead_letter" # ZSET: job_id -> time it was dead-lettered
+
+# Consumed in strict priority order
+QUEUES = [HIGH_QUEUE, NORMAL_QUEUE, LOW_QUEUE]
+
+# Fair scheduling: each priority queue is split into one sub-queue per tenant
+# (`{queue}:u:{user_id}`) plus a ring of tenants that currently have work.
+TENANT_INFIX = ":u:"
+SIGNAL_KEY = "queue:signal"  # LIST, one entry per push; idle workers block on it
+SIGNAL_MAX = 100
+ARRIVALS_PREFIX = "stats:arrivals:"  # String per minute, counts pushes (arrival rate for autoscaling)
+
+def queue_for_priority(priority: int, user_id: Optional[str] = None) -> str:
+    if priority == 3: base = HIGH_QUEUE
+    elif priority == 1: base = LOW_QUEUE
+    else: base = NORMAL_QUEUE
+    if settings.FAIR_SCHEDULING and user_id:
+        return f"{base}{TENANT_INFIX}{user_id}"
+    return base
+
+# Lua helper shared by every script that puts job ids on an immediate queue.
+# For a tenant sub-queue it also registers the tenant in the ring and bumps the
+# pending counter; every push leaves a wake-up signal for blocked workers and
+# is counted in the current minute's arrivals bucket.
+LUA_PUSH_JOB = f"""
+local function push_job(queue, id, to_front)
+    if to_front then redis.call('RPUSH', queue, id) else redis.call('LPUSH', queue, id) end
+    local base, tenant = string.match(queue, '^(.-){TENANT_INFIX}(.+)$')
+    if tenant then
+        redis.call('INCR', base .. ':pending')
+        if redis.call('SADD', base .. ':tenants:set', tenant) == 1 then
+            redis.call('RPUSH', base .. ':tenants', tenant)
+        end
+    end
+    redis.call('LPUSH', '{SIGNAL_KEY}', '1')
+    redis.call('LTRIM', '{SIGNAL_KEY}', 0, {SIGNAL_MAX - 1})
+    local arrivals = '{ARRIVALS_PREFIX}' .. math.floor(tonumber(redis.call('TIME')[1]) / 60)
+    redis.call('INCR', arrivals)
+    redis.call('EXPIRE', arrivals, {settings.SCALING_WINDOW + 120})
+end
+"""
@@ -1,28 +1,114 @@
-import redis.asyncio as redis
+import logging
+from typing import Optional
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # We support TWO modes:
 # 1. Standard Redis (TCP) - Recommended for heavy loads and blocking pops
 # 2. Upstash HTTP (REST) - Great for Serverless/Vercel where TCP is flaky
 
-if settings.UPSTASH_REDIS_REST_URL and settings.UPSTASH_REDIS_REST_TOKEN:
-    # Use Upstash HTTP Client (Serverless friendly)
-    from upstash_redis.asyncio import Redis as UpstashRedis
-    print("🚀 Using Upstash HTTP Redis (Serverless Mode)")
-    redis_client = UpstashRedis(
-        url=settings.UPSTASH_REDIS_REST_URL,
-        token=settings.UPSTASH_REDIS_REST_TOKEN
-    )
-else:
+def _build_client(blocking: bool, url: Optional[str] = None):
+    if url is None and not settings.REDIS_URL and settings.UPSTASH_REDIS_REST_URL and settings.UPSTASH_REDIS_REST_TOKEN:
+        # Use Upstash HTTP Client (Serverless friendly); imported only in this mode
+        from app.core.upstash import UpstashRedis
+        logger.info("Using Upstash HTTP Redis (Serverless Mode)")
+        return UpstashRedis(url=settings.UPSTASH_REDIS_REST_URL, token=settings.UPSTASH_REDIS_REST_TOKEN)
+
     # Use Standard TCP Redis
-    print("🔌 Using Standard TCP Redis")
-    redis_client = redis.Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=settings.REDIS_DB,
-        password=settings.REDIS_PASSWORD,
-        decode_responses=True
+    import redis.asyncio as redis
+    logger.info("Using Standard TCP Redis", extra={"pool": "blocking" if blocking else "commands", "shard": bool(url)})
+    url = url or settings.REDIS_URL
+    options = dict(
+        decode_responses=True,
+        max_connections=settings.REDIS_BLOCKING_MAX_CONNECTIONS if blocking else settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT, # Wait this long for a free connection, then fail
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        # BRPOP / XREAD BLOCK wait server-side, so only command connections get a read timeout
+        socket_timeout=None if blocking else settings.REDIS_SOCKET_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
     )
+    if url:
+        pool = redis.BlockingConnectionPool.from_url(url, **options)
+    else:
+        pool = redis.BlockingConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD,
+            **options,
+        )
+    return redis.Redis.from_pool(pool)
+
+class LazyRedis:
+    """A Redis client created on first use.
+
+    Importing the app opens no sockets and only loads the Redis (or Upstash)
+    library once something actually talks to Redis, which keeps serverless
+    cold starts short.
+    """
+
+    def __init__(self, blocking: bool = False, url: Optional[str] = None):
+        self._blocking = blocking
+        self._url = url # A queue shard (see app.core.shards); None for the main Redis
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _build_client(self._blocking, self._url)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await (getattr(client, "aclose", None) or client.close)()
+
+def pool_stats(client) -> Optional[dict]:
+    """Connection usage of a client's pool; None if it has none yet (or is HTTP based)."""
+    client = client._client if isinstance(client, LazyRedis) else client
+    pool = getattr(client, "connection_pool", None)
+    if pool is None or not hasattr(pool, "_in_use_connections"):
+        return None
+    in_use = len(pool._in_use_connections)
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": in_use,
+        "idle": len(pool._available_connections),
+        "saturation": round(in_use / pool.max_connections, 3),
+    }
+
+class LuaScript:
+    """A Lua script, registered on first use. `client` runs it on another
+    client or pipeline (e.g. a queue shard's) instead of the main Redis."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._script = None
+
+    def __call__(self, keys=(), args=(), client=None):
+        if self._script is None:
+            self._script = redis_client.register_script(self.source)  # Looked up on use: the bench harness swaps it
+        return self._script(keys=list(keys), args=list(args), client=client)
+
+async def check_scripting(client):
+    """Raise RuntimeError unless `client` runs Lua scripts in pipelines, which
+    the queues, locks and rate limits depend on (a server with EVAL disabled
+    can't). Connection errors propagate as they are."""
+    from redis.exceptions import ResponseError
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.eval("return 1", 0)
+        await pipe.execute()
+    except (AttributeError, TypeError, ResponseError) as e:
+        raise RuntimeError(f"Redis can't run pipelined Lua scripts: {e}") from e
+
+# Commands share one pool; blocking reads get their own so they can't starve it
+redis_client = LazyRedis()
+blocking_redis_client = LazyRedis(blocking=True)
 
 async def get_redis():
     return redis_client
@@ -0,0 +1,40 @@
+import json
+from datetime import date, datetime
+from typing import Any
+from fastapi.responses import JSONResponse
+
+# JSON for the hot paths: events, cached payloads, results and API responses.
+# orjson when installed (several times faster, and it handles datetimes and
+# enums natively); the stdlib otherwise, producing the same output.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value # Enums
+    return str(value) # ObjectId and friends
+
+if orjson is not None:
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps().
+
+    Routes that read trusted documents from MongoDB return one directly, which
+    also skips FastAPI's validation of the content against the response model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,138 @@
+import asyncio
+import bisect
+import hashlib
+import inspect
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from app.core import redis as core_redis
+from app.core.config import settings
+from app.core.redis import LazyRedis
+
+def _point(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+class ShardPipelines:
+    """One non-transactional pipeline per shard, executed together."""
+
+    def __init__(self, ring: "ShardRing"):
+        self.ring = ring
+        self.pipes = {}
+
+    def shard(self, index: int):
+        if index not in self.pipes:
+            self.pipes[index] = self.ring.client(index).pipeline(transaction=False)
+        return self.pipes[index]
+
+    def for_job(self, job_id: str):
+        return self.shard(self.ring.index(job_id))
+
+    async def execute(self) -> Dict[int, list]:
+        """Run every shard's pipeline concurrently; replies per shard index."""
+        indexes = list(self.pipes)
+        replies = await asyncio.gather(*(self.pipes[index].execute() for index in indexes))
+        return dict(zip(indexes, replies))
+
+class ShardRing:
+    """The Redis nodes the job queues are spread over.
+
+    Shard 0 is the main Redis (`redis_client`), which also keeps everything
+    that isn't tied to one job: events, rate limits, leader leases, the worker
+    registry, dependencies, results. REDIS_SHARD_URLS adds more nodes. Each job
+    id maps to one shard on a consistent-hash ring and all keys of that job live
+    there (queue entries, delayed and dead letter entries, reliable-queue
+    lease, `job:{id}` hash, lock, tombstone), so every Lua script still runs
+    against a single node. Adding a shard moves about 1/N of the ids.
+    """
+
+    def __init__(self):
+        self._names = None
+        self._clients = None
+        self._blocking = None
+        self._points = []
+        self._owners = []
+
+    def configure(self, names: Sequence[str], clients: Sequence[Any], blocking: Optional[Sequence[Any]] = None):
+        """Use these clients for shards 1.. instead of the ones built from settings (benchmarks, tests)."""
+        self._names = ["main", *names]
+        self._clients = list(clients)
+        self._blocking = list(blocking or clients)
+        points = sorted(
+            (_point(f"{name}#{vnode}"), index)
+            for index, name in enumerate(self._names) for vnode in range(settings.REDIS_SHARD_VNODES)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def _ensure(self):
+        if self._names is None:
+            urls = settings.REDIS_SHARD_URLS
+            self.configure(urls, [LazyRedis(url=url) for url in urls], [LazyRedis(blocking=True, url=url) for url in urls])
+
+    @property
+    def count(self) -> int:
+        self._ensure()
+        return len(self._names)
+
+    @property
+    def sharded(self) -> bool:
+        return self.count > 1
+
+    def client(self, index: int):
+        if index == 0:
+            return core_redis.redis_client # Looked up on use: the bench harness swaps it
+        self._ensure()
+        return self._clients[index - 1]
+
+    def blocking_client(self, index: int):
+        if index == 0:
+            return core_redis.blocking_redis_client
+        self._ensure()
+        return self._blocking[index - 1]
+
+    def index(self, job_id: str) -> int:
+        """The shard owning `job_id`: the first ring point at or after its hash."""
+        if not self.sharded:
+            return 0
+        at = bisect.bisect_left(self._points, _point(job_id))
+        return self._owners[at % len(self._points)]
+
+    def for_job(self, job_id: str):
+        return self.client(self.index(job_id))
+
+    def order(self, worker_id: str) -> List[int]:
+        """Shards in the order a worker polls them: its home shard, then the rest to steal from."""
+        home = self.index(worker_id)
+        return [(home + offset) % self.count for offset in range(self.count)]
+
+    def group(self, job_ids: Sequence[str]) -> Dict[int, List[str]]:
+        groups = {}
+        for job_id in job_ids:
+            groups.setdefault(self.index(job_id), []).append(job_id)
+        return groups
+
+    def pipelines(self) -> ShardPipelines:
+        return ShardPipelines(self)
+
+    async def each(self, items: Sequence, command: Callable, key: Callable[[Any], str] = lambda item: item) -> list:
+        """Queue `command(pipe, item)` (one command each) on the pipeline of the
+        shard owning `key(item)`, run the shards concurrently and return the
+        replies in the order of `items`."""
+        positions = {}
+        pipes = self.pipelines()
+        for position, item in enumerate(items):
+            index = self.index(key(item))
+            positions.setdefault(index, []).append(position)
+            queued = command(pipes.shard(index), item)
+            if inspect.isawaitable(queued):
+                await queued # Scripts queue themselves asynchronously
+        replies = [None] * len(items)
+        for index, shard_replies in (await pipes.execute()).items():
+            for position, reply in zip(positions[index], shard_replies):
+                replies[position] = reply
+        return replies
+
+    async def close(self):
+        for client in (self._clients or []) + (self._blocking or []):
+            if isinstance(client, LazyRedis):
+                await client.close()
+
+shards = ShardRing()
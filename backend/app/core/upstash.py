@@ -0,0 +1,110 @@
+from redis.asyncio.client import EMPTY_RESPONSE, NEVER_DECODE
+from redis.commands import AsyncCoreCommands
+from redis.exceptions import ResponseError
+
+# Upstash over HTTP (REST), for serverless deployments where TCP connections
+# don't outlive a request. redis-py's command mixins build the commands and
+# parse the replies, so the services (Lua scripts, pipelines, streams) run
+# unchanged; only the transport differs. Blocking reads and Pub/Sub need a
+# connection and aren't available, so workers keep using TCP.
+
+def _command(args) -> list:
+    name, *rest = args
+    # Lower case skips the SDK's own reply casts (keyed by the upper-case
+    # name), so replies stay in the shape redis-py's callbacks expect
+    command = [str(name).lower()]
+    for arg in rest:
+        if isinstance(arg, bytes):
+            arg = arg.decode()
+        elif isinstance(arg, float):
+            arg = repr(arg)
+        command.append(str(arg))
+    return command
+
+class _Replies:
+    """Applies redis-py's reply callbacks to raw REST results."""
+
+    def __init__(self):
+        import redis.asyncio as redis
+        # REST replies have the RESP2 shapes (flat arrays for hashes); building the client connects nothing
+        self.callbacks = redis.Redis(decode_responses=True, protocol=2).response_callbacks
+
+    def parse(self, name, response, options: dict):
+        options = {key: value for key, value in options.items() if key not in ("keys", NEVER_DECODE, EMPTY_RESPONSE)}
+        if name in self.callbacks:
+            return self.callbacks[name](response, **options)
+        return response
+
+class _RestScript:
+    """register_script() over REST: EVAL with the source, so there is no
+    NOSCRIPT round trip and it runs inside pipelines as well."""
+
+    def __init__(self, client: "UpstashRedis", source: str):
+        self.client = client
+        self.source = source
+
+    async def __call__(self, keys=(), args=(), client=None):
+        client = client or self.client
+        return await client.eval(self.source, len(keys), *keys, *args)
+
+class UpstashPipeline(AsyncCoreCommands):
+    def __init__(self, client: "UpstashRedis", transaction: bool):
+        self.client = client
+        self.transaction = transaction
+        self.commands = []
+
+    def execute_command(self, *args, **options):
+        self.commands.append((args, options))
+        return self
+
+    def __await__(self):
+        # Queued script calls are awaited like redis-py's pipeline
+        return self._self().__await__()
+
+    async def _self(self):
+        return self
+
+    def __len__(self):
+        return len(self.commands)
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        from upstash_redis.errors import UpstashError
+        commands, self.commands = self.commands, []
+        if not commands:
+            return []
+        pipe = self.client.rest.multi() if self.transaction else self.client.rest.pipeline()
+        for args, _ in commands:
+            pipe.execute(_command(args))
+        try:
+            responses = await pipe.exec()
+        except UpstashError as e:
+            raise ResponseError(str(e)) from e
+        return [
+            self.client.replies.parse(args[0], response, options)
+            for (args, options), response in zip(commands, responses)
+        ]
+
+class UpstashRedis(AsyncCoreCommands):
+    """The Upstash REST API behind redis-py's async command interface."""
+
+    def __init__(self, url: str, token: str):
+        from upstash_redis.asyncio import Redis
+        self.rest = Redis(url=url, token=token)
+        self.replies = _Replies()
+
+    async def execute_command(self, *args, **options):
+        from upstash_redis.errors import UpstashError
+        try:
+            response = await self.rest.execute(_command(args))
+        except UpstashError as e:
+            raise ResponseError(str(e)) from e
+        return self.replies.parse(args[0], response, options)
+
+    def pipeline(self, transaction: bool = True) -> UpstashPipeline:
+        return UpstashPipeline(self, transaction)
+
+    def register_script(self, source: str) -> _RestScript:
+        return _RestScript(self, source)
+
+    async def aclose(self):
+        await self.rest.close()
@@ -1,27 +1,76 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
-from app.core.database import db
-from app.core.redis import redis_client
-from contextlib import asynccontextmanager
+import time
+IMPORT_STARTED = time.perf_counter() # Before the heavy imports below, to measure cold starts
+
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+from contextlib import asynccontextmanager  # noqa: E402
+from fastapi import FastAPI, Response  # noqa: E402
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from app.api.routes import router  # noqa: E402
+from app.core.database import db  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.redis import blocking_redis_client, check_scripting, pool_stats, redis_client  # noqa: E402
+from app.core.shards import shards  # noqa: E402
+from app.core.logging import configure_logging  # noqa: E402
+from app.core.metrics import APP_STARTUP_SECONDS  # noqa: E402
+from app.core.serialization import FastJSONResponse  # noqa: E402
+from app.services.dead_letter import dead_letter_queue  # noqa: E402
+from app.services.events import event_broadcaster  # noqa: E402
+from app.services.queue_service import queue_service  # noqa: E402
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+startup_timings = {} # phase -> seconds, reported by /health
+
+def record_startup(phase: str, seconds: float):
+    startup_timings[phase] = round(seconds, 4)
+    APP_STARTUP_SECONDS.labels(component="api", phase=phase).set(seconds)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    started = time.perf_counter()
     db.connect()
+    if settings.MONGO_ENSURE_INDEXES:
+        phase_started = time.perf_counter()
+        try:
+            await db.ensure_indexes()
+        except Exception as e:
+            logger.error("Index creation failed: %s", e)
+        record_startup("indexes", time.perf_counter() - phase_started)
+    phase_started = time.perf_counter()
     try:
-        await redis_client.ping()
-        print("Connected to Redis")
+        # Also proves the scripts the queues depend on can run, on every shard
+        await asyncio.gather(*(check_scripting(shards.client(index)) for index in range(shards.count)))
+        logger.info("Connected to Redis")
+        # The API may be upgraded before any worker converts a legacy dead letter list
+        migrated = await dead_letter_queue.migrate()
+        if migrated:
+            logger.info("Converted the dead letter list to a sorted set (%d entries)", migrated)
+    except RuntimeError:
+        logger.critical("Redis can't run the job scheduler", exc_info=True)
+        raise
     except Exception as e:
-        print(f"Redis connection failed: {e}")
+        logger.error("Redis connection failed: %s", e)
+    record_startup("redis_connect", time.perf_counter() - phase_started)
+    
+    # One shared event stream reader fans out to all WebSocket clients
+    event_broadcaster.start()
+    record_startup("startup", time.perf_counter() - started)
+    logger.info("API started", extra={"startup_timings": startup_timings})
     
     yield
     
     # Shutdown
+    await event_broadcaster.stop()
     db.close()
     await redis_client.close()
+    await blocking_redis_client.close()
+    await shards.close()
 
-app = FastAPI(title="Redis Job Scheduler", lifespan=lifespan)
+app = FastAPI(title="Redis Job Scheduler", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +78,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-RateLimit-Limit", "X-RateLimit-Remaining", "Retry-After"],
 )
 
 app.include_router(router, prefix="/api")
@@ -36,3 +86,49 @@ app.include_router(router, prefix="/api")
 @app.get("/")
 def read_root():
     return {"status": "ok", "service": "Job Scheduler API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    try:
+        await queue_service.queue_depths() # Refresh queue-depth gauges
+    except Exception as e:
+        logger.warning("Queue depth collection failed: %s", e)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+async def _probe(check) -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), settings.HEALTH_CHECK_TIMEOUT)
+    except Exception as e:
+        return {"ok": False, "error": str(e) or type(e).__name__}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+@app.get("/health")
+async def health(response: Response):
+    """Dependency reachability, connection pool usage and startup timings."""
+    # A scripted round trip rather than PING: without Lua no request would work
+    redis_report = await _probe(lambda: check_scripting(redis_client))
+    redis_report["pools"] = {"commands": pool_stats(redis_client), "blocking": pool_stats(blocking_redis_client)}
+    if shards.sharded:
+        # Queue shards 1.. (shard 0 is the main Redis above)
+        reports = await asyncio.gather(*(
+            _probe(lambda index=index: check_scripting(shards.client(index))) for index in range(1, shards.count)
+        ))
+        for index, report in enumerate(reports, start=1):
+            report["pool"] = pool_stats(shards.client(index))
+        redis_report["shards"] = reports
+        redis_report["ok"] = redis_report["ok"] and all(report["ok"] for report in reports)
+    mongo_report = await _probe(lambda: db.client.admin.command("ping"))
+    mongo_report["pool"] = db.pool_stats.snapshot()
+
+    shard_pools = [report["pool"] for report in redis_report.get("shards", [])]
+    pools = [p for p in (*redis_report["pools"].values(), *shard_pools, mongo_report["pool"]) if p]
+    status = "ok"
+    if any(p["saturation"] >= settings.HEALTH_POOL_SATURATION_WARN for p in pools):
+        status = "degraded"
+    if not (redis_report["ok"] and mongo_report["ok"]):
+        status = "down"
+        response.status_code = 503
+    return {"status": status, "redis": redis_report, "mongo": mongo_report, "startup": startup_timings}
+
+record_startup("import", time.perf_counter() - IMPORT_STARTED)
@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+
+class DeadLetterFilter(BaseModel):
+    type: Optional[str] = None
+    user_id: Optional[str] = None
+    error_signature: Optional[str] = None
+    failed_after: Optional[datetime] = None
+    failed_before: Optional[datetime] = None
+
+class DeadLetterRequeue(DeadLetterFilter):
+    rate: Optional[float] = Field(None, gt=0)  # Jobs per second (default DLQ_REQUEUE_RATE)
+    limit: Optional[int] = Field(None, gt=0)  # Requeue at most this many
+
+class DeadLetterPurge(DeadLetterFilter):
+    limit: Optional[int] = Field(None, gt=0)
+
+class DeadLetterGroup(BaseModel):
+    type: Optional[str] = None
+    error_signature: str
+    count: int
+    sample_error: Optional[str] = None
+    sample_job_id: Optional[str] = None
+    last_failed_at: Optional[datetime] = None
+
+class DeadLetterOperation(BaseModel):
+    operation_id: str
+    kind: str  # requeue | purge
+    status: str  # running | done | failed
+    total: int  # Matching jobs when the operation started
+    processed: int = 0
+    error: Optional[str] = None
+    filters: DeadLetterFilter = Field(default_factory=DeadLetterFilter)
+    rate: Optional[float] = None  # Jobs per second (requeue)
+    last_id: Optional[str] = None  # Last job done; a worker taking over resumes after it
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from pydantic import AliasChoices, BaseModel, Field, model_validator
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
 from bson import ObjectId
@@ -16,6 +16,8 @@ class JobStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     DELAYED = "delayed"
+    CANCELLED = "cancelled"
+    WAITING = "waiting" # Blocked on depends_on
 
 class JobPriority(int, Enum):
     LOW = 1
@@ -28,14 +30,73 @@ class JobCreate(BaseModel):
     priority: JobPriority = JobPriority.NORMAL
     scheduled_at: Optional[datetime] = None
     user_id: str
+    depends_on: List[str] = Field(default_factory=list) # Job ids that must complete first
+    # Resubmissions with the same key (per user) return the job already created for it
+    idempotency_key: Optional[str] = Field(
+        default=None, min_length=1, max_length=255, validation_alias=AliasChoices("idempotency_key", "dedup_key")
+    )
+    debounce: Optional[float] = Field(default=None, gt=0) # Seconds; repeats within it coalesce into one run
+    timeout: Optional[float] = Field(default=None, gt=0) # Seconds the handler may run (default: the handler's)
+    # Seconds the job lock outlives a worker that stopped renewing it (default JOB_LOCK_TTL)
+    lease: Optional[int] = Field(default=None, ge=30)
+
+    @model_validator(mode="after")
+    def check_dependencies(self):
+        if self.depends_on and self.scheduled_at:
+            raise ValueError("scheduled_at can't be combined with depends_on")
+        if self.debounce and not self.idempotency_key:
+            raise ValueError("debounce requires an idempotency_key")
+        if self.debounce and (self.scheduled_at or self.depends_on):
+            raise ValueError("debounce can't be combined with scheduled_at or depends_on")
+        return self
+
+class JobBatchCreate(BaseModel):
+    jobs: List[JobCreate] = Field(min_length=1)
+
+class WorkflowJob(JobCreate):
+    key: str # Name of this job within the workflow
+    after: List[str] = Field(default_factory=list) # Keys of workflow jobs that must complete first
+
+    @model_validator(mode="after")
+    def check_debounce(self):
+        if self.debounce:
+            raise ValueError("debounce isn't supported in workflows")
+        return self
+
+class WorkflowCreate(BaseModel):
+    jobs: List[WorkflowJob] = Field(min_length=1)
+
+class WorkflowResult(BaseModel):
+    workflow_id: str
+    jobs: Dict[str, str] # key -> job id
+
+class WorkflowStatus(BaseModel):
+    workflow_id: str
+    total: int
+    counts: Dict[str, int] # status -> jobs
+
+class JobBatchItemResult(BaseModel):
+    index: int
+    job_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+class JobBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[JobBatchItemResult]
 
 class Job(BaseModel):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     status: JobStatus = JobStatus.QUEUED
     type: str
-    payload: Dict[str, Any]
+    payload: Optional[Dict[str, Any]] = None # None while stored out of line (see payload_ref)
+    payload_ref: Optional[Dict[str, Any]] = None # Where a large payload is stored (see PayloadStore)
     result: Optional[Dict[str, Any]] = None
+    result_ref: Optional[Dict[str, Any]] = None # Where the result is stored (see ResultStore)
     error: Optional[str] = None
+    error_signature: Optional[str] = None # Set when dead-lettered (see DeadLetterQueue)
+    failed_at: Optional[datetime] = None
     priority: JobPriority
     created_at: datetime = Field(default_factory=datetime.utcnow)
     scheduled_at: Optional[datetime] = None
@@ -44,8 +105,28 @@ class Job(BaseModel):
     retry_count: int = 0
     max_retries: int = 3
     user_id: str
+    schedule_id: Optional[str] = None # Set on runs of a recurring schedule
+    depends_on: List[str] = Field(default_factory=list)
+    workflow_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    debounce: Optional[float] = None
+    timeout: Optional[float] = None
+    lease: Optional[int] = None
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
+
+class JobResult(BaseModel):
+    job_id: str
+    status: Optional[JobStatus] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+class JobListItem(Job):
+    # List views may project any of these away
+    type: Optional[str] = None
+    payload: Optional[Dict[str, Any]] = None
+    priority: Optional[JobPriority] = None
+    user_id: Optional[str] = None
@@ -0,0 +1,53 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from enum import Enum
+
+from app.models.job import JobPriority, PyObjectId
+
+class MisfirePolicy(str, Enum):
+    FIRE_ALL = "fire_all"    # Catch up every missed run
+    FIRE_ONCE = "fire_once"  # Collapse missed runs into a single run now
+    SKIP = "skip"            # Drop missed runs, resume at the next fire time
+
+class ScheduleCreate(BaseModel):
+    type: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    priority: JobPriority = JobPriority.NORMAL
+    user_id: str
+    cron: Optional[str] = None  # 5-field cron expression, evaluated in UTC
+    interval: Optional[float] = Field(None, gt=0)  # Seconds between runs
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
+    jitter: float = Field(0, ge=0)  # Up to this many seconds added to each run
+    misfire_policy: MisfirePolicy = MisfirePolicy.FIRE_ONCE
+    misfire_grace: float = Field(60, ge=0)  # Seconds late a run may be and still count as on time
+    enabled: bool = True
+
+    @field_validator("start_at", "end_at")
+    @classmethod
+    def naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Fire times are computed and stored as naive UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode="after")
+    def check_trigger(self):
+        if (self.cron is None) == (self.interval is None):
+            raise ValueError("Exactly one of cron or interval is required")
+        if self.cron is not None:
+            from croniter import croniter # Loaded on first use, not at import
+            if not croniter.is_valid(self.cron):
+                raise ValueError(f"Invalid cron expression: {self.cron}")
+        return self
+
+class Schedule(ScheduleCreate):
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    next_run_at: Optional[datetime] = None  # Next fire time not yet materialized into queue:delayed
+    last_fired_at: Optional[datetime] = None
+    fired_count: int = 0
+
+    class Config:
+        populate_by_name = True
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+class TimeseriesPoint(BaseModel):
+    ts: datetime  # Start of the step (UTC)
+    completed: int = 0
+    failed: int = 0  # Failed attempts, retried ones included
+    cancelled: int = 0
+    throughput: float = 0.0  # Completed jobs/second
+    failure_rate: float = 0.0  # failed / all attempts that finished
+    mean_ms: Optional[float] = None  # Execution time; None without attempts
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+
+class Timeseries(BaseModel):
+    dimension: str  # all | type:{type} | user:{user_id}
+    source: str  # redis (minute buckets) | rollup (hourly documents in MongoDB)
+    step: int  # Seconds per point
+    start: datetime
+    end: datetime
+    points: List[TimeseriesPoint] = Field(default_factory=list)
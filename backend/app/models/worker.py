@@ -0,0 +1,35 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, List
+from datetime import datetime
+
+class WorkerInfo(BaseModel):
+    worker_id: str
+    host: str
+    pid: int
+    started_at: datetime
+    last_seen: datetime
+    concurrency: int
+    prefetch: int = 1
+    in_flight: int = 0
+    processed: int = 0  # Handlers run since the worker started
+    failed: int = 0
+    throughput: float = 0.0  # Jobs/second over the last heartbeat interval
+    job_ids: List[str] = Field(default_factory=list)  # Current jobs (capped at WORKER_HEARTBEAT_MAX_JOB_IDS)
+
+class TypeExecution(BaseModel):
+    count: int
+    mean_seconds: float
+    rate: float  # Completions/second over the window
+
+class ScalingRecommendation(BaseModel):
+    window_seconds: float
+    workers: int  # Live workers (heartbeat within WORKER_HEARTBEAT_TTL)
+    slots: int  # Sum of their concurrency
+    in_flight: int
+    utilization: float  # in_flight / slots
+    backlog: int  # Jobs waiting in the immediate queues
+    arrival_rate: float  # Jobs/second pushed onto the queues
+    completion_rate: float  # Jobs/second run by workers
+    mean_execution_seconds: Optional[float] = None  # None until a job ran in the window
+    execution: Dict[str, TypeExecution] = Field(default_factory=dict)
+    recommended_workers: int
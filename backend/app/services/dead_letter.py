@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from typing import List, Optional
+from bson import ObjectId
+from app.core.config import settings
+from app.core.database import db
+from app.core.leader import run_as_leader
+from app.core.queues import DEAD_LETTER_QUEUE, queue_for_priority
+from app.core.redis import LuaScript, redis_client
+from app.core.shards import shards
+from app.models.dead_letter import DeadLetterFilter, DeadLetterOperation
+from app.models.job import JobStatus
+from app.services.events import event_bus
+from app.services.fair_queue import fair_queue
+from app.services.job_store import job_store
+from app.services.payload_store import payload_store
+from app.services.result_store import result_store
+
+logger = logging.getLogger(__name__)
+
+OPERATION_PREFIX = "dlq:op:"
+OPERATIONS_KEY = "dlq:ops"  # SET of the ids of unfinished bulk operations
+
+# The dead letter queue used to be a List; turn one into the sorted set
+# (score = time it was dead-lettered) in place. No-op once converted.
+MIGRATE_LUA = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'list' then
+    return 0
+end
+local ids = redis.call('LRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1])
+for i = 1, #ids, 1000 do
+    local args = {}
+    for j = i, math.min(i + 999, #ids) do
+        table.insert(args, ARGV[1])
+        table.insert(args, ids[j])
+    end
+    redis.call('ZADD', KEYS[1], unpack(args))
+end
+return #ids
+"""
+
+_ID_PATTERN = re.compile(r"\b[0-9a-f]{24}\b|\b[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}\b|0x[0-9a-fA-F]+")
+_QUOTED_PATTERN = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+def error_signature(error: Optional[str]) -> str:
+    """Errors that differ only in ids, numbers or quoted values share a signature."""
+    if not error:
+        return "unknown"
+    lines = error.strip().splitlines()
+    signature = lines[0] if lines else error
+    signature = _ID_PATTERN.sub("<id>", signature)
+    signature = _QUOTED_PATTERN.sub("<str>", signature)
+    return _NUMBER_PATTERN.sub("<n>", signature)[:200]
+
+def dead_letter_query(filters: DeadLetterFilter) -> dict:
+    # status + _id matches the status_id index used to walk the DLQ in order
+    query = {"status": JobStatus.FAILED}
+    if filters.type:
+        query["type"] = filters.type
+    if filters.user_id:
+        query["user_id"] = filters.user_id
+    if filters.error_signature:
+        query["error_signature"] = filters.error_signature
+    if filters.failed_after or filters.failed_before:
+        query["failed_at"] = {}
+        if filters.failed_after:
+            query["failed_at"]["$gte"] = filters.failed_after
+        if filters.failed_before:
+            query["failed_at"]["$lt"] = filters.failed_before
+    return query
+
+class DeadLetterQueue:
+    """Jobs that failed for good: MongoDB holds the details (status `failed`,
+    `error`, `error_signature`, `failed_at`), `queue:dead_letter` (ZSET, one
+    per queue shard) the ids.
+
+    Bulk requeue and purge are recorded by the API and run by the elected
+    worker, DLQ_CHUNK_SIZE jobs at a time: one find, one update_many/
+    delete_many and one Redis pipeline per chunk. Progress, including the
+    last job id, is saved after every chunk, so a worker taking over the lease
+    resumes where the previous one stopped. Requeues are paced to a rate so
+    workers aren't flooded.
+    """
+
+    def __init__(self):
+        self._migrate = LuaScript(MIGRATE_LUA)
+
+    async def migrate(self) -> int:
+        now = datetime.utcnow().timestamp()
+        return sum(await asyncio.gather(*(
+            self._migrate(keys=[DEAD_LETTER_QUEUE], args=[now], client=shards.client(index)) for index in range(shards.count)
+        )))
+
+    async def add(self, job_id: str):
+        await shards.for_job(job_id).zadd(DEAD_LETTER_QUEUE, {job_id: datetime.utcnow().timestamp()})
+
+    async def groups(self, filters: DeadLetterFilter, limit: int) -> List[dict]:
+        """Failed jobs counted per (type, error signature), largest groups first."""
+        pipeline = [
+            {"$match": dead_letter_query(filters)},
+            {"$group": {
+                # Jobs failed by a dependency (or before signatures existed) group by their raw error
+                "_id": {"type": "$type", "signature": {"$ifNull": ["$error_signature", "$error"]}},
+                "count": {"$sum": 1},
+                "sample_error": {"$first": "$error"},
+                "sample_job_id": {"$first": "$_id"},
+                "last_failed_at": {"$max": "$failed_at"},
+            }},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ]
+        groups = []
+        async for row in db.db["jobs"].aggregate(pipeline):
+            groups.append({
+                "type": row["_id"].get("type"),
+                "error_signature": row["_id"].get("signature") or "unknown",
+                "count": row["count"],
+                "sample_error": row.get("sample_error"),
+                "sample_job_id": str(row["sample_job_id"]) if row.get("sample_job_id") else None,
+                "last_failed_at": row.get("last_failed_at"),
+            })
+        return groups
+
+    async def start(self, kind: str, filters: DeadLetterFilter, limit: Optional[int] = None,
+                    rate: Optional[float] = None) -> DeadLetterOperation:
+        """Record a bulk requeue or purge of the jobs matching `filters` for the workers to run."""
+        filters = DeadLetterFilter(**filters.model_dump(include=set(DeadLetterFilter.model_fields)))
+        total = await db.db["jobs"].count_documents(dead_letter_query(filters))
+        if limit:
+            total = min(total, limit)
+        if kind == "requeue":
+            rate = rate or settings.DLQ_REQUEUE_RATE
+        operation = DeadLetterOperation(
+            operation_id=str(ObjectId()), kind=kind, status="running", total=total, filters=filters, rate=rate
+        )
+        await self._save(operation)
+        await redis_client.sadd(OPERATIONS_KEY, operation.operation_id)
+        return operation
+
+    async def operation(self, operation_id: str) -> Optional[DeadLetterOperation]:
+        data = await redis_client.get(f"{OPERATION_PREFIX}{operation_id}")
+        return DeadLetterOperation(**json.loads(data)) if data else None
+
+    async def _save(self, operation: DeadLetterOperation):
+        await redis_client.set(
+            f"{OPERATION_PREFIX}{operation.operation_id}", operation.model_dump_json(), ex=settings.DLQ_OPERATION_TTL
+        )
+
+    async def run(self, owner: str):
+        """Run the recorded bulk operations for as long as this process holds the DLQ lease."""
+        await run_as_leader("dlq", owner, settings.DLQ_LEASE_TTL, settings.DLQ_INTERVAL, self._operations_step)
+
+    async def _operations_step(self):
+        # Hand back within half the lease, so it is renewed before it can run out
+        deadline = time.monotonic() + settings.DLQ_LEASE_TTL / 2
+        for operation_id in sorted(await redis_client.smembers(OPERATIONS_KEY)):
+            operation = await self.operation(operation_id)
+            if operation is None or operation.status != "running":
+                await redis_client.srem(OPERATIONS_KEY, operation_id)
+                continue
+            await self._advance(operation, deadline)
+            if time.monotonic() >= deadline:
+                return
+
+    async def _advance(self, operation: DeadLetterOperation, deadline: float):
+        """Run `operation` from its last_id until it is finished or `deadline` passes."""
+        step = self.requeue_chunk if operation.kind == "requeue" else self.purge_chunk
+        query = dead_letter_query(operation.filters)
+        try:
+            # Walk by _id: jobs failing while this runs are newer and beyond `total` anyway
+            while operation.processed < operation.total:
+                size = min(settings.DLQ_CHUNK_SIZE, operation.total - operation.processed)
+                chunk_query = dict(query, _id={"$gt": ObjectId(operation.last_id)}) if operation.last_id else query
+                docs = await db.db["jobs"].find(chunk_query, {"priority": 1, "user_id": 1, "payload_ref": 1}).sort(
+                    "_id", 1
+                ).limit(size).to_list(length=size)
+                if not docs:
+                    break
+                started = time.perf_counter()
+                await step(docs)
+                operation.processed += len(docs)
+                operation.last_id = str(docs[-1]["_id"])
+                await self._save(operation)
+                if operation.rate:
+                    await asyncio.sleep(max(0.0, len(docs) / operation.rate - (time.perf_counter() - started)))
+                if time.monotonic() >= deadline:
+                    return
+            operation.status = "done"
+        except Exception as e:
+            logger.exception("Dead letter %s failed", operation.kind, extra={"operation_id": operation.operation_id})
+            operation.status = "failed"
+            operation.error = str(e)
+        await self._save(operation)
+        await redis_client.srem(OPERATIONS_KEY, operation.operation_id)
+        logger.info(
+            "Dead letter %s %s: %d job(s)", operation.kind, operation.status, operation.processed,
+            extra={"operation_id": operation.operation_id},
+        )
+
+    async def requeue_chunk(self, docs: List[dict]):
+        ids = [doc["_id"] for doc in docs]
+        now = datetime.utcnow()
+        # A job can be retried on its own (or purged) while the operation runs; the
+        # token marks the ones this call flipped, so only those get pushed
+        token = ObjectId()
+        fields = {"status": JobStatus.QUEUED, "retry_count": 0, "error": None, "created_at": now}
+        await db.db["jobs"].update_many(
+            {"_id": {"$in": ids}, "status": JobStatus.FAILED},
+            {"$set": {
+                **fields, "scheduled_at": None, "result_ref": None, "error_signature": None, "failed_at": None,
+                "requeue_token": token,
+            }},
+        )
+        flipped = {doc["_id"] async for doc in db.db["jobs"].find({"_id": {"$in": ids}, "requeue_token": token}, {"_id": 1})}
+        docs = [doc for doc in docs if doc["_id"] in flipped]
+        if not docs:
+            return
+        job_ids = [str(doc["_id"]) for doc in docs]
+
+        # Same cleanup as QueueService.retry_job: drop the old result and any cancel tombstone
+        await result_store.forget(*job_ids)
+        pipes = shards.pipelines()
+        # The claim at pop time skips failed jobs, so the cached status has to change before the push
+        await job_store.patch_many(pipes, job_ids, fields)
+        for index, shard_ids in shards.group(job_ids).items():
+            pipes.shard(index).zrem(DEAD_LETTER_QUEUE, *shard_ids)
+            pipes.shard(index).delete(*[job_store.tombstone_key(job_id) for job_id in shard_ids])
+        queues = {}
+        for doc in docs:
+            queues.setdefault(queue_for_priority(doc.get("priority", 2), doc.get("user_id")), []).append(str(doc["_id"]))
+        for queue, queued_ids in queues.items():
+            await fair_queue.push(queue, queued_ids, pipes=pipes)
+        await pipes.execute()
+
+        await event_bus.publish({
+            "job_id": job_ids[0], "job_ids": job_ids, "count": len(job_ids), "status": "queued",
+            "msg": f"{len(job_ids)} dead-lettered job(s) requeued",
+        })
+
+    async def purge_chunk(self, docs: List[dict]):
+        ids = [doc["_id"] for doc in docs]
+        await db.db["jobs"].delete_many({"_id": {"$in": ids}, "status": JobStatus.FAILED})
+        # Jobs requeued in the meantime weren't deleted; leave their payload and cache alone
+        kept = {doc["_id"] async for doc in db.db["jobs"].find({"_id": {"$in": ids}}, {"_id": 1})}
+        docs = [doc for doc in docs if doc["_id"] not in kept]
+        if not docs:
+            return
+        job_ids = [str(doc["_id"]) for doc in docs]
+        await payload_store.delete([doc.get("payload_ref") for doc in docs])
+        pipes = shards.pipelines()
+        for index, shard_ids in shards.group(job_ids).items():
+            pipes.shard(index).zrem(DEAD_LETTER_QUEUE, *shard_ids)
+            pipes.shard(index).delete(*[job_store.key(job_id) for job_id in shard_ids])
+        await pipes.execute()
+
+dead_letter_queue = DeadLetterQueue()
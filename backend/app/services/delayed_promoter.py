@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from datetime import datetime
+from app.core.config import settings
+from app.core.leader import run_as_leader
+from app.core.queues import LUA_PUSH_JOB, NORMAL_QUEUE
+from app.core.redis import LuaScript
+from app.core.shards import shards
+
+logger = logging.getLogger(__name__)
+
+DELAYED_KEY = "queue:delayed"
+DELAYED_TARGET_KEY = "queue:delayed:target" # HASH job_id -> immediate queue to promote into
+
+# Moves up to ARGV[2] members with score <= ARGV[1] into their target queue.
+# The target comes from the side hash, so promotion never needs MongoDB.
+PROMOTE_LUA = LUA_PUSH_JOB + """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, id in ipairs(ids) do
+    local queue = redis.call('HGET', KEYS[2], id) or ARGV[3]
+    push_job(queue, id, false)
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('HDEL', KEYS[2], id)
+end
+return #ids
+"""
+
+class DelayedPromoter:
+    """Moves due delayed jobs onto their queues. Every queue shard has its own
+    `queue:delayed`; the elected promoter drains them all concurrently."""
+
+    def __init__(self):
+        self._promote = LuaScript(PROMOTE_LUA)
+
+    async def promote_due(self, limit: int, shard: int = 0) -> int:
+        # Scores are written as naive-UTC timestamps by the enqueue path, so compare the same way
+        now = datetime.utcnow().timestamp()
+        return await self._promote(
+            keys=[DELAYED_KEY, DELAYED_TARGET_KEY], args=[now, limit, NORMAL_QUEUE], client=shards.client(shard)
+        )
+
+    async def _promote_shard(self, limit: int, shard: int) -> int:
+        # Bounded batches; keep going while full batches come back
+        total = 0
+        while True:
+            moved = await self.promote_due(limit, shard)
+            total += moved
+            if moved < limit:
+                return total
+
+    async def promote_all_due(self, limit: int) -> int:
+        return sum(await asyncio.gather(*(self._promote_shard(limit, shard) for shard in range(shards.count))))
+
+    async def run(self, owner: str):
+        """Promote due jobs for as long as this process holds the promoter lease."""
+        await run_as_leader("promoter", owner, settings.PROMOTER_LEASE_TTL, settings.PROMOTER_INTERVAL, self._promote_step)
+
+    async def _promote_step(self):
+        moved = await self.promote_all_due(settings.PROMOTER_BATCH_SIZE)
+        if moved:
+            logger.info("Promoted %d delayed job(s)", moved, extra={"promoted": moved})
+
+delayed_promoter = DelayedPromoter()
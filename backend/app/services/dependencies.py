@@ -0,0 +1,242 @@
+from typing import List, Tuple
+from bson import ObjectId
+from app.core.config import settings
+from app.core.database import db
+from app.core.queues import LUA_PUSH_JOB
+from app.core.redis import LuaScript, redis_client
+from app.core.shards import shards
+from app.models.job import JobStatus
+from app.services.fair_queue import fair_queue
+from app.services.job_store import JOB_KEY_PREFIX, job_store
+
+# Keys (see ARCHITECTURE.md)
+PENDING_KEY = "deps:pending"          # HASH child -> unfinished parents
+TARGET_KEY = "deps:target"            # HASH child -> queue to push it onto once ready
+CHILDREN_PREFIX = "deps:children:"    # SET per parent
+DONE_PREFIX = "deps:done:"            # String per finished parent: "ok" | "failed"
+
+# Registers ARGV[1] (to be pushed onto ARGV[2]) as waiting on parents ARGV[3...].
+# Parents already marked done are skipped, so a parent finishing concurrently is
+# never missed. Returns the number of parents still pending, or -1 if one failed.
+REGISTER_LUA = """
+local child, queue = ARGV[1], ARGV[2]
+local pending = 0
+for i = 3, #ARGV do
+    local done = redis.call('GET', KEYS[3] .. ARGV[i])
+    if done == 'failed' then
+        return -1
+    end
+    if not done and redis.call('SADD', KEYS[4] .. ARGV[i], child) == 1 then
+        pending = pending + 1
+    end
+end
+if pending > 0 then
+    redis.call('HSET', KEYS[1], child, pending)
+    redis.call('HSET', KEYS[2], child, queue)
+end
+return pending
+"""
+
+# Marks parent ARGV[1] done and takes up to ARGV[2] of its children. Children
+# with no pending parents left are pushed onto their queue, unless ARGV[4] is
+# '0' (queue shards: the caller pushes them on their own shard). Returns the
+# ready ids, how many children are still to go and the ready ids' queues.
+RELEASE_LUA = LUA_PUSH_JOB + """
+local parent, push = ARGV[1], ARGV[4] == '1'
+local children_key = KEYS[4] .. parent
+redis.call('SET', KEYS[3] .. parent, 'ok', 'EX', tonumber(ARGV[3]))
+local ready, queues = {}, {}
+for _, child in ipairs(redis.call('SPOP', children_key, tonumber(ARGV[2]))) do
+    if redis.call('HINCRBY', KEYS[1], child, -1) <= 0 then
+        local queue = redis.call('HGET', KEYS[2], child)
+        redis.call('HDEL', KEYS[1], child)
+        redis.call('HDEL', KEYS[2], child)
+        if queue then
+            if push then
+                if redis.call('EXISTS', KEYS[5] .. child) == 1 then
+                    redis.call('HSET', KEYS[5] .. child, 'status', 'queued')
+                end
+                push_job(queue, child, false)
+            end
+            table.insert(ready, child)
+            table.insert(queues, queue)
+        end
+    end
+end
+return {ready, redis.call('SCARD', children_key), queues}
+"""
+
+# Marks parent ARGV[1] failed and detaches up to ARGV[2] of its children, which
+# will never become ready, marking their cached status failed with error ARGV[4]
+# (unless ARGV[5] is '0', see RELEASE_LUA). Returns the detached ids and how
+# many are left.
+FAIL_LUA = """
+local parent = ARGV[1]
+local children_key = KEYS[4] .. parent
+redis.call('SET', KEYS[3] .. parent, 'failed', 'EX', tonumber(ARGV[3]))
+local children = redis.call('SPOP', children_key, tonumber(ARGV[2]))
+for _, child in ipairs(children) do
+    redis.call('HDEL', KEYS[1], child)
+    redis.call('HDEL', KEYS[2], child)
+    if ARGV[5] == '1' and redis.call('EXISTS', KEYS[5] .. child) == 1 then
+        redis.call('HSET', KEYS[5] .. child, 'status', 'failed', 'error', ARGV[4])
+    end
+end
+return {children, redis.call('SCARD', children_key)}
+"""
+
+class DependencyError(ValueError):
+    """A job depends on a job that doesn't exist or can no longer complete."""
+
+class DependencyTracker:
+    """Pending-parent counters for jobs submitted with `depends_on`.
+
+    Waiting jobs are kept out of the queues. When a parent completes, one
+    script call per DEPENDENCY_RELEASE_BATCH children decrements their counters
+    and pushes the ready ones, and MongoDB gets one update_many per batch. No
+    per-child reads are needed, so a large fan-in or fan-out stays cheap.
+
+    The counters live on the main Redis. With queue shards the children's
+    hashes and queues are elsewhere, so the scripts only report the ready or
+    failed children and they are updated on their shards afterwards.
+    """
+
+    def __init__(self):
+        self._register = LuaScript(REGISTER_LUA)
+        self._release = LuaScript(RELEASE_LUA)
+        self._fail = LuaScript(FAIL_LUA)
+
+    def _keys(self) -> List[str]:
+        return [PENDING_KEY, TARGET_KEY, DONE_PREFIX, CHILDREN_PREFIX, JOB_KEY_PREFIX]
+
+    @staticmethod
+    def _local() -> str:
+        """'1' when the scripts can update the children themselves (a single shard)."""
+        return "0" if shards.sharded else "1"
+
+    async def _queue_on_shards(self, ready: List[str], queues: List[str]):
+        pipes = shards.pipelines()
+        await job_store.patch_many(pipes, ready, {"status": JobStatus.QUEUED})
+        by_queue = {}
+        for child, queue in zip(ready, queues):
+            by_queue.setdefault(queue, []).append(child)
+        for queue, children in by_queue.items():
+            await fair_queue.push(queue, children, pipes=pipes)
+        await pipes.execute()
+
+    async def unfinished_parents(self, parent_ids: List[str], known: Tuple[str, ...] = ()) -> List[str]:
+        """Validate parents and drop the ones that already completed.
+
+        Ids in `known` (jobs being submitted together) are taken as unfinished.
+        Raises DependencyError for unknown, failed or cancelled parents.
+        """
+        ids = [p for p in dict.fromkeys(parent_ids) if p not in known]
+        if any(not ObjectId.is_valid(p) for p in ids):
+            raise DependencyError("Invalid dependency id")
+        found = {}
+        if ids:
+            cursor = db.db["jobs"].find({"_id": {"$in": [ObjectId(p) for p in ids]}}, {"status": 1})
+            found = {str(job["_id"]): job.get("status") for job in await cursor.to_list(length=len(ids))}
+        unfinished = []
+        for parent in dict.fromkeys(parent_ids):
+            if parent in known:
+                unfinished.append(parent)
+                continue
+            status = found.get(parent)
+            if status is None:
+                raise DependencyError(f"Dependency {parent} not found")
+            if status in (JobStatus.FAILED, JobStatus.CANCELLED):
+                raise DependencyError(f"Dependency {parent} is {JobStatus(status).value}")
+            if status != JobStatus.COMPLETED:
+                unfinished.append(parent)
+        return unfinished
+
+    async def register_many(self, waiting: List[Tuple[str, List[str], str]]) -> List[int]:
+        """Register (job_id, parent_ids, queue) edges in one pipeline; returns pending counts."""
+        pipe = redis_client.pipeline(transaction=False)
+        script = self._register
+        for job_id, parents, queue in waiting:
+            await script(keys=self._keys(), args=[job_id, queue, *parents], client=pipe)
+        return await pipe.execute()
+
+    async def release(self, parent_id: str) -> List[str]:
+        """Called when a job completes: queue the children that were only waiting on it."""
+        released = []
+        script = self._release
+        while True:
+            ready, remaining, queues = await script(
+                keys=self._keys(), args=[parent_id, settings.DEPENDENCY_RELEASE_BATCH, settings.JOB_CACHE_TTL, self._local()]
+            )
+            if ready and shards.sharded:
+                await self._queue_on_shards(ready, queues)
+            if ready:
+                await db.db["jobs"].update_many(
+                    {"_id": {"$in": [ObjectId(child) for child in ready]}, "status": JobStatus.WAITING},
+                    {"$set": {"status": JobStatus.QUEUED}},
+                )
+                released += ready
+            if not remaining:
+                return released
+
+    async def release_many(self, parent_ids: List[str]) -> List[str]:
+        """release() for a batch of completed jobs: the first script call of each
+        goes out in one pipeline, and ready children share one update_many."""
+        if not parent_ids:
+            return []
+        script = self._release
+        pipe = redis_client.pipeline(transaction=False)
+        for parent_id in parent_ids:
+            await script(
+                keys=self._keys(),
+                args=[parent_id, settings.DEPENDENCY_RELEASE_BATCH, settings.JOB_CACHE_TTL, self._local()],
+                client=pipe,
+            )
+        released = []
+        queues = []
+        unfinished = []
+        for parent_id, (ready, remaining, ready_queues) in zip(parent_ids, await pipe.execute()):
+            released += ready
+            queues += ready_queues
+            if remaining:
+                unfinished.append(parent_id)
+        if released and shards.sharded:
+            await self._queue_on_shards(released, queues)
+        if released:
+            await db.db["jobs"].update_many(
+                {"_id": {"$in": [ObjectId(child) for child in released]}, "status": JobStatus.WAITING},
+                {"$set": {"status": JobStatus.QUEUED}},
+            )
+        for parent_id in unfinished:
+            released += await self.release(parent_id) # Large fan-out: keep going in batches
+        return released
+
+    async def fail_dependents(self, parent_id: str, reason: str) -> List[str]:
+        """Called when a job fails for good or is cancelled: fail everything
+        downstream of it, level by level, one batch at a time."""
+        failed = []
+        frontier = [parent_id]
+        script = self._fail
+        while frontier:
+            parent = frontier.pop()
+            error = f"Dependency {parent} {reason}"
+            while True:
+                children, remaining = await script(
+                    keys=self._keys(),
+                    args=[parent, settings.DEPENDENCY_RELEASE_BATCH, settings.JOB_CACHE_TTL, error, self._local()],
+                )
+                if children and shards.sharded:
+                    pipes = shards.pipelines()
+                    await job_store.patch_many(pipes, children, {"status": JobStatus.FAILED, "error": error})
+                    await pipes.execute()
+                if children:
+                    await db.db["jobs"].update_many(
+                        {"_id": {"$in": [ObjectId(child) for child in children]}},
+                        {"$set": {"status": JobStatus.FAILED, "error": error}},
+                    )
+                    failed += children
+                    frontier += children
+                if not remaining:
+                    break
+        return failed
+
+dependency_tracker = DependencyTracker()
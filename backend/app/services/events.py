@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.redis import blocking_redis_client, redis_client
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+EVENTS_STREAM = "events:jobs"
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+def parse_stream_id(event_id: str) -> Tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+class EventBus:
+    """Job events on a capped Redis Stream, so clients can resume from an event id."""
+
+    def add(self, pipe, event: dict):
+        pipe.xadd(EVENTS_STREAM, {"data": dumps(event)}, maxlen=settings.EVENTS_STREAM_MAXLEN, approximate=True)
+
+    async def publish(self, event: dict):
+        await redis_client.xadd(EVENTS_STREAM, {"data": dumps(event)}, maxlen=settings.EVENTS_STREAM_MAXLEN, approximate=True)
+
+    async def publish_many(self, events: List[dict]):
+        if not events:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        for event in events:
+            self.add(pipe, event)
+        await pipe.execute()
+
+    def decode(self, event_id: str, fields: dict) -> dict:
+        event = loads(fields["data"])
+        event["event_id"] = event_id
+        return event
+
+    async def read_since(self, last_event_id: str, count: int) -> List[dict]:
+        # "(" makes the range exclusive of the id the client already has
+        entries = await redis_client.xrange(EVENTS_STREAM, min=f"({last_event_id}", max="+", count=count)
+        return [self.decode(event_id, fields) for event_id, fields in entries]
+
+class Subscription:
+    """Bounded per-client buffer. When a client falls behind, events of the same
+    job are coalesced to the latest one, and the oldest are dropped beyond `maxsize`.
+    Aggregate events (with `job_ids`) cover several jobs and are never coalesced."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.pending = OrderedDict()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, event: dict, text: str):
+        key = event["event_id"] if event.get("job_ids") else event.get("job_id") or event["event_id"]
+        if key in self.pending:
+            del self.pending[key]
+        elif len(self.pending) >= self.maxsize:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[key] = (event["event_id"], text)
+        self.ready.set()
+
+    async def get(self) -> List[Tuple[str, str]]:
+        await self.ready.wait()
+        self.ready.clear()
+        items = list(self.pending.values())
+        self.pending.clear()
+        return items
+
+class EventBroadcaster:
+    """One stream reader per API process, fanned out to every connected WebSocket."""
+
+    def __init__(self, bus: EventBus):
+        self.bus = bus
+        self.subscribers = set()
+        self.waiters: Dict[str, List[asyncio.Future]] = {} # job_id -> long-polls waiting for a final status
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(settings.EVENTS_CLIENT_BUFFER)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscribers.discard(sub)
+
+    async def wait_for(self, job_id: str, timeout: float, is_done=None) -> Optional[dict]:
+        """Wait for the job's next terminal event. `is_done` is awaited after the
+        waiter is registered, so a job that finished just before can't be missed."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(job_id, []).append(future)
+        try:
+            if is_done and await is_done():
+                return None
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiting = self.waiters.get(job_id, [])
+            if future in waiting:
+                waiting.remove(future)
+            if not waiting:
+                self.waiters.pop(job_id, None)
+
+    def dispatch(self, event: dict):
+        text = dumps(event).decode()
+        for sub in self.subscribers:
+            sub.push(event, text)
+        if self.waiters and event.get("status") in TERMINAL_STATUSES:
+            for job_id in event.get("job_ids") or [event.get("job_id")]:
+                for future in self.waiters.pop(job_id, []):
+                    if not future.done():
+                        future.set_result(event)
+
+    async def _consume(self):
+        last_id = "$"
+        while True:
+            try:
+                response = await blocking_redis_client.xread({EVENTS_STREAM: last_id}, count=500, block=5000)
+                for _stream, entries in response or []:
+                    for event_id, fields in entries:
+                        last_id = event_id
+                        self.dispatch(self.bus.decode(event_id, fields))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Event stream error: %s", e)
+                await asyncio.sleep(1)
+
+event_bus = EventBus()
+event_broadcaster = EventBroadcaster(event_bus)
@@ -0,0 +1,166 @@
+import asyncio
+from typing import List, Optional, Tuple
+from app.core.queues import LUA_PUSH_JOB, SIGNAL_KEY
+from app.core.redis import LuaScript
+from app.core.shards import ShardPipelines, shards
+from app.services.reliable_queue import LEASES_KEY, LEASE_WORKER_KEY, LEASE_QUEUE_KEY, PROCESSING_PREFIX
+
+SERVED_KEY = "queue:served"               # HASH priority queue -> last time it was served (ms)
+TENANT_WEIGHTS_KEY = "queue:tenant_weights"  # HASH user_id -> jobs per round-robin turn (default 1)
+
+# ARGV[1] = 1 to push onto the consumer end (boost, reaper), ARGV[2...] = job ids
+PUSH_LUA = LUA_PUSH_JOB + """
+for i = 2, #ARGV do
+    push_job(KEYS[1], ARGV[i], ARGV[1] == '1')
+end
+return #ARGV - 1
+"""
+
+# Pops up to ARGV[3] ids. Within a priority, tenants are served with deficit
+# round-robin (each gets `weight` pops per turn); across priorities the order is
+# strict, except that a lower priority which has had work but no pop for
+# ARGV[4] ms is served first. With ARGV[2] > 0 each id is also leased to the
+# worker exactly like the reliable queue does.
+DEQUEUE_LUA = """
+local nq = #KEYS - 6
+local processing, leases, lease_worker, lease_queue = KEYS[nq + 1], KEYS[nq + 2], KEYS[nq + 3], KEYS[nq + 4]
+local served, weights = KEYS[nq + 5], KEYS[nq + 6]
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local lease_ms = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local aging = tonumber(ARGV[4])
+
+local function has_work(base)
+    return redis.call('LLEN', base .. ':tenants') > 0 or redis.call('LLEN', base) > 0
+end
+
+local function drop_tenant(base, ring, tenant)
+    redis.call('LPOP', ring)
+    redis.call('SREM', ring .. ':set', tenant)
+    redis.call('HDEL', base .. ':deficit', tenant)
+end
+
+local function pop_from(base)
+    local ring = base .. ':tenants'
+    for _ = 1, redis.call('LLEN', ring) do
+        local tenant = redis.call('LINDEX', ring, 0)
+        local queue = base .. ':u:' .. tenant
+        local id = redis.call('RPOP', queue)
+        if id then
+            redis.call('DECR', base .. ':pending')
+            local credit = tonumber(redis.call('HGET', base .. ':deficit', tenant))
+                or tonumber(redis.call('HGET', weights, tenant)) or 1
+            credit = credit - 1
+            if redis.call('LLEN', queue) == 0 then
+                drop_tenant(base, ring, tenant)
+            elseif credit <= 0 then
+                redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+                redis.call('HDEL', base .. ':deficit', tenant)
+            else
+                redis.call('HSET', base .. ':deficit', tenant, credit)
+            end
+            return queue, id
+        end
+        drop_tenant(base, ring, tenant)
+    end
+    -- Entries pushed without a tenant (or before fair scheduling was enabled)
+    local id = redis.call('RPOP', base)
+    if id then return base, id end
+    return nil, nil
+end
+
+local out = {}
+while #out < count * 2 do
+    local queue, id, base
+    if aging > 0 then
+        for i = 2, nq do
+            if has_work(KEYS[i]) then
+                local last = tonumber(redis.call('HGET', served, KEYS[i]))
+                if not last then
+                    redis.call('HSET', served, KEYS[i], now)
+                elseif now - last >= aging then
+                    base = KEYS[i]
+                    queue, id = pop_from(base)
+                    break
+                end
+            else
+                -- Waiting time only counts while there is something to serve
+                redis.call('HSET', served, KEYS[i], now)
+            end
+        end
+    end
+    if not id then
+        for i = 1, nq do
+            base = KEYS[i]
+            queue, id = pop_from(base)
+            if id then break end
+        end
+    end
+    if not id then break end
+    redis.call('HSET', served, base, now)
+    if lease_ms > 0 then
+        redis.call('LPUSH', processing, id)
+        redis.call('ZADD', leases, now + lease_ms, id)
+        redis.call('HSET', lease_worker, id, ARGV[1])
+        redis.call('HSET', lease_queue, id, queue)
+    end
+    table.insert(out, queue)
+    table.insert(out, id)
+end
+return out
+"""
+
+class FairQueue:
+    """Script-based push/dequeue over the priority queues.
+
+    Pushes go through one Lua helper so tenant sub-queues, the tenant ring and
+    the wake-up signal stay consistent no matter who pushes (API, promoter,
+    reaper). Dequeue is non-blocking; idle workers block on the signal list
+    instead, which keeps BRPOP-style wake-ups without polling.
+
+    With queue shards every id is pushed onto its own shard. A worker pops
+    from its home shard first and steals from the others while it has room.
+    """
+
+    def __init__(self):
+        self._push = LuaScript(PUSH_LUA)
+        self._dequeue = LuaScript(DEQUEUE_LUA)
+
+    async def push(self, queue: str, job_ids: List[str], to_front: bool = False, pipes: Optional[ShardPipelines] = None):
+        """Push ids onto `queue` on their shards (or queue the pushes on `pipes`)."""
+        script = self._push
+        flag = "1" if to_front else "0"
+        groups = shards.group(job_ids)
+        if pipes is not None:
+            for index, ids in groups.items():
+                await script(keys=[queue], args=[flag, *ids], client=pipes.shard(index))
+            return
+        await asyncio.gather(*(
+            script(keys=[queue], args=[flag, *ids], client=shards.client(index)) for index, ids in groups.items()
+        ))
+
+    async def dequeue(
+        self, queues: List[str], worker_id: str, lease_ttl: int = 0, count: int = 1, aging: float = 0
+    ) -> List[Tuple[str, str]]:
+        keys = list(queues) + [
+            f"{PROCESSING_PREFIX}{worker_id}", LEASES_KEY, LEASE_WORKER_KEY, LEASE_QUEUE_KEY,
+            SERVED_KEY, TENANT_WEIGHTS_KEY,
+        ]
+        script = self._dequeue
+        popped = []
+        # Work stealing: the home shard first, the others only for what it couldn't fill
+        for index in shards.order(worker_id):
+            args = [worker_id, int(lease_ttl * 1000), count - len(popped), int(aging * 1000)]
+            flat = await script(keys=keys, args=args, client=shards.client(index))
+            popped += zip(flat[::2], flat[1::2])
+            if len(popped) >= count:
+                break
+        return popped
+
+    async def wait_for_work(self, timeout: int, worker_id: str = "") -> bool:
+        """Block until something is pushed to the worker's home shard (or the timeout runs out)."""
+        client = shards.blocking_client(shards.index(worker_id))
+        return bool(await client.brpop([SIGNAL_KEY], timeout=timeout))
+
+fair_queue = FairQueue()
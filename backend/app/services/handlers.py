@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import importlib
+import time
+from importlib.metadata import entry_points
+from typing import Callable, Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HANDLER_ENTRY_POINT_GROUP = "job_scheduler.handlers"
+EXECUTION_MODES = ("async", "thread", "process")
+
+class JobHandler:
+    """A job type's callable plus its execution settings.
+
+    The callable takes the job payload and returns the result dict. `async`
+    handlers must be coroutine functions; `thread`/`process` handlers are plain
+    functions (module-level, so they can be pickled for their process).
+    """
+
+    def __init__(
+        self,
+        job_type: str,
+        func: Callable,
+        mode: str = "async",
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: float = 2.0,
+        backoff_max: Optional[float] = None,
+    ):
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{mode}' for job type '{job_type}'")
+        if mode == "async" and not asyncio.iscoroutinefunction(func):
+            raise ValueError(f"Handler for '{job_type}' must be async in 'async' mode")
+        self.job_type = job_type
+        self.func = func
+        self.mode = mode
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.max_retries = max_retries # None: use the job's own max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def retry_delay(self, retry_count: int) -> float:
+        delay = self.backoff_base ** retry_count # 1s, 2s, 4s... by default
+        if self.backoff_max is not None:
+            delay = min(delay, self.backoff_max)
+        return delay
+
+class HandlerRegistry:
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._default: Optional[JobHandler] = None
+        self._discovered = False
+
+    def register(self, job_type: str, **options):
+        """Decorator: @registry.register("send_email", mode="thread", timeout=30)"""
+        def decorator(func):
+            self._handlers[job_type] = JobHandler(job_type, func, **options)
+            return func
+        return decorator
+
+    def get(self, job_type: str) -> JobHandler:
+        handler = self._handlers.get(job_type)
+        if handler is None:
+            if self._default is None:
+                self._default = self._default_handler()
+            handler = self._default
+        return handler
+
+    def types(self):
+        return list(self._handlers)
+
+    def _default_handler(self) -> JobHandler:
+        # Job types without a handler keep running the simulated work
+        if settings.WORKER_EXECUTOR == "async":
+            return JobHandler("*", simulate)
+        return JobHandler("*", simulate_sync, mode=settings.WORKER_EXECUTOR)
+
+    def discover(self):
+        """Import handler modules once, at worker startup.
+
+        Sources: the `job_scheduler.handlers` entry point group (an entry point
+        may name a module that registers handlers on import, or a handler
+        function registered under the entry point's name) and JOB_HANDLER_MODULES.
+        """
+        if self._discovered:
+            return
+        self._discovered = True
+
+        for module_name in settings.JOB_HANDLER_MODULES:
+            importlib.import_module(module_name)
+
+        for ep in entry_points(group=HANDLER_ENTRY_POINT_GROUP):
+            try:
+                loaded = ep.load()
+            except Exception as e:
+                logger.error("Failed to load job handler entry point '%s': %s", ep.name, e)
+                continue
+            if callable(loaded) and ep.name not in self._handlers:
+                mode = "async" if asyncio.iscoroutinefunction(loaded) else "thread"
+                self._handlers[ep.name] = JobHandler(ep.name, loaded, mode=mode)
+
+        logger.info("Job handlers: %s", ", ".join(self.types()) or "none (default only)")
+
+async def simulate(payload: dict):
+    await asyncio.sleep(2) # Fake work
+    return {"msg": "Success"}
+
+def simulate_sync(payload: dict):
+    time.sleep(2) # Fake work
+    return {"msg": "Success"}
+
+handler_registry = HandlerRegistry()
@@ -0,0 +1,73 @@
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.core.redis import LuaScript, redis_client
+from app.core.shards import shards
+from app.services.delayed_promoter import DELAYED_KEY
+
+IDEMPOTENCY_KEY_PREFIX = "idem:"
+
+# Drops the reservation only if it still points at ARGV[1], so a request that
+# failed to insert never frees a key another request has taken over.
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Pushes a debounced job's run time to ARGV[2], but only while it is still in
+# queue:delayed. Returns 0 once the promoter has released it.
+DEBOUNCE_LUA = """
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+class IdempotencyStore:
+    """Redis side of idempotent submission: `idem:{user_id}:{key}` -> job id.
+
+    A SET NX per submission answers retries without touching MongoDB; the
+    unique (user_id, idempotency_key) index backs it up when a reservation has
+    expired or two requests race.
+    """
+
+    def __init__(self):
+        self._release = LuaScript(RELEASE_LUA)
+        self._debounce = LuaScript(DEBOUNCE_LUA)
+
+    def key(self, user_id: str, idempotency_key: str) -> str:
+        return f"{IDEMPOTENCY_KEY_PREFIX}{user_id}:{idempotency_key}"
+
+    async def reserve_many(self, items: List[Tuple[str, str, str]]) -> List[Optional[str]]:
+        """Reserve (user_id, idempotency_key, job_id) entries in one round trip.
+
+        Returns, per entry, None if it was reserved for `job_id`, or the id of
+        the job already holding the key.
+        """
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, idempotency_key, job_id in items:
+            key = self.key(user_id, idempotency_key)
+            pipe.set(key, job_id, nx=True, ex=settings.IDEMPOTENCY_TTL)
+            pipe.get(key)
+        replies = await pipe.execute()
+        return [None if reserved else holder for reserved, holder in zip(replies[::2], replies[1::2])]
+
+    async def reserve(self, user_id: str, idempotency_key: str, job_id: str) -> Optional[str]:
+        return (await self.reserve_many([(user_id, idempotency_key, job_id)]))[0]
+
+    async def take_over(self, user_id: str, idempotency_key: str, job_id: str):
+        """Point the key at a new job (the old one no longer holds it)."""
+        await redis_client.set(self.key(user_id, idempotency_key), job_id, ex=settings.IDEMPOTENCY_TTL)
+
+    async def release(self, user_id: str, idempotency_key: str, job_id: str):
+        await self._release(keys=[self.key(user_id, idempotency_key)], args=[job_id])
+
+    async def postpone(self, job_id: str, run_at: float) -> bool:
+        """Move a still-delayed job to `run_at`; False if it was already promoted."""
+        return bool(await self._debounce(
+            keys=[DELAYED_KEY], args=[job_id, run_at], client=shards.for_job(job_id)
+        ))
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,56 @@
+import asyncio
+import multiprocessing
+from typing import Callable
+
+def _run(conn, func: Callable, payload: dict):
+    """Child side: run the handler and send back (ok, result or exception)."""
+    try:
+        outcome = (True, func(payload))
+    except Exception as e:
+        outcome = (False, e)
+    try:
+        conn.send(outcome)
+    except Exception as e:
+        # Unpicklable result or exception (send() pickles before writing anything)
+        conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+    conn.close()
+
+class JobProcess:
+    """A process-mode handler running in a process of its own.
+
+    Unlike a pool worker, the process only ever runs this one job, so a
+    timeout or cancel can kill it without touching other jobs.
+    """
+
+    def __init__(self, func: Callable, payload: dict):
+        context = multiprocessing.get_context()
+        self.conn, child = context.Pipe(duplex=False)
+        self.process = context.Process(target=_run, args=(child, func, payload))
+        self.process.start()
+        child.close() # Only the child holds the write end: its exit reads as EOF
+
+    async def result(self):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.conn.fileno()
+        try:
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fd)
+            try:
+                ok, value = self.conn.recv()
+            except EOFError:
+                self.process.join()
+                raise RuntimeError(f"Job process exited with code {self.process.exitcode}") from None
+        finally:
+            self.conn.close()
+        if ok:
+            return value
+        raise value
+
+    def kill(self):
+        """Stop the process if it's still running (multiprocessing reaps it)."""
+        if self.process.is_alive():
+            self.process.kill()
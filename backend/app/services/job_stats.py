@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.database import db
+from app.core.leader import run_as_leader
+from app.core.redis import redis_client
+from app.models.stats import Timeseries, TimeseriesPoint
+
+logger = logging.getLogger(__name__)
+
+# Keys (see ARCHITECTURE.md)
+BUCKET_PREFIX = "stats:ts:"              # HASH per dimension and minute: outcome counts, seconds, latency histogram
+DIMENSIONS_PREFIX = "stats:ts:dims:"     # SET per hour: dimensions with a bucket in that hour
+ROLLUP_CURSOR_KEY = "stats:rollup:hour"  # Last hour folded into MongoDB
+ROLLUP_COLLECTION = "stats_rollups"
+
+OUTCOMES = ("success", "failure", "cancelled")
+
+# Log-linear latency histogram (HDR style): SUB_BUCKETS buckets per doubling,
+# starting at 1µs, so a percentile is within ~5% of the true value. Buckets
+# of several minutes, workers or hours merge by adding counts.
+SUB_BUCKETS = 8
+
+def latency_bucket(seconds: float) -> int:
+    return int(math.log2(max(1.0, seconds * 1e6)) * SUB_BUCKETS)
+
+def bucket_seconds(bucket: int) -> float:
+    """Geometric midpoint of a histogram bucket."""
+    return 2 ** ((bucket + 0.5) / SUB_BUCKETS) / 1e6
+
+def percentile(histogram: Dict[int, int], q: float) -> Optional[float]:
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_seconds(bucket)
+
+def _epoch(value: datetime) -> float:
+    # Naive datetimes are UTC here
+    return value.timestamp() if value.tzinfo else value.replace(tzinfo=timezone.utc).timestamp()
+
+def _utc(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+def _merge(buckets: Iterable[dict]) -> Dict[str, float]:
+    merged = {}
+    for fields in buckets:
+        for field, value in (fields or {}).items():
+            merged[field] = merged.get(field, 0) + float(value)
+    return merged
+
+def _point(ts: float, fields: Dict[str, float], seconds: int) -> TimeseriesPoint:
+    counts = {outcome: int(fields.get(outcome, 0)) for outcome in OUTCOMES}
+    attempts = sum(counts.values())
+    histogram = {int(field[1:]): int(count) for field, count in fields.items() if field.startswith("h")}
+    point = TimeseriesPoint(
+        ts=_utc(ts),
+        completed=counts["success"],
+        failed=counts["failure"],
+        cancelled=counts["cancelled"],
+        throughput=round(counts["success"] / seconds, 4),
+        failure_rate=round(counts["failure"] / attempts, 4) if attempts else 0.0,
+    )
+    if attempts:
+        point.mean_ms = round(fields.get("seconds", 0.0) / attempts * 1000, 3)
+        point.p50_ms, point.p95_ms, point.p99_ms = (
+            round(percentile(histogram, q) * 1000, 3) if histogram else None for q in (0.5, 0.95, 0.99)
+        )
+    return point
+
+class JobStats:
+    """Per-minute job outcome counters and latency histograms.
+
+    Workers buffer what they run and add it every STATS_FLUSH_INTERVAL seconds
+    in one pipeline: one hash per minute and dimension (all jobs, each type
+    and, with STATS_PER_USER, each user). A timeseries read is one pipelined
+    HGETALL per minute, never a MongoDB scan. With STATS_ROLLUP_ENABLED an
+    elected worker folds complete hours into `stats_rollups`, which serves
+    ranges older than STATS_BUCKET_TTL (hours not folded yet still come from
+    their minute buckets). The type buckets also feed the autoscaler.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, int], Dict[str, float]] = {}
+
+    def key(self, dimension: str, minute: int) -> str:
+        return f"{BUCKET_PREFIX}{dimension}:{minute}"
+
+    def observe(self, job_type: str, user_id: Optional[str], outcome: str, seconds: float):
+        minute = int(time.time() // 60)
+        latency = f"h{latency_bucket(seconds)}"
+        dimensions = ["all", f"type:{job_type}"]
+        if settings.STATS_PER_USER and user_id:
+            dimensions.append(f"user:{user_id}")
+        for dimension in dimensions:
+            fields = self._pending.setdefault((dimension, minute), {})
+            fields[outcome] = fields.get(outcome, 0) + 1
+            fields["seconds"] = fields.get("seconds", 0.0) + seconds
+            fields[latency] = fields.get(latency, 0) + 1
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        # Counters aren't idempotent, so a batch that fails to write is dropped rather than retried
+        batch, self._pending = self._pending, {}
+        pipe = redis_client.pipeline(transaction=False)
+        hours = {}
+        for (dimension, minute), fields in batch.items():
+            key = self.key(dimension, minute)
+            for field, value in fields.items():
+                if field == "seconds":
+                    pipe.hincrbyfloat(key, field, value)
+                else:
+                    pipe.hincrby(key, field, int(value))
+            pipe.expire(key, settings.STATS_BUCKET_TTL)
+            hours.setdefault(minute // 60, set()).add(dimension)
+        for hour, dimensions in hours.items():
+            pipe.sadd(f"{DIMENSIONS_PREFIX}{hour}", *dimensions)
+            pipe.expire(f"{DIMENSIONS_PREFIX}{hour}", settings.STATS_BUCKET_TTL)
+        await pipe.execute()
+        return len(batch)
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(settings.STATS_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Stats flush failed: %s", e)
+
+    async def _read(self, keys: List[str]) -> List[dict]:
+        """HGETALL of every key, STATS_READ_BATCH per pipeline."""
+        buckets = []
+        for offset in range(0, len(keys), settings.STATS_READ_BATCH):
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys[offset:offset + settings.STATS_READ_BATCH]:
+                pipe.hgetall(key)
+            buckets += await pipe.execute()
+        return buckets
+
+    async def executions(self, minutes: range) -> Dict[str, Tuple[int, float]]:
+        """Per-type (attempts, execution seconds) over `minutes`, from the type buckets."""
+        pipe = redis_client.pipeline(transaction=False)
+        for hour in range(minutes.start // 60, (minutes.stop - 1) // 60 + 1):
+            pipe.smembers(f"{DIMENSIONS_PREFIX}{hour}")
+        types = sorted({dimension for seen in await pipe.execute() for dimension in seen if dimension.startswith("type:")})
+        if not types:
+            return {}
+        pipe = redis_client.pipeline(transaction=False)
+        for dimension in types:
+            for minute in minutes:
+                pipe.hmget(self.key(dimension, minute), *OUTCOMES, "seconds")
+        values = await pipe.execute()
+        totals = {}
+        for index, dimension in enumerate(types):
+            count, seconds = 0, 0.0
+            for *counts, spent in values[index * len(minutes):(index + 1) * len(minutes)]:
+                count += sum(int(value or 0) for value in counts)
+                seconds += float(spent or 0)
+            if count:
+                totals[dimension[len("type:"):]] = (count, seconds)
+        return totals
+
+    async def timeseries(
+        self, dimension: str, start: Optional[datetime] = None, end: Optional[datetime] = None, step: int = 60
+    ) -> Timeseries:
+        """Points of `step` seconds (a multiple of 60) between start and end
+        (default: the last hour). Raises ValueError for a bad range."""
+        if step % 60:
+            raise ValueError("step must be a multiple of 60 seconds")
+        now = time.time()
+        end_ts = _epoch(end) if end else now
+        start_ts = _epoch(start) if start else end_ts - 3600
+        if start_ts >= end_ts:
+            raise ValueError("start must be before end")
+
+        retained = now - settings.STATS_BUCKET_TTL
+        if settings.STATS_ROLLUP_ENABLED and start_ts < retained:
+            source, unit = "rollup", 3600
+            step = max(3600, math.ceil(step / 3600) * 3600)
+        else:
+            source, unit = "redis", 60
+            start_ts = max(start_ts, retained) # Older minute buckets have expired
+        per_point = step // unit
+        first = int(start_ts // step) * per_point # Aligned to the step
+        last = math.ceil(end_ts / unit)
+        if math.ceil((last - first) / per_point) > settings.STATS_MAX_POINTS:
+            raise ValueError(f"More than {settings.STATS_MAX_POINTS} points; use a larger step")
+
+        if source == "redis":
+            buckets = await self._read([self.key(dimension, minute) for minute in range(first, last)])
+        else:
+            # Hours up to the rollup cursor come from MongoDB; the ones after it
+            # (not folded yet) are merged from their minute buckets
+            cursor = await redis_client.get(ROLLUP_CURSOR_KEY)
+            rolled = min(int(cursor), last - 1) if cursor else first - 1
+            docs = db.db[ROLLUP_COLLECTION].find(
+                {"dimension": dimension, "hour": {"$gte": _utc(first * 3600), "$lte": _utc(rolled * 3600)}}
+            )
+            hours = {int(_epoch(doc["hour"]) // 3600): doc["fields"] async for doc in docs}
+            pending = range(max(rolled + 1, first, int(retained // 3600)), last)
+            minutes = await self._read([
+                self.key(dimension, minute) for hour in pending for minute in range(hour * 60, hour * 60 + 60)
+            ])
+            for index, hour in enumerate(pending):
+                hours[hour] = _merge(minutes[index * 60:(index + 1) * 60])
+            buckets = [hours.get(hour) for hour in range(first, last)]
+
+        points = [
+            _point((first + offset) * unit, _merge(buckets[offset:offset + per_point]), step)
+            for offset in range(0, last - first, per_point)
+        ]
+        return Timeseries(
+            dimension=dimension, source=source, step=step, start=_utc(first * unit), end=_utc(last * unit), points=points
+        )
+
+    async def rollup_hour(self, hour: int) -> int:
+        """Fold the minute buckets of one hour into `stats_rollups` (idempotent)."""
+        dimensions = sorted(await redis_client.smembers(f"{DIMENSIONS_PREFIX}{hour}"))
+        if not dimensions:
+            return 0
+        # A chunk of dimensions at a time, so thousands of users don't mean one huge pipeline
+        size = max(1, settings.STATS_READ_BATCH // 60)
+        for offset in range(0, len(dimensions), size):
+            chunk = dimensions[offset:offset + size]
+            buckets = await self._read([
+                self.key(dimension, minute) for dimension in chunk for minute in range(hour * 60, hour * 60 + 60)
+            ])
+            ops = [
+                UpdateOne(
+                    {"_id": f"{dimension}:{hour}"},
+                    {"$set": {
+                        "dimension": dimension, "hour": _utc(hour * 3600),
+                        "fields": _merge(buckets[index * 60:(index + 1) * 60]),
+                    }},
+                    upsert=True,
+                )
+                for index, dimension in enumerate(chunk)
+            ]
+            await db.db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+        return len(dimensions)
+
+    async def rollup(self) -> int:
+        """Fold every complete hour since the last rollup; returns the hours folded."""
+        # An hour is complete once the last worker flush for it is in
+        complete = int((time.time() - settings.STATS_FLUSH_INTERVAL - 60) // 3600)
+        oldest = int((time.time() - settings.STATS_BUCKET_TTL) // 3600) + 1 # Still fully in Redis
+        cursor = await redis_client.get(ROLLUP_CURSOR_KEY)
+        hour = max(int(cursor) + 1 if cursor else oldest, oldest)
+        folded = 0
+        while hour < complete:
+            await self.rollup_hour(hour)
+            await redis_client.set(ROLLUP_CURSOR_KEY, hour)
+            hour += 1
+            folded += 1
+        return folded
+
+    async def run_rollups(self, owner: str):
+        """Roll up for as long as this process holds the stats rollup lease."""
+        await run_as_leader(
+            "stats_rollup", owner, settings.STATS_ROLLUP_LEASE_TTL, settings.STATS_ROLLUP_INTERVAL, self._rollup_step
+        )
+
+    async def _rollup_step(self):
+        folded = await self.rollup()
+        if folded:
+            logger.info("Rolled up %d hour(s) of job stats", folded, extra={"hours": folded})
+
+job_stats = JobStats()
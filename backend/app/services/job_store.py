@@ -0,0 +1,324 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.database import db
+from app.core.redis import LuaScript, redis_client
+from app.core.queues import queue_for_priority
+from app.core.shards import shards
+from app.core.metrics import MONGO_UPDATE_SECONDS, timed
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY_PREFIX = "job:"
+TOMBSTONE_PREFIX = "tombstone:job:"
+LOCK_PREFIX = "lock:job:"
+CANCEL_CHANNEL = "jobs:cancel" # Pub/Sub: ids of cancelled jobs, for the worker running them
+
+# Fields mirrored into the `job:{id}` hash. Timestamps and results only live in MongoDB.
+# `queue` is the only queue whose entry for this job is live; entries left in
+# other queues (e.g. by a boost) are stale and skipped at pop time.
+CACHED_FIELDS = (
+    "type", "user_id", "priority", "status", "payload", "payload_ref", "retry_count", "max_retries", "error", "queue",
+    "created_at", "timeout", "lease",
+)
+INT_FIELDS = ("priority", "retry_count", "max_retries", "lease")
+FLOAT_FIELDS = ("timeout",)
+JSON_FIELDS = ("payload", "payload_ref")
+
+# Only touch hashes that are already cached, so a partial update never
+# leaves a hash without its payload.
+PATCH_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+    return 1
+end
+return 0
+"""
+
+# Decides at pop time whether a popped entry should run, then takes the job lock.
+# Returns 1 = claimed, 0 = locked by another worker, -1 = cancelled, -2 = stale entry
+# (the job already finished, or its live entry is in another queue).
+CLAIM_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return -1
+end
+local status = redis.call('HGET', KEYS[1], 'status')
+if status == 'cancelled' then
+    return -1
+end
+if status == 'completed' or status == 'failed' then
+    return -2
+end
+-- Compare priority queues only: the tenant part of a fair-scheduling key doesn't matter
+local queue = redis.call('HGET', KEYS[1], 'queue')
+local base = function(q) return string.match(q, '^(.-):u:') or q end
+if ARGV[1] ~= '' and queue and queue ~= '' and base(queue) ~= base(ARGV[1]) then
+    return -2
+end
+if redis.call('SET', KEYS[3], ARGV[2], 'NX', 'EX', ARGV[3]) then
+    return 1
+end
+return 0
+"""
+
+CLAIMED, LOCKED, CANCELLED, STALE = 1, 0, -1, -2
+
+# Extends the locks of a worker's running jobs. KEYS holds (lock, tombstone) pairs,
+# ARGV[1] the owner and ARGV[n + 1] the lease of pair n. Returns the pair numbers
+# of jobs cancelled meanwhile and of locks no longer held by the owner.
+RENEW_LUA = """
+local cancelled, lost = {}, {}
+for n = 1, #KEYS / 2 do
+    local lock = KEYS[2 * n - 1]
+    if redis.call('GET', lock) == ARGV[1] then
+        redis.call('EXPIRE', lock, ARGV[n + 1])
+    else
+        table.insert(lost, n)
+    end
+    if redis.call('EXISTS', KEYS[2 * n]) == 1 then
+        table.insert(cancelled, n)
+    end
+end
+return {cancelled, lost}
+"""
+
+# Releases a lock only if the owner still holds it: one that expired may be another worker's by now
+UNLOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class JobStore:
+    """Write-through cache of job metadata in Redis (`job:{id}` hashes, on the
+    job's shard together with its lock and tombstone).
+
+    The worker reads jobs from here instead of MongoDB. Status transitions are
+    written to the hash right away and persisted to MongoDB either inline
+    (JOB_STATE_CONSISTENCY=strong) or by a batched write-behind flusher
+    (JOB_STATE_CONSISTENCY=eventual).
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, dict] = {}
+        self._flush_needed = asyncio.Event()
+        self._patch = LuaScript(PATCH_LUA)
+        self._claim = LuaScript(CLAIM_LUA)
+        self._renew = LuaScript(RENEW_LUA)
+        self._unlock = LuaScript(UNLOCK_LUA)
+
+    def key(self, job_id: str) -> str:
+        return f"{JOB_KEY_PREFIX}{job_id}"
+
+    def tombstone_key(self, job_id: str) -> str:
+        return f"{TOMBSTONE_PREFIX}{job_id}"
+
+    @property
+    def write_behind(self) -> bool:
+        return settings.JOB_STATE_CONSISTENCY == "eventual"
+
+    def _encode(self, fields: dict) -> dict:
+        encoded = {}
+        for name, value in fields.items():
+            if name not in CACHED_FIELDS:
+                continue
+            if name in JSON_FIELDS:
+                value = dumps(value)
+            elif isinstance(value, datetime):
+                value = value.replace(tzinfo=timezone.utc).timestamp() # Naive datetimes are UTC here
+            elif hasattr(value, "value"):
+                value = value.value # Enums
+            encoded[name] = "" if value is None else value
+        return encoded
+
+    def _decode(self, job_id: str, data: dict) -> dict:
+        job = {"_id": job_id}
+        for name, value in data.items():
+            if name in JSON_FIELDS:
+                value = loads(value) if value else None
+            elif value == "":
+                value = None
+            elif name in INT_FIELDS:
+                value = int(value)
+            elif name in FLOAT_FIELDS:
+                value = float(value)
+            elif name == "created_at":
+                value = datetime.fromtimestamp(float(value), timezone.utc).replace(tzinfo=None)
+            job[name] = value
+        return job
+
+    def cache(self, pipe, job: dict):
+        """Queue the cache write for a freshly created job onto an existing pipeline (of the job's shard)."""
+        key = self.key(str(job["_id"]))
+        fields = self._encode(job)
+        fields.setdefault("queue", queue_for_priority(int(fields.get("priority", 2)), fields.get("user_id")))
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, settings.JOB_CACHE_TTL)
+
+    async def put(self, job: dict):
+        pipe = shards.for_job(str(job["_id"])).pipeline(transaction=False)
+        self.cache(pipe, job)
+        await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        data = await shards.for_job(job_id).hgetall(self.key(job_id))
+        if data:
+            return self._decode(job_id, data)
+
+        # Cache miss (expired, or created before the cache existed)
+        job = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
+        if job:
+            await self.put(job)
+        return job
+
+    async def get_many(self, job_ids: List[str]) -> Dict[str, dict]:
+        """get() for a batch: one pipelined HGETALL, one $in query for the misses."""
+        replies = await shards.each(job_ids, lambda pipe, job_id: pipe.hgetall(self.key(job_id)))
+        jobs = {job_id: self._decode(job_id, data) for job_id, data in zip(job_ids, replies) if data}
+
+        missing = [ObjectId(job_id) for job_id in job_ids if job_id not in jobs]
+        if missing:
+            found = await db.db["jobs"].find({"_id": {"$in": missing}}).to_list(length=len(missing))
+            pipes = shards.pipelines()
+            for job in found:
+                self.cache(pipes.for_job(str(job["_id"])), job)
+                jobs[str(job["_id"])] = job
+            await pipes.execute()
+        return jobs
+
+    async def patch(self, job_id: str, fields: dict):
+        """Update cached fields of a job, if it's cached. MongoDB is left alone."""
+        encoded = self._encode(fields)
+        if not encoded:
+            return
+        args = [item for pair in encoded.items() for item in pair]
+        await self._patch(keys=[self.key(job_id)], args=args, client=shards.for_job(job_id))
+
+    async def patch_many(self, pipes, job_ids: List[str], fields: dict):
+        """Queue patch() for many jobs onto existing ShardPipelines."""
+        encoded = self._encode(fields)
+        if not encoded:
+            return
+        args = [item for pair in encoded.items() for item in pair]
+        for job_id in job_ids:
+            await self._patch(keys=[self.key(job_id)], args=args, client=pipes.for_job(job_id))
+
+    async def claim(self, job_id: str, queue: Optional[str], worker_id: str, lock_ttl: int) -> int:
+        """Tombstone/stale-entry check plus lock acquisition in one round trip."""
+        keys = [self.key(job_id), self.tombstone_key(job_id), f"{LOCK_PREFIX}{job_id}"]
+        return await self._claim(keys=keys, args=[queue or "", worker_id, lock_ttl], client=shards.for_job(job_id))
+
+    async def claim_many(self, entries: List[Tuple[str, Optional[str]]], worker_id: str, lock_ttl: int) -> List[int]:
+        """claim() for a batch of (job_id, queue) entries, in one round trip per shard."""
+
+        def claim(pipe, entry):
+            job_id, queue = entry
+            keys = [self.key(job_id), self.tombstone_key(job_id), f"{LOCK_PREFIX}{job_id}"]
+            return self._claim(keys=keys, args=[queue or "", worker_id, lock_ttl], client=pipe)
+
+        return await shards.each(entries, claim, key=lambda entry: entry[0])
+
+    async def renew_locks(self, leases: Dict[str, int], worker_id: str) -> Tuple[List[str], List[str]]:
+        """Extend the locks `worker_id` holds on running jobs to their lease, in
+        one round trip per shard. Returns the ids of jobs cancelled meanwhile and
+        of locks that had already expired (or been taken over)."""
+        if not leases:
+            return [], []
+
+        async def renew(index: int, job_ids: List[str]):
+            keys = [key for job_id in job_ids for key in (f"{LOCK_PREFIX}{job_id}", self.tombstone_key(job_id))]
+            args = [worker_id, *(leases[job_id] for job_id in job_ids)]
+            cancelled, lost = await self._renew(keys=keys, args=args, client=shards.client(index))
+            return [job_ids[n - 1] for n in cancelled], [job_ids[n - 1] for n in lost]
+
+        groups = shards.group(list(leases))
+        replies = await asyncio.gather(*(renew(index, job_ids) for index, job_ids in groups.items()))
+        return [job_id for cancelled, _ in replies for job_id in cancelled], [job_id for _, lost in replies for job_id in lost]
+
+    async def tombstone(self, job_id: str):
+        # Queued entries stay where they are; the worker drops them when popped.
+        # A worker already running the job is told right away (on the main Redis,
+        # where every worker listens).
+        await asyncio.gather(
+            shards.for_job(job_id).set(self.tombstone_key(job_id), 1, ex=settings.JOB_CACHE_TTL),
+            redis_client.publish(CANCEL_CHANNEL, job_id),
+        )
+
+    async def clear_tombstone(self, job_id: str):
+        await shards.for_job(job_id).delete(self.tombstone_key(job_id))
+
+    async def unlock(self, job_ids: List[str], worker_id: str):
+        await shards.each(
+            job_ids, lambda pipe, job_id: self._unlock(keys=[f"{LOCK_PREFIX}{job_id}"], args=[worker_id], client=pipe)
+        )
+
+    async def update(self, job_id: str, fields: dict):
+        """Apply a status transition to the cache and persist it to MongoDB."""
+        await self.patch(job_id, fields)
+        if not self.write_behind:
+            with timed(MONGO_UPDATE_SECONDS, mode="inline"):
+                await db.db["jobs"].update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+            return
+
+        # Coalesce: several transitions of one job become a single $set
+        self._pending.setdefault(job_id, {}).update(fields)
+        if len(self._pending) >= settings.JOB_FLUSH_BATCH_SIZE:
+            self._flush_needed.set()
+
+    async def update_many(self, updates: Dict[str, dict]):
+        """update() for a batch: one pipelined cache patch and one bulk_write."""
+        if not updates:
+            return
+        pipes = shards.pipelines()
+        for job_id, fields in updates.items():
+            encoded = self._encode(fields)
+            if encoded:
+                args = [item for pair in encoded.items() for item in pair]
+                await self._patch(keys=[self.key(job_id)], args=args, client=pipes.for_job(job_id))
+        await pipes.execute()
+
+        if not self.write_behind:
+            ops = [UpdateOne({"_id": ObjectId(job_id)}, {"$set": fields}) for job_id, fields in updates.items()]
+            with timed(MONGO_UPDATE_SECONDS, mode="bulk"):
+                await db.db["jobs"].bulk_write(ops, ordered=False)
+            return
+
+        for job_id, fields in updates.items():
+            self._pending.setdefault(job_id, {}).update(fields)
+        if len(self._pending) >= settings.JOB_FLUSH_BATCH_SIZE:
+            self._flush_needed.set()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        ops = [UpdateOne({"_id": ObjectId(job_id)}, {"$set": fields}) for job_id, fields in batch.items()]
+        try:
+            with timed(MONGO_UPDATE_SECONDS, mode="bulk"):
+                await db.db["jobs"].bulk_write(ops, ordered=False)
+        except Exception:
+            # Put the batch back; anything updated meanwhile is newer and wins
+            for job_id, fields in batch.items():
+                self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+            raise
+        return len(ops)
+
+    async def run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=settings.JOB_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Write-behind flush failed: %s", e, extra={"pending": len(self._pending)})
+
+job_store = JobStore()
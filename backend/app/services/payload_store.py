@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import zlib
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from app.core.config import settings
+from app.core.database import db
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+GRIDFS_BUCKET = "payloads"
+
+class PayloadTooLarge(ValueError):
+    """A job payload over JOB_PAYLOAD_MAX_BYTES."""
+
+class PayloadStore:
+    """Out-of-line storage for large job payloads.
+
+    At enqueue time payloads over JOB_PAYLOAD_INLINE_MAX_BYTES (as JSON) are
+    zlib-compressed into the `payloads` GridFS bucket. The job document and its
+    `job:{id}` hash keep `payload: null` plus a small `payload_ref`, so list
+    queries, the job cache and the worker's pop path only move small records.
+    The worker loads the payload right before running the job.
+    """
+
+    def _bucket(self):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        return AsyncIOMotorGridFSBucket(db.db, bucket_name=GRIDFS_BUCKET)
+
+    async def offload(self, docs: List[dict], strict: bool = True) -> Dict[int, str]:
+        """Move the oversized payloads of job documents out of line, in place.
+
+        Payloads over JOB_PAYLOAD_MAX_BYTES are left alone and returned as
+        {index: error}; with `strict` the first one raises PayloadTooLarge
+        before anything is stored.
+        """
+        rejected = {}
+        large = []
+        for index, doc in enumerate(docs):
+            if not doc.get("payload"):
+                continue
+            data = dumps(doc["payload"])
+            if len(data) > settings.JOB_PAYLOAD_MAX_BYTES:
+                error = f"Payload of {len(data)} bytes exceeds {settings.JOB_PAYLOAD_MAX_BYTES}"
+                if strict:
+                    raise PayloadTooLarge(error)
+                rejected[index] = error
+            elif len(data) > settings.JOB_PAYLOAD_INLINE_MAX_BYTES:
+                large.append((doc, data))
+        if large:
+            refs = await asyncio.gather(*(self._upload(doc, data) for doc, data in large))
+            for (doc, _), ref in zip(large, refs):
+                doc["payload"] = None
+                doc["payload_ref"] = ref
+        return rejected
+
+    async def _upload(self, doc: dict, data: bytes) -> dict:
+        job_id = doc.setdefault("_id", ObjectId()) # Known before the insert, for the blob's metadata
+        blob = zlib.compress(data)
+        file_id = await self._bucket().upload_from_stream(
+            f"{job_id}.payload.json.z", blob, metadata={"job_id": str(job_id)}
+        )
+        return {"backend": "gridfs", "file_id": str(file_id), "size": len(data), "stored": len(blob)}
+
+    async def load(self, ref: dict) -> dict:
+        stream = await self._bucket().open_download_stream(ObjectId(ref["file_id"]))
+        return loads(zlib.decompress(await stream.read()))
+
+    async def resolve(self, jobs: Iterable[dict]):
+        """Fill in the payload of jobs stored out of line (concurrently), in place."""
+        pending = [job for job in jobs if job.get("payload_ref") and job.get("payload") is None]
+        payloads = await asyncio.gather(*(self.load(job["payload_ref"]) for job in pending))
+        for job, payload in zip(pending, payloads):
+            job["payload"] = payload
+
+    async def delete(self, refs: List[Optional[dict]]):
+        for ref in refs:
+            if not ref:
+                continue
+            try:
+                await self._bucket().delete(ObjectId(ref["file_id"]))
+            except Exception as e:
+                logger.warning("Could not delete payload blob %s: %s", ref, e)
+
+payload_store = PayloadStore()
@@ -1,57 +1,410 @@
-import json
-from datetime import datetime
-from app.core.redis import redis_client
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.core.config import settings
 from app.core.database import db
-from app.models.job import Job, JobStatus, JobCreate
+from app.core.shards import shards
+from app.core.queues import QUEUES, DEAD_LETTER_QUEUE, queue_for_priority
+from app.core.metrics import ENQUEUE_STAGE_SECONDS, QUEUE_DEPTH, timed
+from app.models.job import Job, JobStatus, JobCreate, JobBatchItemResult, WorkflowCreate, WorkflowResult
+from app.services.delayed_promoter import DELAYED_KEY, DELAYED_TARGET_KEY
+from app.services.job_store import job_store
+from app.services.events import event_bus
+from app.services.reliable_queue import LEASES_KEY
+from app.services.fair_queue import fair_queue
+from app.services.result_store import result_store
+from app.services.dependencies import DependencyError, dependency_tracker
+from app.services.idempotency import idempotency_store
+from app.services.payload_store import PayloadTooLarge, payload_store
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000 # MongoDB error code
 
 class QueueService:
+    def new_job_dict(self, job_data: JobCreate, created_at: datetime, waiting: bool = False) -> dict:
+        job_dict = job_data.model_dump()
+        if job_data.debounce:
+            # Opens a debounce window: runs once no repeat has come in for `debounce` seconds
+            job_dict["scheduled_at"] = created_at + timedelta(seconds=job_data.debounce)
+        if waiting:
+            job_dict["status"] = JobStatus.WAITING
+        else:
+            job_dict["status"] = JobStatus.DELAYED if job_dict["scheduled_at"] else JobStatus.QUEUED
+        job_dict["created_at"] = created_at
+        job_dict["retry_count"] = 0
+        job_dict["max_retries"] = 3
+        return job_dict
+
     async def enqueue_job(self, job_data: JobCreate) -> Job:
+        if job_data.idempotency_key:
+            job, _ = await self.enqueue_idempotent(job_data)
+            return job
+        return await self._create_job(job_data)
+
+    async def _create_job(self, job_data: JobCreate, job_id: Optional[str] = None) -> Job:
+        # Raises DependencyError for unknown/failed parents; completed ones don't count
+        parents = await dependency_tracker.unfinished_parents(job_data.depends_on) if job_data.depends_on else []
         try:
-            print(f"Stats: Enqueueing job for {job_data.user_id}")
             # 1. Create Job in MongoDB
-            job_dict = job_data.model_dump()
-            job_dict["status"] = JobStatus.QUEUED
-            job_dict["created_at"] = datetime.utcnow()
-            job_dict["retry_count"] = 0
-            job_dict["max_retries"] = 3
-            
-            if job_data.scheduled_at:
-                job_dict["status"] = JobStatus.DELAYED
+            job_dict = self.new_job_dict(job_data, datetime.utcnow(), waiting=bool(parents))
+            if job_id:
+                job_dict["_id"] = ObjectId(job_id)
+            await payload_store.offload([job_dict])
 
-            print("Stats: Insert into Mongo...")
-            result = await db.db["jobs"].insert_one(job_dict)
+            with timed(ENQUEUE_STAGE_SECONDS, stage="mongo_insert"):
+                result = await db.db["jobs"].insert_one(job_dict)
             job_dict["_id"] = str(result.inserted_id)
-            print(f"Stats: Mongo Inserted ID: {job_dict['_id']}")
             
-            job = Job(**job_dict)
+            job = Job.model_construct(**job_dict) # Built from a validated JobCreate
 
-            # 2. Push to Redis
-            print("Stats: Pushing to Redis...")
-            await self._push_to_redis(job)
-            print("Stats: Pushed to Redis")
+            # 2. Cache + Push to Redis
+            with timed(ENQUEUE_STAGE_SECONDS, stage="redis_push"):
+                await job_store.put(job_dict)
+                if parents:
+                    await self._register_waiting([(job_dict, parents)])
+                else:
+                    await self._push_to_redis(job)
             
             # 3. Publish Event
             try:
-                print("Stats: Publishing Event...")
-                await redis_client.publish("events:jobs", json.dumps({
-                    "job_id": job.id,
-                    "status": job.status,
-                    "user_id": job.user_id
-                }))
-                print("Stats: Event Published")
+                with timed(ENQUEUE_STAGE_SECONDS, stage="publish"):
+                    await event_bus.publish({
+                        "job_id": job.id,
+                        "status": job.status,
+                        "user_id": job.user_id
+                    })
             except Exception as pe:
-                print(f"Stats: Publish Failed (Non-critical): {pe}")
+                logger.warning("Publish failed (non-critical): %s", pe, extra={"job_id": job.id})
             
+            logger.debug("Enqueued job %s", job.id, extra={"job_id": job.id, "user_id": job.user_id})
             return job
+        except DuplicateKeyError:
+            # Idempotency key already taken; enqueue_idempotent resolves it
+            await payload_store.delete([job_dict.get("payload_ref")])
+            raise
+        except PayloadTooLarge:
+            raise
+        except Exception:
+            logger.exception("Error enqueuing job", extra={"user_id": job_data.user_id})
+            raise
+
+    async def enqueue_idempotent(self, job_data: JobCreate) -> Tuple[Job, bool]:
+        """enqueue_job for a submission with an idempotency_key; returns (job, created).
+
+        A repeat within IDEMPOTENCY_TTL gets back the job created for the key.
+        With `debounce`, a repeat while that job is still delayed replaces its
+        payload and pushes it back instead; once it has been released, the
+        repeat starts a new job.
+        """
+        user_id, key = job_data.user_id, job_data.idempotency_key
+        job_id = str(ObjectId())
+        holder = await idempotency_store.reserve(user_id, key, job_id)
+        if holder:
+            existing = await db.db["jobs"].find_one({"_id": ObjectId(holder)})
+            if existing:
+                job = await self._reuse(job_data, existing)
+                if job:
+                    return job, False
+            # The holder is gone or done with the key; the unique index arbitrates from here
+            await idempotency_store.take_over(user_id, key, job_id)
+        return await self._insert_idempotent(job_data, job_id)
+
+    async def _insert_idempotent(self, job_data: JobCreate, job_id: str) -> Tuple[Job, bool]:
+        user_id, key = job_data.user_id, job_data.idempotency_key
+        for attempt in range(3):
+            try:
+                return await self._create_job(job_data, job_id), True
+            except DuplicateKeyError:
+                # Another request inserted the key first (or its Redis reservation had expired)
+                existing = await db.db["jobs"].find_one({"user_id": user_id, "idempotency_key": key})
+                if existing:
+                    job = await self._reuse(job_data, existing)
+                    if job:
+                        await idempotency_store.take_over(user_id, key, job.id)
+                        return job, False
+                if attempt == 2:
+                    raise
+            except Exception:
+                await idempotency_store.release(user_id, key, job_id)
+                raise
+
+    async def _reuse(self, job_data: JobCreate, existing: dict) -> Optional[Job]:
+        """The job a repeat submission should get back, or None once `existing`
+        has given up its key (window over, or its debounced run was released)."""
+        now = datetime.utcnow()
+        if existing["created_at"] >= now - timedelta(seconds=settings.IDEMPOTENCY_TTL):
+            if not job_data.debounce:
+                return self._as_job(existing)
+            if existing.get("status") == JobStatus.DELAYED and await self._coalesce(existing, job_data, now):
+                return self._as_job(existing)
+        await db.db["jobs"].update_one(
+            {"_id": existing["_id"], "idempotency_key": job_data.idempotency_key}, {"$unset": {"idempotency_key": ""}}
+        )
+        return None
+
+    async def _coalesce(self, existing: dict, job_data: JobCreate, now: datetime) -> bool:
+        # Trailing-edge debounce, capped so a steady stream of repeats can't postpone it forever
+        run_at = min(
+            now + timedelta(seconds=job_data.debounce),
+            existing["created_at"] + timedelta(seconds=settings.DEBOUNCE_MAX_DELAY),
+        )
+        job_id = str(existing["_id"])
+        replacement = {"_id": existing["_id"], "payload": job_data.payload, "payload_ref": None}
+        await payload_store.offload([replacement])
+        if not await idempotency_store.postpone(job_id, run_at.timestamp()):
+            await payload_store.delete([replacement["payload_ref"]])
+            return False # Already promoted
+        fields = {"payload": replacement["payload"], "payload_ref": replacement["payload_ref"], "scheduled_at": run_at}
+        await db.db["jobs"].update_one({"_id": existing["_id"]}, {"$set": fields})
+        await job_store.patch(job_id, fields)
+        await payload_store.delete([existing.get("payload_ref")])
+        existing.update(fields)
+        return True
+
+    @staticmethod
+    def _as_job(doc: dict) -> Job:
+        return Job(**{**doc, "_id": str(doc["_id"])})
+
+    async def enqueue_many(self, jobs: List[JobCreate]) -> List[JobBatchItemResult]:
+        """Enqueue a batch with one insert_many, one Redis pipeline and one event.
+
+        Idempotency keys are reserved in one pipelined round trip; only repeats
+        (keys already taken) go through enqueue_idempotent one by one.
+        """
+        created_at = datetime.utcnow()
+        # One lookup for every parent referenced by the batch
+        unfinished = set(await dependency_tracker.unfinished_parents([p for job in jobs for p in job.depends_on]))
+        job_ids, repeats = await self._reserve_keys(jobs)
+
+        docs = []
+        positions = [] # doc index -> batch index
+        waiting = {}
+        skip = set(repeats)
+        for index, job_data in enumerate(jobs):
+            if index in skip:
+                continue
+            parents = [p for p in dict.fromkeys(job_data.depends_on) if p in unfinished]
+            if parents:
+                waiting[len(docs)] = parents
+            doc = self.new_job_dict(job_data, created_at, waiting=bool(parents))
+            if index in job_ids:
+                doc["_id"] = ObjectId(job_ids[index])
+            docs.append(doc)
+            positions.append(index)
+
+        results = {}
+        for item in await self.enqueue_docs(docs, waiting) if docs else []:
+            index = positions[item.index]
+            if item.status == "duplicate" and jobs[index].idempotency_key:
+                repeats.append(index) # Caught by the unique index rather than Redis
+            else:
+                results[index] = item.model_copy(update={"index": index})
+        for index in repeats:
+            results[index] = await self._enqueue_repeat(index, jobs[index])
+        return [results[index] for index in sorted(results)]
+
+    async def _reserve_keys(self, jobs: List[JobCreate]) -> Tuple[Dict[int, str], List[int]]:
+        """Reserve the batch's idempotency keys; returns the new job ids of the keyed
+        jobs and the indexes of the repeats (keys already taken)."""
+        keyed = [index for index, job in enumerate(jobs) if job.idempotency_key]
+        if not keyed:
+            return {}, []
+        job_ids = {index: str(ObjectId()) for index in keyed}
+        holders = await idempotency_store.reserve_many(
+            [(jobs[index].user_id, jobs[index].idempotency_key, job_ids[index]) for index in keyed]
+        )
+        return job_ids, [index for index, holder in zip(keyed, holders) if holder]
+
+    async def _enqueue_repeat(self, index: int, job_data: JobCreate) -> JobBatchItemResult:
+        try:
+            job, created = await self.enqueue_idempotent(job_data)
+            return JobBatchItemResult(index=index, job_id=job.id, status=job.status.value if created else "duplicate")
         except Exception as e:
-            print(f"ERROR ENQUEUING JOB: {e}")
-            import traceback
-            traceback.print_exc()
-            raise e
+            return JobBatchItemResult(index=index, status="failed", error=str(e))
+
+    async def enqueue_docs(
+        self, docs: List[dict], waiting: Optional[Dict[int, List[str]]] = None, strict: bool = False
+    ) -> List[JobBatchItemResult]:
+        """Insert and queue ready-made job documents (see enqueue_many).
+
+        `waiting` maps doc indexes to the parents they wait on; those jobs are
+        registered with the dependency tracker instead of being queued.
+        Documents rejected by a unique index come back with status "duplicate",
+        oversized payloads as "failed" (with `strict`, PayloadTooLarge is raised
+        before anything is inserted).
+        """
+        waiting = waiting or {}
+        failed = await self._insert_docs(docs, strict)
+        results = await self._queue_docs(docs, failed, waiting)
+        await self._publish_batch(results)
+        return results
+
+    async def _insert_docs(self, docs: List[dict], strict: bool) -> Dict[int, dict]:
+        """Steps 1-2 of enqueue_docs; returns {doc index: write error} for the ones not inserted."""
+        # 1. Move large payloads out of line
+        failed = {index: {"errmsg": error} for index, error in (await payload_store.offload(docs, strict)).items()}
+        inserted = [index for index in range(len(docs)) if index not in failed]
+
+        # 2. Create Jobs in MongoDB (unordered, so one bad document doesn't abort the rest)
+        try:
+            if inserted:
+                with timed(ENQUEUE_STAGE_SECONDS, stage="batch_mongo_insert"):
+                    await db.db["jobs"].insert_many([docs[index] for index in inserted], ordered=False)
+        except BulkWriteError as bwe:
+            for err in bwe.details.get("writeErrors", []):
+                failed[inserted[err["index"]]] = err
+            # Not inserted, so nothing references their payload blobs
+            await payload_store.delete([docs[index].get("payload_ref") for index in failed])
+        return failed
+
+    async def _queue_docs(
+        self, docs: List[dict], failed: Dict[int, dict], waiting: Dict[int, List[str]]
+    ) -> List[JobBatchItemResult]:
+        """Step 3 of enqueue_docs: cache and queue the inserted jobs, grouping pushes
+        per queue so each queue gets a single push/ZADD per shard."""
+        pipes = shards.pipelines()
+        results = []
+        immediate: Dict[str, List[str]] = {}
+        delayed: Dict[str, float] = {}
+        delayed_targets: Dict[str, str] = {}
+        edges = []
+        for index, doc in enumerate(docs):
+            if index in failed:
+                err = failed[index]
+                status = "duplicate" if err.get("code") == DUPLICATE_KEY else "failed"
+                results.append(JobBatchItemResult(index=index, status=status, error=err.get("errmsg", "Insert failed")))
+                continue
+
+            job_id = str(doc["_id"])
+            job_store.cache(pipes.for_job(job_id), doc)
+            if index in waiting:
+                edges.append((doc, waiting[index]))
+            elif doc["scheduled_at"]:
+                delayed[job_id] = doc["scheduled_at"].timestamp()
+                delayed_targets[job_id] = self._get_queue_key(doc["priority"], doc["user_id"])
+            else:
+                immediate.setdefault(self._get_queue_key(doc["priority"], doc["user_id"]), []).append(job_id)
+            results.append(JobBatchItemResult(index=index, job_id=job_id, status=doc["status"].value))
+
+        for queue_key, job_ids in immediate.items():
+            await fair_queue.push(queue_key, job_ids, pipes=pipes)
+        for index, job_ids in shards.group(list(delayed)).items():
+            pipes.shard(index).zadd(DELAYED_KEY, {job_id: delayed[job_id] for job_id in job_ids})
+            pipes.shard(index).hset(DELAYED_TARGET_KEY, mapping={job_id: delayed_targets[job_id] for job_id in job_ids})
+        with timed(ENQUEUE_STAGE_SECONDS, stage="batch_redis_push"):
+            await pipes.execute()
+            if edges:
+                await self._register_waiting(edges)
+        return results
+
+    async def _publish_batch(self, results: List[JobBatchItemResult]):
+        # 4. Publish one aggregate event per status (queued, delayed, waiting)
+        by_status: Dict[str, List[str]] = {}
+        for r in results:
+            if r.job_id:
+                by_status.setdefault(r.status, []).append(r.job_id)
+        if not by_status:
+            return
+        try:
+            with timed(ENQUEUE_STAGE_SECONDS, stage="batch_publish"):
+                await event_bus.publish_many([
+                    {
+                        "job_id": job_ids[0],
+                        "job_ids": job_ids,
+                        "count": len(job_ids),
+                        "status": status,
+                        "msg": f"Batch of {len(job_ids)} jobs {status}"
+                    }
+                    for status, job_ids in by_status.items()
+                ])
+        except Exception as pe:
+            logger.warning("Batch publish failed (non-critical): %s", pe)
+
+    async def enqueue_workflow(self, workflow: WorkflowCreate) -> WorkflowResult:
+        """Submit a DAG of jobs in one batch; `after` refers to other jobs by key."""
+        ids = {}
+        for job in workflow.jobs:
+            if job.key in ids:
+                raise DependencyError(f"Duplicate workflow key {job.key}")
+            ids[job.key] = str(ObjectId()) # Known up front so children can reference parents
+        for job in workflow.jobs:
+            missing = [k for k in job.after if k not in ids]
+            if missing:
+                raise DependencyError(f"Unknown workflow keys: {', '.join(missing)}")
+        self._check_acyclic(workflow)
+
+        unfinished = set(await dependency_tracker.unfinished_parents([p for job in workflow.jobs for p in job.depends_on]))
+        workflow_id = str(ObjectId())
+        created_at = datetime.utcnow()
+        docs = []
+        waiting = {}
+        for index, job in enumerate(workflow.jobs):
+            parents = [ids[k] for k in dict.fromkeys(job.after)]
+            parents += [p for p in dict.fromkeys(job.depends_on) if p in unfinished]
+            if parents:
+                waiting[index] = parents
+            doc = self.new_job_dict(job, created_at, waiting=bool(parents))
+            doc.pop("after")
+            doc["workflow_key"] = doc.pop("key")
+            doc["_id"] = ObjectId(ids[job.key])
+            doc["depends_on"] = [ids[k] for k in job.after] + list(job.depends_on)
+            doc["workflow_id"] = workflow_id
+            docs.append(doc)
+
+        # All or nothing for oversized payloads: a missing job would strand its dependents
+        for item in await self.enqueue_docs(docs, waiting, strict=True):
+            if not item.job_id:
+                # Its dependents will never be released; surface it rather than hang silently
+                logger.error(
+                    "Workflow %s job %s was not inserted: %s", workflow_id, docs[item.index]["workflow_key"], item.error
+                )
+        return WorkflowResult(workflow_id=workflow_id, jobs=ids)
+
+    def _check_acyclic(self, workflow: WorkflowCreate):
+        # Kahn's algorithm: every job must become ready once its parents are done
+        indegree = {job.key: len(set(job.after)) for job in workflow.jobs}
+        children = {}
+        for job in workflow.jobs:
+            for parent in set(job.after):
+                children.setdefault(parent, []).append(job.key)
+        ready = [key for key, n in indegree.items() if n == 0]
+        seen = 0
+        while ready:
+            key = ready.pop()
+            seen += 1
+            for child in children.get(key, []):
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if seen != len(indegree):
+            raise DependencyError("Workflow has a dependency cycle")
+
+    async def _register_waiting(self, edges: List[Tuple[dict, List[str]]]):
+        """Register waiting jobs with the dependency tracker. Jobs whose parents
+        all finished in the meantime are queued right away."""
+        counts = await dependency_tracker.register_many([
+            (str(doc["_id"]), parents, self._get_queue_key(doc["priority"], doc["user_id"])) for doc, parents in edges
+        ])
+        ready = [doc for (doc, _), n in zip(edges, counts) if n == 0]
+        broken = [doc for (doc, _), n in zip(edges, counts) if n < 0]
+        if ready:
+            await db.db["jobs"].update_many(
+                {"_id": {"$in": [ObjectId(str(doc["_id"])) for doc in ready]}}, {"$set": {"status": JobStatus.QUEUED}}
+            )
+            for doc in ready:
+                await job_store.patch(str(doc["_id"]), {"status": JobStatus.QUEUED})
+                await fair_queue.push(self._get_queue_key(doc["priority"], doc["user_id"]), [str(doc["_id"])])
+        if broken:
+            fields = {"status": JobStatus.FAILED, "error": "Dependency failed"}
+            await db.db["jobs"].update_many({"_id": {"$in": [ObjectId(str(doc["_id"])) for doc in broken]}}, {"$set": fields})
+            for doc in broken:
+                await job_store.patch(str(doc["_id"]), fields)
 
     async def retry_job(self, job_id: str):
-        from bson import ObjectId
-        
         # Fetch job
         job_data = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
         if not job_data:
@@ -62,6 +415,7 @@ class QueueService:
         job_data["retry_count"] = 0
         job_data["error"] = None
         job_data["scheduled_at"] = None # Reset delay if it was a delayed job
+        job_data["created_at"] = datetime.utcnow() # Reset time to now for sorting (and queue wait)
         
         # Update DB
         await db.db["jobs"].update_one(
@@ -71,54 +425,62 @@ class QueueService:
                 "retry_count": 0, 
                 "error": None,
                 "scheduled_at": None,
-                "created_at": datetime.utcnow() # Reset time to now for sorting
+                "result_ref": None,
+                "error_signature": None,
+                "failed_at": None,
+                "created_at": job_data["created_at"]
             }}
         )
+        await result_store.forget(job_id)
+        await shards.for_job(job_id).zrem(DEAD_LETTER_QUEUE, job_id)
+        
+        # Re-cache with the reset fields and lift any cancellation tombstone
+        await job_store.put(job_data)
+        await job_store.clear_tombstone(job_id)
         
         job_data["_id"] = str(job_data["_id"])
-        job = Job(**job_data)
+        job = Job.model_construct(**job_data)
         
         # Push to Redis
         await self._push_to_redis(job)
         
         # Notify
-        await redis_client.publish("events:jobs", json.dumps({
+        await event_bus.publish({
             "job_id": job.id,
             "status": "queued",
             "user_id": job.user_id,
             "msg": "Job Manually Retried"
-        }))
+        })
         return True
 
     async def cancel_job(self, job_id: str):
-        from bson import ObjectId
-        
         job_data = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
         if not job_data:
             return False
 
-        # Try to remove from Redis if possible 
-        # (Note: Removing from List is expensive O(N), usually we just let it fail/check status on pop)
-        # But we CAN easily remove from Delayed ZSET
+        # Removing from a List is O(N), so queued entries are left in place and a
+        # tombstone makes the worker drop them at pop time (no MongoDB read needed).
+        # The Delayed ZSET we CAN clean up cheaply.
+        await job_store.tombstone(job_id)
         if job_data.get("status") == JobStatus.DELAYED:
-            await redis_client.zrem("queue:delayed", job_id)
+            await self._unschedule(job_id)
 
         # Update DB Status
         await db.db["jobs"].update_one(
             {"_id": ObjectId(job_id)},
-            {"$set": {"status": "cancelled"}}
+            {"$set": {"status": JobStatus.CANCELLED}}
         )
+        await job_store.patch(job_id, {"status": JobStatus.CANCELLED})
+        await dependency_tracker.fail_dependents(job_id, "was cancelled")
 
-        await redis_client.publish("events:jobs", json.dumps({
+        await event_bus.publish({
             "job_id": job_id,
             "status": "cancelled",
             "user_id": job_data.get("user_id", "unknown")
-        }))
+        })
         return True
 
     async def boost_job(self, job_id: str):
-        from bson import ObjectId
-        
         job_data = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
         if not job_data or job_data["status"] not in [JobStatus.QUEUED, JobStatus.DELAYED]:
             return False
@@ -127,12 +489,11 @@ class QueueService:
         if old_priority == 3:
             return True # Already high priority
             
-        # 1. Remove from old queue/set
+        # 1. Remove from the delayed set. An entry in the old priority list is not
+        # removed (LREM is O(N)); re-caching the job with queue=high below marks it
+        # stale, so the worker skips it when popped.
         if job_data["status"] == JobStatus.DELAYED:
-            await redis_client.zrem("queue:delayed", job_id)
-        else:
-            old_queue = self._get_queue_key(old_priority)
-            await redis_client.lrem(old_queue, 0, job_id)
+            await self._unschedule(job_id)
             
         # 2. Update DB
         await db.db["jobs"].update_one(
@@ -144,32 +505,80 @@ class QueueService:
                 "msg": "Boosted"
             }}
         )
+        high_queue = self._get_queue_key(3, job_data.get("user_id"))
+        await job_store.put({**job_data, "priority": 3, "status": JobStatus.QUEUED, "queue": high_queue})
         
         # 3. Push to High Priority Queue (Right/Tail for FIFO immediate consumption)
-        await redis_client.rpush("queue:immediate:high", job_id)
+        await fair_queue.push(high_queue, [job_id], to_front=True)
         
-        await redis_client.publish("events:jobs", json.dumps({
+        await event_bus.publish({
             "job_id": job_id,
             "status": "queued",
             "priority": 3,
             "msg": "Job Boosted! ⚡"
-        }))
-        return True
+        })
         return True
     
     async def _push_to_redis(self, job: Job):
         if job.scheduled_at:
             # Add to Delayed ZSET
-            score = job.scheduled_at.timestamp()
-            await redis_client.zadd("queue:delayed", {str(job.id): score})
+            await self.schedule(str(job.id), job.scheduled_at.timestamp(), job.priority, job.user_id)
         else:
             # Add to Priority Queue
-            queue_key = self._get_queue_key(job.priority)
-            await redis_client.lpush(queue_key, str(job.id))
+            queue_key = self._get_queue_key(job.priority, job.user_id)
+            await fair_queue.push(queue_key, [str(job.id)])
+
+    async def schedule(self, job_id: str, run_at: float, priority: int, user_id: str = None):
+        # The target queue is kept next to the ZSET so the promoter never has to ask MongoDB
+        pipe = shards.for_job(job_id).pipeline(transaction=True)
+        pipe.zadd(DELAYED_KEY, {job_id: run_at})
+        pipe.hset(DELAYED_TARGET_KEY, job_id, self._get_queue_key(priority, user_id))
+        await pipe.execute()
+
+    async def _unschedule(self, job_id: str):
+        pipe = shards.for_job(job_id).pipeline(transaction=True)
+        pipe.zrem(DELAYED_KEY, job_id)
+        pipe.hdel(DELAYED_TARGET_KEY, job_id)
+        await pipe.execute()
+
+    async def queue_depths(self) -> Dict[str, int]:
+        """All queue sizes in one pipelined round trip per shard (also refreshes the depth gauges).
+
+        A priority's depth includes its tenant sub-queues (tracked by a counter
+        maintained by the push/dequeue scripts). Depths are summed over the
+        queue shards; with more than one, `shard:{n}` is each shard's backlog.
+        """
+        lists = QUEUES
+
+        async def shard_depths(index: int) -> Dict[str, int]:
+            pipe = shards.client(index).pipeline(transaction=False)
+            for q in lists:
+                pipe.llen(q)
+            pipe.zcard(DEAD_LETTER_QUEUE)
+            for q in QUEUES:
+                pipe.get(f"{q}:pending")
+            pipe.zcard(DELAYED_KEY)
+            pipe.zcard(LEASES_KEY)
+            counts = await pipe.execute()
+
+            depths = dict(zip(lists, counts))
+            depths[DEAD_LETTER_QUEUE] = counts[len(lists)]
+            for q, pending in zip(QUEUES, counts[len(lists) + 1:]):
+                depths[q] += max(0, int(pending or 0))
+            depths["delayed"] = counts[-2]
+            depths["processing"] = counts[-1]
+            return depths
+
+        per_shard = await asyncio.gather(*(shard_depths(index) for index in range(shards.count)))
+        depths = {name: sum(shard[name] for shard in per_shard) for name in per_shard[0]}
+        if len(per_shard) > 1:
+            for index, shard in enumerate(per_shard):
+                depths[f"shard:{index}"] = sum(shard[q] for q in QUEUES)
+        for queue, depth in depths.items():
+            QUEUE_DEPTH.labels(queue=queue).set(depth)
+        return depths
 
-    def _get_queue_key(self, priority: int) -> str:
-        if priority == 3: return "queue:immediate:high"
-        if priority == 1: return "queue:immediate:low"
-        return "queue:immediate:normal"
+    def _get_queue_key(self, priority: int, user_id: str = None) -> str:
+        return queue_for_priority(priority, user_id)
 
 queue_service = QueueService()
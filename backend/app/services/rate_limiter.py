@@ -1,21 +1,162 @@
-from app.core.redis import redis_client
-from fastapi import HTTPException
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.redis import LuaScript
+
+logger = logging.getLogger(__name__)
+
+# Token buckets, checked and charged atomically in one round trip.
+# KEYS: one bucket per scope (user, user+type). ARGV[1] = cost, ARGV[2] = unit,
+# then (capacity, refill per ms) for each key. Without a unit all buckets must
+# have room for the whole cost, otherwise nothing is charged. With one, as many
+# whole units of the cost are charged as every bucket has room for.
+# Returns {allowed, remaining tokens, retry after (ms), units charged}.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost, unit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tokens = {}
+local lowest
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2 + 1]), tonumber(ARGV[i * 2 + 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens[i] = math.min(capacity, level + (now - ts) * rate)
+    if not lowest or tokens[i] < lowest then lowest = tokens[i] end
+end
+local units, charge = 0, 0
+if unit > 0 then
+    units = math.min(math.floor(cost / unit + 0.5), math.floor(lowest / unit))
+    charge = units * unit
+elseif lowest >= cost then
+    units, charge = 1, cost
+end
+-- Time until the next unit (or the whole cost) fits in every bucket
+local needed = unit > 0 and unit or cost
+local retry_after = 0
+local remaining = -1
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2 + 1]), tonumber(ARGV[i * 2 + 2])
+    tokens[i] = tokens[i] - charge
+    if charge < cost and tokens[i] < needed then
+        retry_after = math.max(retry_after, math.ceil((needed - tokens[i]) / rate))
+    end
+    redis.call('HSET', key, 'tokens', tokens[i], 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate) + 1000)
+    if remaining < 0 or tokens[i] < remaining then remaining = tokens[i] end
+end
+return {units > 0 and 1 or 0, math.floor(remaining), retry_after, units}
+"""
+class RateLimitResult:
+    def __init__(
+        self, allowed: bool, limit: Optional[int] = None, remaining: Optional[int] = None,
+        retry_after: Optional[float] = 0, admitted: int = 0,
+    ):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after # Seconds; None when retrying can't help (cost above capacity)
+        self.admitted = admitted # Jobs let through by check_batch()
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.limit is not None:
+            headers["X-RateLimit-Limit"] = str(self.limit)
+        if self.remaining is not None:
+            headers["X-RateLimit-Remaining"] = str(max(0, self.remaining))
+        if not self.allowed and self.retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+def _unavailable(error: Exception) -> bool:
+    from redis.exceptions import ConnectionError, TimeoutError # Loaded by now: the client raised
+    return isinstance(error, (ConnectionError, TimeoutError, OSError, asyncio.TimeoutError))
 
 class RateLimiter:
-    def __init__(self, limit: int = 10, window: int = 60):
+    """Token bucket per user (and per user + job type when RATE_LIMIT_TYPE_LIMITS
+    sets one): `limit` requests per `window` seconds, refilled continuously."""
+
+    def __init__(self, limit: int = settings.RATE_LIMIT_REQUESTS, window: int = settings.RATE_LIMIT_WINDOW):
         self.limit = limit
         self.window = window
+        self._script = LuaScript(TOKEN_BUCKET_LUA)
+        # Local pre-check: scope -> (monotonic deadline, cost) of the last denial.
+        # Tokens only refill over time, so the same or a larger cost can't pass before then.
+        self._denied: Dict[str, Tuple[float, float]] = {}
+
+    def _buckets(self, user_id: str, job_type: Optional[str]):
+        buckets = [(f"ratelimit:bucket:{user_id}", self.limit)]
+        type_limit = settings.RATE_LIMIT_TYPE_LIMITS.get(job_type) if job_type else None
+        if type_limit:
+            buckets.append((f"ratelimit:bucket:{user_id}:{job_type}", type_limit))
+        return buckets
+
+    def _shed_locally(self, scope: str, cost: float) -> Optional[RateLimitResult]:
+        denied = self._denied.get(scope)
+        if not denied:
+            return None
+        deadline, denied_cost = denied
+        now = time.monotonic()
+        if now >= deadline:
+            del self._denied[scope]
+            return None
+        if cost < denied_cost:
+            return None
+        return RateLimitResult(False, retry_after=deadline - now)
+
+    def _remember_denial(self, scope: str, cost: float, retry_after: float):
+        if len(self._denied) > 10000:
+            now = time.monotonic()
+            self._denied = {k: v for k, v in self._denied.items() if v[0] > now}
+        self._denied[scope] = (time.monotonic() + retry_after, cost)
+
+    async def check(self, user_id: str, job_type: Optional[str] = None, cost: float = 1) -> RateLimitResult:
+        """Charge `cost` tokens from every bucket of the user (and type), or none."""
+        buckets = self._buckets(user_id, job_type)
+        capacity = min(c for _, c in buckets)
+        if cost > capacity:
+            # Never fits, however long the client waits
+            return RateLimitResult(False, capacity, retry_after=None)
+        return await self._charge(user_id, buckets, cost, 0)
+
+    async def check_batch(self, user_id: str, job_type: Optional[str], count: int) -> RateLimitResult:
+        """Admit as many of `count` jobs (RATE_LIMIT_BATCH_COST tokens each) as
+        the buckets have room for; `admitted` says how many."""
+        unit = settings.RATE_LIMIT_BATCH_COST
+        if unit <= 0:
+            return RateLimitResult(True, admitted=count)
+        return await self._charge(user_id, self._buckets(user_id, job_type), count * unit, unit)
+
+    async def _charge(self, user_id: str, buckets, cost: float, unit: float) -> RateLimitResult:
+        scope = "|".join(key for key, _ in buckets)
+
+        if settings.RATE_LIMIT_LOCAL_PRECHECK:
+            shed = self._shed_locally(scope, unit or cost)
+            if shed:
+                return shed
 
-    async def is_allowed(self, user_id: str) -> bool:
         try:
-            key = f"ratelimit:{user_id}"
-            current = await redis_client.incr(key)
-            if current == 1:
-                await redis_client.expire(key, self.window)
-            
-            return current <= self.limit
+            args = [cost, unit]
+            for _, capacity in buckets:
+                args += [capacity, capacity / (self.window * 1000)]
+            allowed, remaining, retry_after_ms, admitted = await self._script(keys=[key for key, _ in buckets], args=args)
         except Exception as e:
-            print(f"Rate Limiter Error (Allowing Request): {e}")
-            return True
+            # Only an unreachable Redis fails open; anything else is a bug or a misconfiguration
+            if not _unavailable(e):
+                raise
+            logger.warning("Rate limiter unavailable, allowing request: %s", e, extra={"user_id": user_id})
+            return RateLimitResult(True, admitted=round(cost / unit) if unit else 1)
+
+        result = RateLimitResult(bool(allowed), min(c for _, c in buckets), remaining, retry_after_ms / 1000, admitted)
+        if not admitted and settings.RATE_LIMIT_LOCAL_PRECHECK:
+            self._remember_denial(scope, unit or cost, result.retry_after)
+        return result
+
+    async def is_allowed(self, user_id: str, cost: int = 1) -> bool:
+        return (await self.check(user_id, cost=cost)).allowed
 
 rate_limiter = RateLimiter()
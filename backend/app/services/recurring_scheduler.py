@@ -0,0 +1,131 @@
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.database import db
+from app.core.leader import run_as_leader
+from app.models.job import JobCreate, JobStatus
+from app.models.schedule import MisfirePolicy
+from app.services.queue_service import queue_service
+from app.services.schedule_service import next_fire
+
+logger = logging.getLogger(__name__)
+
+def jitter_for(schedule: dict, nominal: datetime) -> timedelta:
+    # Seeded by the fire time, so a recomputed run lands on the same instant
+    spread = schedule.get("jitter") or 0
+    if not spread:
+        return timedelta(0)
+    return timedelta(seconds=random.Random(f"{schedule['_id']}:{nominal.isoformat()}").uniform(0, spread))
+
+def plan_fires(
+    schedule: dict, now: datetime, horizon: datetime, max_fires: int
+) -> Tuple[List[Tuple[datetime, datetime]], Optional[datetime]]:
+    """Runs of `schedule` due up to `horizon` as (nominal time, run time) pairs,
+    plus the next fire time left to materialize (None once the schedule has ended)."""
+    fires = []
+    t = schedule["next_run_at"]
+    end = schedule.get("end_at")
+
+    if t < now - timedelta(seconds=schedule.get("misfire_grace", 60)):
+        policy = schedule.get("misfire_policy", MisfirePolicy.FIRE_ONCE)
+        if policy == MisfirePolicy.SKIP:
+            t = next_fire(schedule, now)
+        elif policy == MisfirePolicy.FIRE_ONCE:
+            fires.append((t, now))
+            t = next_fire(schedule, now)
+        # FIRE_ALL catches up from t, max_fires per pass
+
+    while t <= horizon and len(fires) < max_fires and not (end and t > end):
+        fires.append((t, t + jitter_for(schedule, t)))
+        t = next_fire(schedule, t)
+
+    if end and t > end:
+        return fires, None
+    return fires, t
+
+class RecurringScheduler:
+    """Materializes recurring schedules into `queue:delayed`.
+
+    Each pass takes the enabled schedules whose next fire time falls within
+    SCHEDULER_LOOKAHEAD and creates their runs as delayed jobs, so the promoter
+    releases them on time. Runs are unique per (schedule_id, scheduled_for) in
+    MongoDB, which makes a repeated pass (after a crash or a leader change) a no-op.
+    """
+
+    def _job_doc(self, schedule: dict, nominal: datetime, run_at: datetime, now: datetime) -> dict:
+        job = JobCreate(
+            type=schedule["type"],
+            payload=schedule.get("payload") or {},
+            priority=schedule.get("priority", 2),
+            scheduled_at=run_at,
+            user_id=schedule["user_id"],
+        )
+        doc = queue_service.new_job_dict(job, now)
+        doc["schedule_id"] = str(schedule["_id"])
+        doc["scheduled_for"] = nominal
+        return doc
+
+    async def _requeue_duplicates(self, docs: List[dict]):
+        # The run was inserted by an earlier pass; if that pass died before queueing
+        # it, the job is still delayed. Re-adding it is safe: ZADD is idempotent and
+        # the claim at pop time skips runs that already finished.
+        query = {
+            "$or": [{"schedule_id": d["schedule_id"], "scheduled_for": d["scheduled_for"]} for d in docs],
+            "status": JobStatus.DELAYED,
+        }
+        async for job in db.db["jobs"].find(query, {"scheduled_at": 1, "priority": 1, "user_id": 1}):
+            await queue_service.schedule(str(job["_id"]), job["scheduled_at"].timestamp(), job["priority"], job["user_id"])
+
+    async def materialize_due(self, limit: int) -> int:
+        now = datetime.utcnow()
+        horizon = now + timedelta(seconds=settings.SCHEDULER_LOOKAHEAD)
+        schedules = await db.db["schedules"].find(
+            {"enabled": True, "next_run_at": {"$ne": None, "$lte": horizon}}
+        ).sort("next_run_at", 1).limit(limit).to_list(length=limit)
+
+        docs = []
+        advances = []
+        for schedule in schedules:
+            fires, next_run_at = plan_fires(schedule, now, horizon, settings.SCHEDULER_MAX_FIRES)
+            docs += [self._job_doc(schedule, nominal, run_at, now) for nominal, run_at in fires]
+            update = {"$set": {"next_run_at": next_run_at}}
+            if fires:
+                update["$set"]["last_fired_at"] = fires[-1][0]
+                update["$inc"] = {"fired_count": len(fires)}
+            # Only advance if nobody moved it meanwhile (an edit, a resume, a stale leader)
+            advances.append(UpdateOne({"_id": schedule["_id"], "next_run_at": schedule["next_run_at"]}, update))
+
+        if docs:
+            results = await queue_service.enqueue_docs(docs)
+            duplicates = [docs[r.index] for r in results if r.status == "duplicate"]
+            if duplicates:
+                logger.info("Skipped %d already materialized run(s)", len(duplicates))
+                await self._requeue_duplicates(duplicates)
+        if advances:
+            await db.db["schedules"].bulk_write(advances, ordered=False)
+        return len(schedules)
+
+    async def materialize_all_due(self, limit: int) -> int:
+        # Bounded batches; keep going while full batches come back
+        total = 0
+        while True:
+            count = await self.materialize_due(limit)
+            total += count
+            if count < limit:
+                return total
+
+    async def run(self, owner: str):
+        """Materialize schedules for as long as this process holds the scheduler lease."""
+        await run_as_leader(
+            "scheduler", owner, settings.SCHEDULER_LEASE_TTL, settings.SCHEDULER_INTERVAL, self._materialize_step
+        )
+
+    async def _materialize_step(self):
+        count = await self.materialize_all_due(settings.SCHEDULER_BATCH_SIZE)
+        if count:
+            logger.info("Materialized runs for %d schedule(s)", count, extra={"schedules": count})
+
+recurring_scheduler = RecurringScheduler()
@@ -0,0 +1,114 @@
+import asyncio
+from typing import List
+from app.core.queues import LUA_PUSH_JOB
+from app.core.redis import LuaScript
+from app.core.shards import shards
+
+# Keys (see ARCHITECTURE.md)
+LEASES_KEY = "queue:leases"              # ZSET job_id -> lease expiry (ms)
+LEASE_WORKER_KEY = "queue:leases:worker" # HASH job_id -> worker_id
+LEASE_QUEUE_KEY = "queue:leases:queue"   # HASH job_id -> source queue
+PROCESSING_PREFIX = "queue:processing:"  # LIST per worker
+LOCK_PREFIX = "lock:job:"
+
+# Removes a finished job from the processing list. The lease is only dropped
+# if this worker still owns it (the reaper may have handed it to someone else).
+ACK_LUA = """
+redis.call('LREM', KEYS[1], 1, ARGV[2])
+if redis.call('HGET', KEYS[3], ARGV[2]) == ARGV[1] then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    redis.call('HDEL', KEYS[3], ARGV[2])
+    redis.call('HDEL', KEYS[4], ARGV[2])
+end
+return 1
+"""
+
+# Extends the leases this worker owns. ARGV[1] = worker id, ARGV[2] = new expiry offset (ms), ARGV[3...] = job ids.
+HEARTBEAT_LUA = """
+local t = redis.call('TIME')
+local expires = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000) + tonumber(ARGV[2])
+local extended = 0
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[1] then
+        redis.call('ZADD', KEYS[1], 'XX', expires, ARGV[i])
+        extended = extended + 1
+    end
+end
+return extended
+"""
+
+# Re-queues up to ARGV[1] expired leases onto the consumer end of their source
+# queue and clears the stale processing entry and lock.
+# Note: processing/lock keys are derived inside the script, so this expects a
+# single Redis node rather than Cluster (each queue shard is reaped on its own).
+REAP_LUA = LUA_PUSH_JOB + """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[1]))
+for _, id in ipairs(ids) do
+    local worker = redis.call('HGET', KEYS[2], id)
+    local queue = redis.call('HGET', KEYS[3], id)
+    if worker then redis.call('LREM', ARGV[2] .. worker, 1, id) end
+    if queue then push_job(queue, id, true) end
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('HDEL', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('DEL', ARGV[3] .. id)
+end
+return ids
+"""
+
+class ReliableQueue:
+    """At-least-once delivery: popped ids stay in a per-worker processing list
+    under a lease until acked, and expired leases are re-queued by the reaper.
+    The leasing pop itself is done by FairQueue.dequeue. Leases live on the
+    shard the job was popped from."""
+
+    def __init__(self):
+        self._ack = LuaScript(ACK_LUA)
+        self._heartbeat = LuaScript(HEARTBEAT_LUA)
+        self._reap = LuaScript(REAP_LUA)
+
+    def processing_key(self, worker_id: str) -> str:
+        return f"{PROCESSING_PREFIX}{worker_id}"
+
+    async def ack(self, job_id: str, worker_id: str):
+        keys = [self.processing_key(worker_id), LEASES_KEY, LEASE_WORKER_KEY, LEASE_QUEUE_KEY]
+        await self._ack(keys=keys, args=[worker_id, job_id], client=shards.for_job(job_id))
+
+    async def ack_many(self, job_ids: List[str], worker_id: str):
+        keys = [self.processing_key(worker_id), LEASES_KEY, LEASE_WORKER_KEY, LEASE_QUEUE_KEY]
+        script = self._ack
+        await shards.each(job_ids, lambda pipe, job_id: script(keys=keys, args=[worker_id, job_id], client=pipe))
+
+    async def heartbeat(self, job_ids: List[str], worker_id: str, lease_ttl: int) -> int:
+        if not job_ids:
+            return 0
+        keys = [LEASES_KEY, LEASE_WORKER_KEY]
+        script = self._heartbeat
+        return sum(await asyncio.gather(*(
+            script(keys=keys, args=[worker_id, lease_ttl * 1000, *ids], client=shards.client(index))
+            for index, ids in shards.group(job_ids).items()
+        )))
+
+    async def release(self, job_ids: List[str]):
+        # Expire the leases now so the next reaper pass re-queues them
+        await asyncio.gather(*(
+            shards.client(index).zadd(LEASES_KEY, {job_id: 0 for job_id in ids}, xx=True)
+            for index, ids in shards.group(job_ids).items()
+        ))
+
+    async def reap(self, limit: int) -> List[str]:
+        """Re-queue up to `limit` expired leases per shard."""
+        keys = [LEASES_KEY, LEASE_WORKER_KEY, LEASE_QUEUE_KEY]
+        script = self._reap
+        reaped = await asyncio.gather(*(
+            script(keys=keys, args=[limit, PROCESSING_PREFIX, LOCK_PREFIX], client=shards.client(index))
+            for index in range(shards.count)
+        ))
+        return [job_id for ids in reaped for job_id in ids]
+
+    async def in_flight(self) -> int:
+        return sum(await asyncio.gather(*(shards.client(index).zcard(LEASES_KEY) for index in range(shards.count))))
+
+reliable_queue = ReliableQueue()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import zlib
+from typing import Any, List, Optional
+from bson import ObjectId
+from app.core.config import settings
+from app.core.database import db
+from app.core.redis import redis_client
+from app.core.serialization import dumps, loads
+from app.services.events import TERMINAL_STATUSES, event_broadcaster
+from app.services.job_store import job_store
+
+logger = logging.getLogger(__name__)
+
+RESULT_KEY_PREFIX = "result:"
+GRIDFS_BUCKET = "results"
+
+class ResultExpired(Exception):
+    """The job finished, but its result has passed RESULT_TTL (or its blob is gone)."""
+
+class ResultStore:
+    """Size-tiered storage for job results.
+
+    Results up to RESULT_INLINE_MAX_BYTES (as JSON) live in Redis under
+    `result:{job_id}` for RESULT_TTL seconds. Larger ones are zlib-compressed
+    into GridFS or a local directory (RESULT_BLOB_BACKEND). Either way the job
+    document only keeps a small `result_ref`, so `jobs` stays lean.
+    """
+
+    def key(self, job_id: str) -> str:
+        return f"{RESULT_KEY_PREFIX}{job_id}"
+
+    def _bucket(self):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        return AsyncIOMotorGridFSBucket(db.db, bucket_name=GRIDFS_BUCKET)
+
+    def _blob_path(self, job_id: str) -> str:
+        return os.path.join(settings.RESULT_BLOB_DIR, f"{job_id}.json.z")
+
+    async def save(self, job_id: str, result: Any, pipe=None) -> Optional[dict]:
+        """Store a result and return the reference to keep on the job document.
+        With `pipe`, a Redis-backed result is only queued on that pipeline."""
+        if result is None:
+            return None
+        data = dumps(result)
+        if len(data) <= settings.RESULT_INLINE_MAX_BYTES:
+            if pipe is not None:
+                pipe.set(self.key(job_id), data, ex=settings.RESULT_TTL)
+            else:
+                await redis_client.set(self.key(job_id), data, ex=settings.RESULT_TTL)
+            return {"backend": "redis", "size": len(data)}
+
+        blob = zlib.compress(data)
+        if settings.RESULT_BLOB_BACKEND == "file":
+            path = self._blob_path(job_id)
+            await asyncio.to_thread(self._write_file, path, blob)
+            return {"backend": "file", "path": path, "size": len(data), "stored": len(blob)}
+        file_id = await self._bucket().upload_from_stream(f"{job_id}.json.z", blob, metadata={"job_id": job_id})
+        return {"backend": "gridfs", "file_id": str(file_id), "size": len(data), "stored": len(blob)}
+
+    @staticmethod
+    def _write_file(path: str, blob: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path) # Readers never see a partial file
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def load(self, job_id: str, ref: Optional[dict]) -> Any:
+        if not ref:
+            return None
+        if ref["backend"] == "redis":
+            data = await redis_client.get(self.key(job_id))
+            if data is None:
+                raise ResultExpired(job_id)
+            return loads(data)
+        from gridfs.errors import NoFile
+        try:
+            if ref["backend"] == "file":
+                blob = await asyncio.to_thread(self._read_file, ref["path"])
+            else:
+                stream = await self._bucket().open_download_stream(ObjectId(ref["file_id"]))
+                blob = await stream.read()
+        except (FileNotFoundError, NoFile):
+            # Cleaned up by hand, or the volume was lost
+            logger.warning("Result blob of job %s is missing: %s", job_id, ref, extra={"job_id": job_id})
+            raise ResultExpired(job_id) from None
+        return loads(zlib.decompress(blob))
+
+    async def forget(self, *job_ids: str):
+        """Drop Redis-backed results, e.g. before the jobs run again."""
+        await redis_client.delete(*[self.key(job_id) for job_id in job_ids])
+
+    async def delete(self, refs: List[dict]):
+        """Drop blob-backed results (Redis ones expire on their own)."""
+        for ref in refs:
+            try:
+                if ref["backend"] == "file":
+                    await asyncio.to_thread(os.remove, ref["path"])
+                elif ref["backend"] == "gridfs":
+                    await self._bucket().delete(ObjectId(ref["file_id"]))
+            except Exception as e:
+                logger.warning("Could not delete result blob %s: %s", ref, e)
+
+    async def get_result(self, job_id: str) -> Optional[dict]:
+        """Status and (for finished jobs) result of a job; None if there is no such job."""
+        # Small results: one Redis GET, no MongoDB
+        data = await redis_client.get(self.key(job_id))
+        if data is not None:
+            return {"job_id": job_id, "status": "completed", "result": loads(data)}
+
+        job = await db.db["jobs"].find_one(
+            {"_id": ObjectId(job_id)}, {"status": 1, "result": 1, "result_ref": 1, "error": 1}
+        )
+        if not job:
+            return None
+        response = {"job_id": job_id, "status": job.get("status"), "result": job.get("result"), "error": job.get("error")}
+        if job.get("result_ref"):
+            response["result"] = await self.load(job_id, job["result_ref"])
+        return response
+
+    async def wait_for_result(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Like get_result, but long-polls up to `timeout` seconds for the job to finish."""
+        async def is_done():
+            job = await job_store.get(job_id)
+            return not job or job.get("status") in TERMINAL_STATUSES
+
+        await event_broadcaster.wait_for(job_id, timeout, is_done)
+        return await self.get_result(job_id)
+
+result_store = ResultStore()
@@ -0,0 +1,78 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.core.database import db
+from app.core.leader import run_as_leader
+from app.models.job import JobStatus
+from app.services.result_store import result_store
+from app.services.payload_store import payload_store
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "jobs_archive"
+
+class RetentionPolicy:
+    """Removes jobs completed more than RETENTION_DAYS ago in bounded batches,
+    either deleting them (purge) or moving them to `jobs_archive` (archive).
+    Their blob-backed results and payloads are deleted with them."""
+
+    async def purge_batch(self, query: dict, limit: int) -> int:
+        # status + completed_at matches the status_completed_at index
+        jobs = await db.db["jobs"].find(query).sort("completed_at", 1).limit(limit).to_list(length=limit)
+        if not jobs:
+            return 0
+
+        if settings.RETENTION_MODE == "archive":
+            try:
+                await db.db[ARCHIVE_COLLECTION].insert_many(jobs, ordered=False)
+            except BulkWriteError as bwe:
+                # Already archived by an interrupted earlier pass is fine; anything else is not
+                if any(err.get("code") != 11000 for err in bwe.details.get("writeErrors", [])):
+                    raise
+        else:
+            await result_store.delete([job["result_ref"] for job in jobs if job.get("result_ref")])
+            await payload_store.delete([job.get("payload_ref") for job in jobs])
+
+        await db.db["jobs"].delete_many({"_id": {"$in": [job["_id"] for job in jobs]}})
+        return len(jobs)
+
+    async def purge(self, deadline: Optional[float] = None) -> Tuple[int, bool]:
+        """Remove expired jobs until none are left or the monotonic `deadline`
+        passes; returns the count removed and whether more may be left."""
+        if not settings.RETENTION_DAYS:
+            return 0, False
+        cutoff = datetime.utcnow() - timedelta(days=settings.RETENTION_DAYS)
+        queries = [
+            {"status": JobStatus.COMPLETED, "completed_at": {"$lt": cutoff}},
+            # Completed before completed_at was recorded: fall back to the enqueue time
+            {"status": JobStatus.COMPLETED, "completed_at": None, "created_at": {"$lt": cutoff}},
+        ]
+        total = 0
+        for query in queries:
+            while True:
+                removed = await self.purge_batch(query, settings.RETENTION_BATCH_SIZE)
+                total += removed
+                if removed < settings.RETENTION_BATCH_SIZE:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    return total, True
+        return total, False
+
+    async def run(self, owner: str):
+        """Apply the retention policy for as long as this process holds the retention lease."""
+        await run_as_leader("retention", owner, settings.RETENTION_LEASE_TTL, settings.RETENTION_INTERVAL, self._purge_step)
+
+    async def _purge_step(self) -> bool:
+        # Hand back within half the lease, so it is renewed before another worker can take over
+        removed, more = await self.purge(time.monotonic() + settings.RETENTION_LEASE_TTL / 2)
+        if removed:
+            logger.info(
+                "Retention removed %d completed job(s)", removed,
+                extra={"removed": removed, "mode": settings.RETENTION_MODE},
+            )
+        return more
+
+retention_policy = RetentionPolicy()
@@ -0,0 +1,75 @@
+import math
+from datetime import datetime, timedelta
+from typing import List, Optional
+from bson import ObjectId
+from app.core.database import db
+from app.models.schedule import Schedule, ScheduleCreate
+
+def next_fire(schedule: dict, after: datetime) -> datetime:
+    """First fire time strictly after `after` (naive UTC, like every other timestamp here)."""
+    if schedule.get("cron"):
+        from croniter import croniter # Loaded on first use, not at import
+        return croniter(schedule["cron"], after).get_next(datetime)
+    # Intervals stay anchored to start_at, so skipping or restarting never causes drift
+    start = schedule["start_at"]
+    interval = schedule["interval"]
+    if after < start:
+        return start
+    steps = math.floor((after - start).total_seconds() / interval) + 1
+    return start + timedelta(seconds=steps * interval)
+
+def first_fire(schedule: dict, now: datetime) -> Optional[datetime]:
+    start = schedule.get("start_at") or now
+    if start < now:
+        first = next_fire(schedule, now)
+    elif schedule.get("interval"):
+        first = start
+    else:
+        first = next_fire(schedule, start - timedelta(seconds=1)) # Fire at start_at itself if it matches
+    if schedule.get("end_at") and first > schedule["end_at"]:
+        return None
+    return first
+
+class ScheduleService:
+    async def create(self, data: ScheduleCreate) -> Schedule:
+        now = datetime.utcnow()
+        doc = data.model_dump()
+        doc["start_at"] = doc["start_at"] or now
+        doc["created_at"] = now
+        doc["next_run_at"] = first_fire(doc, now)
+        doc["last_fired_at"] = None
+        doc["fired_count"] = 0
+        result = await db.db["schedules"].insert_one(doc)
+        doc["_id"] = str(result.inserted_id)
+        return Schedule(**doc)
+
+    async def get(self, schedule_id: str) -> Optional[dict]:
+        doc = await db.db["schedules"].find_one({"_id": ObjectId(schedule_id)})
+        if doc:
+            doc["_id"] = str(doc["_id"])
+        return doc
+
+    async def list(self, user_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = {"user_id": user_id} if user_id else {}
+        docs = await db.db["schedules"].find(query).sort("created_at", -1).limit(limit).to_list(length=limit)
+        for doc in docs:
+            doc["_id"] = str(doc["_id"])
+        return docs
+
+    async def set_enabled(self, schedule_id: str, enabled: bool) -> bool:
+        doc = await db.db["schedules"].find_one({"_id": ObjectId(schedule_id)})
+        if not doc:
+            return False
+        update = {"enabled": enabled}
+        if enabled and not doc["enabled"]:
+            # Resume from now; runs missed while paused are not owed
+            update["next_run_at"] = first_fire(doc, datetime.utcnow())
+        await db.db["schedules"].update_one({"_id": doc["_id"]}, {"$set": update})
+        return True
+
+    async def delete(self, schedule_id: str) -> bool:
+        # Runs already materialized into queue:delayed stay queued (cancel them as jobs)
+        result = await db.db["schedules"].delete_one({"_id": ObjectId(schedule_id)})
+        return result.deleted_count == 1
+
+schedule_service = ScheduleService()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import math
+import time
+from typing import List
+from app.core.config import settings
+from app.core.queues import ARRIVALS_PREFIX
+from app.core.redis import redis_client
+from app.core.shards import shards
+from app.models.worker import ScalingRecommendation, TypeExecution, WorkerInfo
+from app.services.job_stats import job_stats
+
+# Keys (see ARCHITECTURE.md)
+HEARTBEAT_KEY = "workers:heartbeat"  # ZSET worker_id -> last heartbeat
+WORKER_KEY_PREFIX = "worker:"        # HASH per worker, expires WORKER_HEARTBEAT_TTL after its last heartbeat
+
+class WorkerRegistry:
+    """Live workers and the signals an autoscaler needs.
+
+    Each worker writes its state hash and its `workers:heartbeat` score in one
+    pipeline every WORKER_HEARTBEAT_INTERVAL seconds; execution times come
+    from the job analytics buckets. Dead workers drop out through the hash
+    TTL and a score cutoff on read, so nothing has to clean up after them.
+    """
+
+    def key(self, worker_id: str) -> str:
+        return f"{WORKER_KEY_PREFIX}{worker_id}"
+
+    async def heartbeat(self, info: WorkerInfo):
+        now = time.time()
+        state = info.model_dump(mode="json")
+        state["job_ids"] = json.dumps(state["job_ids"])
+        pipe = redis_client.pipeline(transaction=False)
+        key = self.key(info.worker_id)
+        pipe.hset(key, mapping=state)
+        pipe.expire(key, settings.WORKER_HEARTBEAT_TTL)
+        pipe.zadd(HEARTBEAT_KEY, {info.worker_id: now})
+        await pipe.execute()
+
+    async def deregister(self, worker_id: str):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.delete(self.key(worker_id))
+        pipe.zrem(HEARTBEAT_KEY, worker_id)
+        await pipe.execute()
+
+    async def workers(self) -> List[WorkerInfo]:
+        """Workers with a heartbeat within WORKER_HEARTBEAT_TTL, most recent first."""
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zremrangebyscore(HEARTBEAT_KEY, "-inf", time.time() - settings.WORKER_HEARTBEAT_TTL)
+        pipe.zrevrange(HEARTBEAT_KEY, 0, -1)
+        _, worker_ids = await pipe.execute()
+        if not worker_ids:
+            return []
+        pipe = redis_client.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.hgetall(self.key(worker_id))
+        workers = []
+        for state in await pipe.execute():
+            if not state:
+                continue # Hash expired between the two round trips
+            state["job_ids"] = json.loads(state.get("job_ids") or "[]")
+            workers.append(WorkerInfo(**state))
+        return workers
+
+    async def scaling(self, backlog: int) -> ScalingRecommendation:
+        """Recommended worker count for the current load.
+
+        Little's law gives the slots busy with new arrivals (arrival rate x
+        mean execution time), sized for SCALING_TARGET_UTILIZATION; on top come
+        the slots needed to clear `backlog` within SCALING_DRAIN_SECONDS.
+        """
+        now = time.time()
+        minute = int(now // 60)
+        minutes = max(1, math.ceil(settings.SCALING_WINDOW / 60))
+        buckets = range(minute - minutes + 1, minute + 1)
+        # The current minute is only partly over
+        window = (minutes - 1) * 60 + max(1.0, now - minute * 60)
+
+        # Pushes count arrivals on the shard they go to
+        arrival_keys = [f"{ARRIVALS_PREFIX}{bucket}" for bucket in buckets]
+        totals, *arrivals = await asyncio.gather(
+            job_stats.executions(buckets), *(shards.client(index).mget(arrival_keys) for index in range(shards.count))
+        )
+        workers = await self.workers()
+
+        execution = {
+            job_type: TypeExecution(count=count, mean_seconds=round(seconds / count, 6), rate=round(count / window, 3))
+            for job_type, (count, seconds) in totals.items()
+        }
+        completed = sum(count for count, _ in totals.values())
+        mean_seconds = sum(seconds for _, seconds in totals.values()) / completed if completed else None
+        arrival_rate = sum(int(count or 0) for counts in arrivals for count in counts) / window
+
+        slots = sum(worker.concurrency for worker in workers)
+        in_flight = sum(worker.in_flight for worker in workers)
+        concurrency = slots / len(workers) if workers else max(1, settings.WORKER_CONCURRENCY)
+        if mean_seconds is None:
+            # Nothing ran in the window: keep what is there while work is waiting
+            needed = len(workers) if backlog or arrival_rate else 0
+        else:
+            needed = math.ceil(
+                arrival_rate * mean_seconds / (concurrency * settings.SCALING_TARGET_UTILIZATION)
+                + backlog * mean_seconds / (concurrency * settings.SCALING_DRAIN_SECONDS)
+            )
+        if needed == 0 and (backlog or arrival_rate):
+            needed = 1
+        recommended = min(settings.SCALING_MAX_WORKERS, max(settings.SCALING_MIN_WORKERS, needed))
+
+        return ScalingRecommendation(
+            window_seconds=round(window, 1),
+            workers=len(workers),
+            slots=slots,
+            in_flight=in_flight,
+            utilization=round(in_flight / slots, 3) if slots else 0.0,
+            backlog=backlog,
+            arrival_rate=round(arrival_rate, 3),
+            completion_rate=round(completed / window, 3),
+            mean_execution_seconds=round(mean_seconds, 6) if mean_seconds is not None else None,
+            execution=execution,
+            recommended_workers=recommended,
+        )
+
+worker_registry = WorkerRegistry()
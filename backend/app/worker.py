@@ -1,144 +1,670 @@
 import asyncio
-import json
+import logging
+import os
+import signal
+import socket
 import time
-from datetime import datetime
-from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from prometheus_client import start_http_server
 from app.core.config import settings
-from app.core.redis import redis_client
+from app.core.redis import blocking_redis_client, check_scripting, redis_client
+from app.core.shards import shards
 from app.core.database import db
+from app.core.queues import QUEUES
+from app.core.logging import configure_logging
+from app.core.metrics import (
+    APP_STARTUP_SECONDS, JOB_CLAIM_SKIPPED, JOB_DEAD_LETTERED, JOB_EXECUTION_SECONDS, JOB_RETRIES, QUEUE_WAIT_SECONDS
+)
 from app.models.job import JobStatus
+from app.services.reliable_queue import reliable_queue
+from app.services.fair_queue import fair_queue
+from app.services.delayed_promoter import delayed_promoter
+from app.services.recurring_scheduler import recurring_scheduler
+from app.services.result_store import result_store
+from app.services.payload_store import payload_store
+from app.services.retention import retention_policy
+from app.services.queue_service import queue_service
+from app.services.job_store import job_store, CANCEL_CHANNEL, CLAIMED, CANCELLED, LOCKED
+from app.services.events import TERMINAL_STATUSES, event_bus
+from app.services.dependencies import dependency_tracker
+from app.services.dead_letter import dead_letter_queue, error_signature
+from app.services.handlers import handler_registry, JobHandler
+from app.services.job_process import JobProcess
+from app.services.worker_registry import worker_registry
+from app.services.job_stats import job_stats
+from app.models.worker import WorkerInfo
 
-QUEUES = ["queue:immediate:high", "queue:immediate:normal", "queue:immediate:low"]
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """The job was cancelled while this worker was running it."""
 
 class Worker:
     def __init__(self):
         self.running = True
+        self.concurrency = max(1, settings.WORKER_CONCURRENCY)
+        self.prefetch = max(1, min(settings.WORKER_PREFETCH, self.concurrency))
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.tasks = {} # task -> job ids it runs
+        self.executor = None # Thread pool for thread-mode handlers, created on first use
+        self.type_running = {} # job type -> jobs of that type running here, for handlers with a concurrency cap
+        self.background = []
+        self.started_at = datetime.utcnow()
+        self.processed = 0
+        self.failed = 0
+        self.leases = {} # job id -> lease of its lock, renewed while the job runs here
+        self.handler_runs = {} # job id -> future of its handler
+        self.processes = {} # job id -> the process running that (process-mode) job
+        self.cancelled = set() # job ids cancelled while held by this worker
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            max_workers = settings.WORKER_EXECUTOR_MAX_WORKERS or self.concurrency
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=settings.WORKER_ID)
+        return self.executor
+
+    def _reserve_type(self, handler: JobHandler) -> bool:
+        """Take one of the handler's concurrency slots, or return False if the
+        type is at its cap here. Check and take happen without an await in
+        between, so concurrent jobs of the type can't both get the last slot."""
+        if not handler.concurrency:
+            return True
+        running = self.type_running.get(handler.job_type, 0)
+        if running >= handler.concurrency:
+            return False
+        self.type_running[handler.job_type] = running + 1
+        return True
+
+    def _release_type(self, handler: JobHandler):
+        if handler.concurrency:
+            self.type_running[handler.job_type] -= 1
+
+    def stop(self):
+        if self.running:
+            in_flight = sum(map(len, self.tasks.values()))
+            logger.info("Worker %s stopping, draining %d in-flight job(s)", settings.WORKER_ID, in_flight)
+        self.running = False
+
+    def _install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass # Not supported on this platform (e.g. Windows)
 
     async def start(self):
-        print(f"Worker {settings.WORKER_ID} started")
+        started = time.perf_counter()
+        logger.info(
+            "Worker %s started", settings.WORKER_ID,
+            extra={"concurrency": self.concurrency, "executor": settings.WORKER_EXECUTOR},
+        )
+        if settings.WORKER_METRICS_PORT:
+            start_http_server(settings.WORKER_METRICS_PORT)
         db.connect()
+        await asyncio.gather(*(check_scripting(shards.client(index)) for index in range(shards.count)))
+        migrated = await dead_letter_queue.migrate()
+        if migrated:
+            logger.info("Converted the dead letter list to a sorted set (%d entries)", migrated)
+        self._install_signal_handlers()
+        handler_registry.discover()
+        await worker_registry.heartbeat(self.info())
+        self._start_background()
+        APP_STARTUP_SECONDS.labels(component="worker", phase="startup").set(time.perf_counter() - started)
+        
+        try:
+            while self.running:
+                try:
+                    await self._poll()
+                except Exception as e:
+                    logger.exception("Worker error: %s", e)
+                    await asyncio.sleep(1)
+        finally:
+            await self.shutdown()
+
+    def _start_background(self):
+        loops = [self._registry_loop(), job_stats.run_flusher()]
+        if settings.PROMOTER_ENABLED:
+            # Only the elected leader actually promotes delayed jobs
+            loops.append(delayed_promoter.run(settings.WORKER_ID))
+        if settings.SCHEDULER_ENABLED:
+            loops.append(recurring_scheduler.run(settings.WORKER_ID))
+        if settings.RETENTION_ENABLED:
+            loops.append(retention_policy.run(settings.WORKER_ID))
+        if settings.STATS_ROLLUP_ENABLED:
+            loops.append(job_stats.run_rollups(settings.WORKER_ID))
+        # Bulk DLQ requeues/purges recorded by the API
+        loops.append(dead_letter_queue.run(settings.WORKER_ID))
+        if job_store.write_behind:
+            loops.append(job_store.run_flusher())
+        if settings.RELIABLE_QUEUE:
+            loops += [self._heartbeat_loop(), self._reaper_loop()]
+        loops += [self._lock_loop(), self._cancel_listener()]
+        self.background += [asyncio.create_task(loop) for loop in loops]
+
+    async def _poll(self):
+        # 1. Wait for a free slot before popping, so popped jobs never wait in memory
+        await self.slots.acquire()
+        held = 1
+        # Prefetch: also take whatever other slots are free right now
+        while held < self.prefetch and not self.slots.locked():
+            await self.slots.acquire()
+            held += 1
+        
+        # 2. Process Queues
+        try:
+            popped = await self.pop(held)
+        except BaseException:
+            for _ in range(held):
+                self.slots.release()
+            raise
+        
+        for _ in range(held - len(popped)):
+            self.slots.release()
+        if len(popped) == 1:
+            queue_name, job_id = popped[0]
+            self.spawn(job_id, queue_name)
+        elif popped:
+            self.spawn_batch(popped)
+
+    async def pop(self, count: int = 1) -> List[Tuple[str, str]]:
+        """Pop up to `count` (queue_name, job_id) entries, in priority order."""
+        if settings.FAIR_SCHEDULING or settings.RELIABLE_QUEUE or count > 1 or shards.sharded:
+            # Scripted pop: tenant round-robin + priority aging, several ids per call,
+            # and with the reliable queue an atomic move into our processing list
+            # (nothing is lost if we die mid-job). With queue shards it starts at our
+            # home shard and steals from the others.
+            lease_ttl = settings.LEASE_TTL if settings.RELIABLE_QUEUE else 0
+            popped = await fair_queue.dequeue(
+                QUEUES, settings.WORKER_ID, lease_ttl, count=count, aging=settings.QUEUE_AGING_SECONDS
+            )
+            if not popped:
+                # Block until a producer signals new work (on our home shard; the
+                # others are checked again after at most QUEUE_IDLE_WAIT)
+                await fair_queue.wait_for_work(settings.QUEUE_IDLE_WAIT, settings.WORKER_ID)
+            return popped
         
-        while self.running:
+        # BRPOP blocks until a job is available
+        # We need to use redis-py's blocking pop which takes multiple keys
+        # It returns a tuple (queue_name, value)
+        result = await blocking_redis_client.brpop(QUEUES, timeout=1)
+        if not result:
+            return []
+        return [tuple(result)] # (queue_name, job_id)
+
+    def _track(self, task: asyncio.Task, job_ids: List[str]):
+        self.tasks[task] = job_ids
+        task.add_done_callback(lambda t: self.tasks.pop(t, None))
+
+    def spawn(self, job_id: str, queue_name: str = None):
+        # Slot is already held by the caller and released when the job finishes
+        self._track(asyncio.create_task(self._run_job(job_id, queue_name)), [job_id])
+
+    def spawn_batch(self, popped: List[Tuple[str, str]]):
+        # One slot per popped job is held by the caller
+        self._track(asyncio.create_task(self._run_batch(popped)), [job_id for _, job_id in popped])
+
+    async def _run_job(self, job_id: str, queue_name: str = None):
+        try:
+            await self.process_job(job_id, queue_name)
+            # Not reached on crash/cancel, so the lease expires and the reaper re-queues the job
+            if settings.RELIABLE_QUEUE:
+                await reliable_queue.ack(job_id, settings.WORKER_ID)
+        finally:
+            self.slots.release()
+
+    async def _run_batch(self, popped: List[Tuple[str, str]]):
+        try:
+            await self.process_batch(popped)
+            if settings.RELIABLE_QUEUE:
+                await reliable_queue.ack_many([job_id for _, job_id in popped], settings.WORKER_ID)
+        finally:
+            for _ in popped:
+                self.slots.release()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.LEASE_HEARTBEAT_INTERVAL)
             try:
-                # 1. Check Delayed Jobs
-                await self.process_delayed_jobs()
-                
-                # 2. Process Queues
-                # BRPOP blocks until a job is available
-                # We need to use redis-py's blocking pop which takes multiple keys
-                # It returns a tuple (queue_name, value)
-                result = await redis_client.brpop(QUEUES, timeout=1)
-                
-                if result:
-                    queue_name, job_id = result
-                    await self.process_job(job_id)
-                
+                in_flight = [job_id for job_ids in self.tasks.values() for job_id in job_ids]
+                await reliable_queue.heartbeat(in_flight, settings.WORKER_ID, settings.LEASE_TTL)
             except Exception as e:
-                print(f"Worker Error: {e}")
+                logger.error("Heartbeat error: %s", e)
+
+    def _observe(self, job_type: str, outcome: str, seconds: float, user_id: str = None):
+        JOB_EXECUTION_SECONDS.labels(type=job_type, outcome=outcome).observe(seconds)
+        job_stats.observe(job_type, user_id, outcome, seconds)
+        self.processed += 1
+        if outcome == "failure":
+            self.failed += 1
+
+    def info(self, throughput: float = 0.0) -> WorkerInfo:
+        job_ids = [job_id for job_ids in self.tasks.values() for job_id in job_ids]
+        return WorkerInfo(
+            worker_id=settings.WORKER_ID,
+            host=socket.gethostname(),
+            pid=os.getpid(),
+            started_at=self.started_at,
+            last_seen=datetime.utcnow(),
+            concurrency=self.concurrency,
+            prefetch=self.prefetch,
+            in_flight=len(job_ids),
+            processed=self.processed,
+            failed=self.failed,
+            throughput=round(throughput, 3),
+            job_ids=job_ids[:settings.WORKER_HEARTBEAT_MAX_JOB_IDS],
+        )
+
+    async def _registry_loop(self):
+        last_beat, last_processed = time.monotonic(), self.processed
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_INTERVAL)
+            now, processed = time.monotonic(), self.processed
+            try:
+                await worker_registry.heartbeat(self.info((processed - last_processed) / (now - last_beat)))
+            except Exception as e:
+                logger.error("Registry heartbeat error: %s", e)
+            last_beat, last_processed = now, processed
+
+    async def _lock_loop(self):
+        # Keeps the locks of long jobs alive; also the fallback for missed cancel messages
+        while True:
+            await asyncio.sleep(settings.JOB_LOCK_RENEW_INTERVAL)
+            try:
+                cancelled, lost = await job_store.renew_locks(dict(self.leases), settings.WORKER_ID)
+                for job_id in cancelled:
+                    self.cancel(job_id)
+                if lost:
+                    # Another worker may have claimed them meanwhile: stop ours and drop its result
+                    logger.warning("Lost the lock of %d running job(s)", len(lost), extra={"job_ids": lost})
+                for job_id in lost:
+                    self.cancel(job_id, "lost its lock")
+            except Exception as e:
+                logger.error("Lock renewal error: %s", e)
+
+    async def _cancel_listener(self):
+        """Stop running jobs as soon as cancel_job announces them on CANCEL_CHANNEL."""
+        if not hasattr(blocking_redis_client.client, "pubsub"):
+            return # Upstash HTTP has no Pub/Sub; _lock_loop still notices the tombstones
+        while True:
+            pubsub = blocking_redis_client.pubsub()
+            try:
+                await pubsub.subscribe(CANCEL_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.cancel(message["data"])
+            except Exception as e:
+                logger.error("Cancel listener error: %s", e)
                 await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
 
-    async def process_delayed_jobs(self):
-        # Check for jobs ready to run (score <= current_timestamp)
-        now = datetime.utcnow().timestamp()
+    def cancel(self, job_id: str, reason: str = "cancelled"):
+        """Stop a job this worker is running because it was cancelled (or its
+        lock expired). Nothing is written for it afterwards.
+
+        Async handlers are cancelled and process handlers killed; a thread
+        can't be interrupted, so only its result is dropped.
+        """
+        if job_id not in self.leases or job_id in self.cancelled:
+            return
+        self.cancelled.add(job_id)
+        if job_id in self.handler_runs:
+            self.handler_runs[job_id].cancel()
+        if job_id in self.processes:
+            self.processes[job_id].kill()
+        logger.info("Stopping job %s: %s", job_id, reason, extra={"job_id": job_id})
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(settings.REAPER_INTERVAL)
+            try:
+                # Keep going while full batches come back
+                while True:
+                    requeued = await reliable_queue.reap(settings.REAPER_BATCH_SIZE)
+                    if requeued:
+                        logger.warning(
+                            "Reaper re-queued %d job(s) with expired leases", len(requeued), extra={"job_ids": requeued}
+                        )
+                    if len(requeued) < settings.REAPER_BATCH_SIZE:
+                        break
+            except Exception as e:
+                logger.error("Reaper error: %s", e)
+
+    async def _drain(self):
+        """Let in-flight jobs finish for up to WORKER_SHUTDOWN_TIMEOUT, then cancel the rest."""
+        done, pending = await asyncio.wait(set(self.tasks), timeout=settings.WORKER_SHUTDOWN_TIMEOUT)
+        abandoned = [job_id for task in pending for job_id in self.tasks.get(task, [])]
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Cancelled %d job(s) still running after %ss", len(pending), settings.WORKER_SHUTDOWN_TIMEOUT)
+            await asyncio.gather(*pending, return_exceptions=True)
+        if settings.RELIABLE_QUEUE and abandoned:
+            # Hand them back right away instead of waiting for the lease to run out
+            await reliable_queue.release(abandoned)
+
+    async def shutdown(self):
+        self.running = False
+        if self.tasks:
+            await self._drain()
         
-        # ZRANGEBYSCORE to get ready jobs
-        jobs = await redis_client.zrangebyscore("queue:delayed", 0, now)
+        for task in self.background:
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
         
-        for job_id in jobs:
-            # Remove from delayed
-            removed = await redis_client.zrem("queue:delayed", job_id)
-            if removed:
-                # Need to find the original priority to push to correct queue
-                # For simplicity, we just look up the job or send to normal
-                job_data = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
-                if job_data:
-                    priority = job_data.get("priority", 2)
-                    queue = "queue:immediate:normal"
-                    if priority == 3: queue = "queue:immediate:high"
-                    elif priority == 1: queue = "queue:immediate:low"
-                    
-                    await redis_client.lpush(queue, job_id)
-                    print(f"Moved delayed job {job_id} to {queue}")
-
-    async def process_job(self, job_id: str):
+        try:
+            await worker_registry.deregister(settings.WORKER_ID)
+        except Exception as e:
+            logger.error("Deregistering failed: %s", e)
+
+        try:
+            await job_store.flush() # Persist whatever the write-behind buffer still holds
+            await job_stats.flush()
+        except Exception as e:
+            logger.error("Final flush failed: %s", e)
         
-        # 1. Acquire Lock
-        lock_key = f"lock:job:{job_id}"
-        is_locked = await redis_client.set(lock_key, settings.WORKER_ID, nx=True, ex=300) # 5 min lock
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        db.close()
+        await redis_client.close()
+        await blocking_redis_client.close()
+        await shards.close()
+        logger.info("Worker %s stopped", settings.WORKER_ID)
+
+    async def execute(self, handler: JobHandler, job: dict, job_id: str = None):
+        """Run the handler, enforcing the job's timeout (or the handler's).
+
+        Raises JobCancelled if cancel() stops it. Each process-mode job gets a
+        process of its own, so a timeout or cancel can kill it.
+        """
+        payload = job.get("payload") or {}
+        timeout = job.get("timeout") or handler.timeout
+        if job_id in self.cancelled:
+            raise JobCancelled(job_id)
+        run, process = self._start_handler(handler, payload)
+        if job_id:
+            self.handler_runs[job_id] = run
+            if process:
+                self.processes[job_id] = process
+        
+        try:
+            if timeout is None:
+                return await run
+            return await asyncio.wait_for(run, timeout)
+        except asyncio.TimeoutError:
+            # Note: a thread keeps running after the timeout; only the result is abandoned
+            raise TimeoutError(f"Timed out after {timeout}s") from None
+        except asyncio.CancelledError:
+            if job_id in self.cancelled:
+                raise JobCancelled(job_id) from None
+            raise
+        finally:
+            if job_id:
+                self.handler_runs.pop(job_id, None)
+                self.processes.pop(job_id, None)
+            if process:
+                process.kill() # Also stops a timed-out job
+
+    def _start_handler(self, handler: JobHandler, payload: dict) -> Tuple[asyncio.Future, Optional[JobProcess]]:
+        if handler.mode == "async":
+            return asyncio.ensure_future(handler.func(payload)), None
+        if handler.mode == "process":
+            # CPU-bound work runs outside the event loop, in a process that only runs this job
+            process = JobProcess(handler.func, payload)
+            return asyncio.ensure_future(process.result()), process
+        # Blocking work goes to the thread pool so it doesn't block other in-flight jobs
+        return asyncio.get_running_loop().run_in_executor(self._executor(), handler.func, payload), None
+
+    @staticmethod
+    def _finished(job: dict) -> bool:
+        """A claimed job that must not run after all. Once its tombstone and
+        cache hash have expired, the claim can't tell a cancelled (or finished)
+        job from a queued one; the document reloaded from MongoDB can."""
+        status = getattr(job.get("status"), "value", job.get("status")) # Enum when read from MongoDB
+        if status not in TERMINAL_STATUSES:
+            return False
+        JOB_CLAIM_SKIPPED.labels(reason="cancelled" if status == "cancelled" else "stale").inc()
+        logger.info("Skipping %s job %s", status, job["_id"], extra={"job_id": str(job["_id"])})
+        return True
+
+    @staticmethod
+    def _claimed(claim: int) -> bool:
+        """Count a claim that didn't take: cancelled, locked by another worker,
+        or a stale entry left behind by a boost."""
+        if claim == CLAIMED:
+            return True
+        reason = "cancelled" if claim == CANCELLED else "locked" if claim == LOCKED else "stale"
+        JOB_CLAIM_SKIPPED.labels(reason=reason).inc()
+        return False
+
+    def _admit(self, job_id: str, job: dict, queue_name: str, now: datetime) -> bool:
+        """Checks on a claimed job before it runs: take its lease and record its queue wait."""
+        if not job or self._finished(job):
+            return False
+        self.leases[job_id] = job.get("lease") or settings.JOB_LOCK_TTL
+        if job.get("created_at") and queue_name:
+            QUEUE_WAIT_SECONDS.labels(queue=queue_name).observe(max(0.0, (now - job["created_at"]).total_seconds()))
+        return True
+
+    async def _defer(self, jobs: List[Tuple[str, dict]]):
+        """Hand back jobs whose type is at its cap on this worker, instead of
+        holding worker slots while they wait."""
+        scheduled_at = datetime.utcnow() + timedelta(seconds=settings.WORKER_TYPE_CAP_DEFER)
+        await job_store.update_many(
+            {job_id: {"status": JobStatus.DELAYED, "scheduled_at": scheduled_at} for job_id, _ in jobs}
+        )
+        for job_id, job in jobs:
+            await queue_service.schedule(job_id, scheduled_at.timestamp(), job.get("priority", 2), job.get("user_id"))
+
+    async def _release_dependents(self, job_ids: List[str]):
+        # Queue dependents that were only waiting on these jobs (batched, no per-child reads)
+        try:
+            released = await dependency_tracker.release_many(job_ids)
+            if released:
+                await self.publish_event(released[0], JobStatus.QUEUED, {
+                    "job_ids": released, "count": len(released), "msg": f"{len(released)} dependent job(s) released"
+                })
+        except Exception as e:
+            # The jobs themselves succeeded; don't send them down the failure path
+            logger.error("Releasing dependents failed: %s", e, extra={"job_ids": job_ids})
+
+    async def process_job(self, job_id: str, queue_name: str = None):
         
-        if not is_locked:
+        # 1. Drop cancelled/stale entries and acquire the lock, in one round trip
+        claim = await job_store.claim(job_id, queue_name, settings.WORKER_ID, settings.JOB_LOCK_TTL)
+        if claim == CANCELLED:
+            logger.info("Skipping cancelled job %s", job_id, extra={"job_id": job_id})
+        if not self._claimed(claim):
             return
 
-        print(f"Processing job {job_id}")
+        logger.info("Processing job %s", job_id, extra={"job_id": job_id, "queue": queue_name})
+        job = {}
+        job_type = "unknown"
+        started = None
+        reserved = None
+        self.leases[job_id] = settings.JOB_LOCK_TTL
         
         try:
-            # Update status to ACTIVE
-            await db.db["jobs"].update_one(
-                {"_id": ObjectId(job_id)},
-                {"$set": {"status": JobStatus.ACTIVE, "started_at": datetime.utcnow()}}
-            )
-            await self.publish_event(job_id, JobStatus.ACTIVE)
+            # 2. Fetch payload (Redis job cache, MongoDB only on a miss)
+            job = await job_store.get(job_id)
+            if not self._admit(job_id, job, queue_name, datetime.utcnow()):
+                return
+            await payload_store.resolve([job]) # Large payloads are stored out of line
+            job_type = job.get("type") or "unknown"
 
-            # Fetch payload
-            job = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
-            if not job:
+            # 3. Reserve a slot of the job's type, or hand the job back if the type is at its cap
+            handler = handler_registry.get(job.get("type"))
+            if not self._reserve_type(handler):
+                await self._defer([(job_id, job)])
                 return
+            reserved = handler
 
-            # --- SIMULATE EXECUTION ---
-            # In a real system, you'd dispatch based on job['type']
-            await asyncio.sleep(2) # Fake work
-            
-            # Simulate random failure
-            # import random
-            # if random.random() < 0.2:
-            #     raise Exception("Random Failure")
-
-            # Update status to COMPLETED
-            await db.db["jobs"].update_one(
-                {"_id": ObjectId(job_id)},
-                {"$set": {"status": JobStatus.COMPLETED, "completed_at": datetime.utcnow(), "result": {"msg": "Success"}}}
+            # 4. Update status to ACTIVE and dispatch to the handler registered for job['type']
+            await job_store.update(job_id, {"status": JobStatus.ACTIVE, "started_at": datetime.utcnow()})
+            await self.publish_event(job_id, JobStatus.ACTIVE)
+            started = time.perf_counter()
+            result = await self.execute(handler, job, job_id)
+            if job_id in self.cancelled:
+                raise JobCancelled(job_id) # Stopped just as the handler returned
+            self._observe(job_type, "success", time.perf_counter() - started, job.get("user_id"))
+
+            # 5. Store the result out of the job document, then update status to COMPLETED
+            result_ref = await result_store.save(job_id, result)
+            await job_store.update(
+                job_id, {"status": JobStatus.COMPLETED, "completed_at": datetime.utcnow(), "result_ref": result_ref}
             )
             await self.publish_event(job_id, JobStatus.COMPLETED)
+            await self._release_dependents([job_id])
 
+        except JobCancelled:
+            # cancel_job already recorded the status and failed the dependents (a lost
+            # lock means another worker owns the job now)
+            self._observe(job_type, "cancelled", time.perf_counter() - started, job.get("user_id"))
+            logger.info("Job %s stopped after cancellation", job_id, extra={"job_id": job_id, "type": job_type})
         except Exception as e:
-            print(f"Job {job_id} Failed: {str(e)}")
+            if started is not None:
+                self._observe(job_type, "failure", time.perf_counter() - started, job.get("user_id"))
+            logger.warning("Job %s failed: %s", job_id, e, extra={"job_id": job_id, "type": job_type})
             await self.handle_failure(job_id, str(e))
         finally:
-            await redis_client.delete(lock_key)
+            if reserved:
+                self._release_type(reserved)
+            self.leases.pop(job_id, None)
+            self.cancelled.discard(job_id)
+            await job_store.unlock([job_id], settings.WORKER_ID)
+
+    async def _run_handler(self, job_id: str, job: dict, handler: JobHandler):
+        """Run one job of a batch; returns (succeeded, result or error message).
+        A job stopped by cancellation returns (False, None)."""
+        job_type = job.get("type") or "unknown"
+        started = time.perf_counter()
+        try:
+            await payload_store.resolve([job])
+            result = await self.execute(handler, job, job_id)
+            if job_id in self.cancelled:
+                raise JobCancelled(job_id)
+        except JobCancelled:
+            self._observe(job_type, "cancelled", time.perf_counter() - started, job.get("user_id"))
+            logger.info("Job %s stopped after cancellation", job_id, extra={"job_id": job_id, "type": job_type})
+            return False, None
+        except Exception as e:
+            self._observe(job_type, "failure", time.perf_counter() - started, job.get("user_id"))
+            logger.warning("Job %s failed: %s", job_id, e, extra={"job_id": job_id, "type": job_type})
+            return False, str(e)
+        self._observe(job_type, "success", time.perf_counter() - started, job.get("user_id"))
+        return True, result
+
+    async def _finish_batch(self, runnable: List[tuple], outcomes: List[tuple]):
+        """Store results and mark successes COMPLETED together; failures go through the usual path."""
+        completed = {}
+        pipe = redis_client.pipeline(transaction=False)
+        finished_at = datetime.utcnow()
+        for (job_id, *_), (ok, value) in zip(runnable, outcomes):
+            if ok:
+                result_ref = await result_store.save(job_id, value, pipe=pipe)
+                completed[job_id] = {"status": JobStatus.COMPLETED, "completed_at": finished_at, "result_ref": result_ref}
+        await pipe.execute()
+        await job_store.update_many(completed)
+        await event_bus.publish_many([{"job_id": job_id, "status": JobStatus.COMPLETED} for job_id in completed])
+        for (job_id, *_), (ok, value) in zip(runnable, outcomes):
+            if not ok and value is not None: # None: cancelled
+                await self.handle_failure(job_id, value)
+        await self._release_dependents(list(completed))
+
+    async def process_batch(self, popped: List[Tuple[str, str]]):
+        """process_job for a prefetched batch (WORKER_PREFETCH > 1).
+
+        Same steps, but each one is a single round trip for the whole batch:
+        pipelined claims, locks, cache reads and events, one $in query for
+        cache misses and one bulk_write per status transition.
+        """
+        # 1. Drop cancelled/stale entries and acquire the locks
+        claims = await job_store.claim_many(
+            [(job_id, queue) for queue, job_id in popped], settings.WORKER_ID, settings.JOB_LOCK_TTL
+        )
+        claimed = [entry for entry, claim in zip(popped, claims) if self._claimed(claim)]
+        if not claimed:
+            return
+
+        job_ids = [job_id for _, job_id in claimed]
+        self.leases.update(dict.fromkeys(job_ids, settings.JOB_LOCK_TTL))
+        runnable = []
+        try:
+            # 2. Fetch payloads (pipelined cache reads, one $in query for misses)
+            jobs = await job_store.get_many(job_ids)
+            deferred = []
+            now = datetime.utcnow()
+            for queue_name, job_id in claimed:
+                job = jobs.get(job_id)
+                if not self._admit(job_id, job, queue_name, now):
+                    continue
+                # 3. Reserve a slot per job of a capped type; the ones over the cap are handed back
+                handler = handler_registry.get(job.get("type"))
+                if self._reserve_type(handler):
+                    runnable.append((job_id, job, handler))
+                else:
+                    deferred.append((job_id, job))
+            if deferred:
+                await self._defer(deferred)
+            if not runnable:
+                return
+            logger.info("Processing batch of %d job(s)", len(runnable), extra={"job_ids": [r[0] for r in runnable]})
+
+            # 4. Mark the batch ACTIVE (one bulk write, one event pipeline) and run the handlers concurrently
+            await job_store.update_many({job_id: {"status": JobStatus.ACTIVE, "started_at": now} for job_id, *_ in runnable})
+            await event_bus.publish_many([{"job_id": job_id, "status": JobStatus.ACTIVE} for job_id, *_ in runnable])
+            outcomes = await asyncio.gather(*(self._run_handler(*item) for item in runnable))
+
+            # 5. Store results, mark successes COMPLETED and release their dependents
+            await self._finish_batch(runnable, outcomes)
+        finally:
+            for _, _, handler in runnable:
+                self._release_type(handler)
+            for job_id in job_ids:
+                self.leases.pop(job_id, None)
+                self.cancelled.discard(job_id)
+            await job_store.unlock(job_ids, settings.WORKER_ID)
 
     async def handle_failure(self, job_id: str, error: str):
         
-        job = await db.db["jobs"].find_one({"_id": ObjectId(job_id)})
+        job = await job_store.get(job_id)
+        handler = handler_registry.get(job.get("type"))
         retry_count = job.get("retry_count", 0)
-        max_retries = job.get("max_retries", 3)
+        max_retries = handler.max_retries if handler.max_retries is not None else job.get("max_retries", 3)
         
         if retry_count < max_retries:
-            # Exponential Backoff
-            delay = 2 ** retry_count # 1s, 2s, 4s...
+            # Exponential Backoff (per-type policy)
+            delay = handler.retry_delay(retry_count)
             next_retry = datetime.utcnow().timestamp() + delay
             
-            await db.db["jobs"].update_one(
-                {"_id": ObjectId(job_id)},
-                {"$set": {"status": JobStatus.DELAYED, "retry_count": retry_count + 1, "error": error}}
-            )
-            await redis_client.zadd("queue:delayed", {job_id: next_retry})
+            JOB_RETRIES.labels(type=job.get("type") or "unknown").inc()
+            await job_store.update(job_id, {"status": JobStatus.DELAYED, "retry_count": retry_count + 1, "error": error})
+            await queue_service.schedule(job_id, next_retry, job.get("priority", 2), job.get("user_id"))
             await self.publish_event(job_id, "retrying", {"retry_in": delay})
         else:
             # Dead Letter
-            await db.db["jobs"].update_one(
-                {"_id": ObjectId(job_id)},
-                {"$set": {"status": JobStatus.FAILED, "error": error}}
-            )
-            await redis_client.lpush("queue:dead_letter", job_id)
+            JOB_DEAD_LETTERED.labels(type=job.get("type") or "unknown").inc()
+            await job_store.update(job_id, {
+                "status": JobStatus.FAILED, "error": error,
+                "error_signature": error_signature(error), "failed_at": datetime.utcnow(),
+            })
+            await dead_letter_queue.add(job_id)
             await self.publish_event(job_id, JobStatus.FAILED)
+            failed = await dependency_tracker.fail_dependents(job_id, "failed")
+            if failed:
+                await self.publish_event(failed[0], JobStatus.FAILED, {
+                    "job_ids": failed, "count": len(failed), "msg": f"{len(failed)} dependent job(s) failed"
+                })
 
     async def publish_event(self, job_id, status, extra=None):
         payload = {"job_id": str(job_id), "status": status}
         if extra: payload.update(extra)
-        await redis_client.publish("events:jobs", json.dumps(payload))
+        await event_bus.publish(payload)
 
 if __name__ == "__main__":
+    configure_logging()
     worker = Worker()
-    # Basic asyncio run
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(worker.start())
+    asyncio.run(worker.start())
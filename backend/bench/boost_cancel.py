@@ -0,0 +1,87 @@
+"""Benchmark: QueueService.boost_job/cancel_job on a large priority list, vs an LREM scan.
+
+Unlike bench.run this uses the configured services (REDIS_URL or REDIS_HOST/
+REDIS_PORT/REDIS_DB, MONGO_URL/MONGO_DB_NAME) and the real key names, so point
+them at a scratch Redis database and MongoDB database. The jobs it creates are
+cancelled and deleted afterwards. Prints a JSON report.
+
+    cd backend && REDIS_DB=15 MONGO_DB_NAME=bench python -m bench.boost_cancel --size 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+from app.core.database import db
+from app.core.queues import queue_for_priority
+from app.core.redis import redis_client
+from app.models.job import JobCreate
+from app.services.job_store import job_store
+from app.services.queue_service import queue_service
+
+BENCH_USER = "bench"
+FILLER = "bench:filler" # One value for every filler entry, so a single LREM removes them all
+
+async def timed(ops: int, fn):
+    start = time.perf_counter()
+    for i in range(ops):
+        await fn(i)
+    elapsed = time.perf_counter() - start
+    return {"ops": ops, "total_s": round(elapsed, 4), "per_op_ms": round(elapsed / ops * 1000, 4)}
+
+async def bury(queue: str, size: int, chunk: int = 10000):
+    for start in range(0, size, chunk):
+        await redis_client.lpush(queue, *[FILLER] * (min(start + chunk, size) - start))
+
+async def run(size: int, lrem_ops: int, ops: int):
+    db.connect()
+    queue, high_queue = queue_for_priority(2, BENCH_USER), queue_for_priority(3, BENCH_USER)
+    report = {"queue_size": size}
+    job_ids = []
+    try:
+        results = await queue_service.enqueue_many(
+            [JobCreate(type="bench.noop", payload={}, user_id=BENCH_USER) for _ in range(ops * 2)]
+        )
+        job_ids = [r.job_id for r in results]
+        # Bury the real jobs under filler entries, like a backed-up queue
+        await bury(queue, size)
+
+        # Old boost: LREM scans the whole list
+        async def lrem_boost(i):
+            await redis_client.lrem(queue, 0, job_ids[ops + i])
+        report["boost_lrem"] = await timed(min(lrem_ops, ops), lrem_boost)
+
+        # Boost: re-cache with the high queue and push a new entry; the old one goes stale
+        async def boost(i):
+            await queue_service.boost_job(job_ids[i])
+        report["boost_tombstone"] = await timed(ops, boost)
+
+        # Cancel: a tombstone, the entries stay in the list
+        async def cancel(i):
+            await queue_service.cancel_job(job_ids[ops + i])
+        report["cancel_tombstone"] = await timed(ops, cancel)
+
+        # Pop-time cost the worker pays for the check
+        async def claim(i):
+            await job_store.claim(job_ids[i], high_queue, "bench", 5)
+        report["claim_at_pop"] = await timed(ops, claim)
+    finally:
+        # Cancelled (tombstoned) jobs are dropped at pop time if any entry is left behind
+        for job_id in job_ids[:ops]:
+            await queue_service.cancel_job(job_id)
+        await job_store.unlock(job_ids, "bench")
+        await redis_client.lrem(queue, 0, FILLER)
+        await db.db["jobs"].delete_many({"user_id": BENCH_USER, "type": "bench.noop"})
+        await redis_client.close()
+        db.close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--lrem-ops", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=10000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.size, args.lrem_ops, args.ops)), indent=2))
+
+if __name__ == "__main__":
+    main()
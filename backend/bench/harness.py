@@ -0,0 +1,55 @@
+"""In-process stand-ins for Redis and MongoDB.
+
+Must be imported before any other `app.*` module: services bind `redis_client`
+at import time, so the fake has to be in place first.
+"""
+import inspect
+import statistics
+import time
+import fakeredis
+from mongomock.collection import BulkOperationBuilder
+from mongomock_motor import AsyncMongoMockClient
+import app.core.redis as core_redis
+from app.core.database import db
+
+fake_redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+core_redis.redis_client = fake_redis
+core_redis.blocking_redis_client = fake_redis
+
+def _without_sort(add):
+    def add_op(self, *args, sort=None, **kwargs):
+        return add(self, *args, **kwargs)
+    return add_op
+
+# pymongo >= 4.11 passes `sort` for UpdateOne/ReplaceOne in bulk_write; older mongomock doesn't take it
+for _name in ("add_update", "add_replace"):
+    _add = getattr(BulkOperationBuilder, _name)
+    if "sort" not in inspect.signature(_add).parameters:
+        setattr(BulkOperationBuilder, _name, _without_sort(_add))
+
+def install_fake_mongo():
+    db.client = AsyncMongoMockClient()
+    db.db = db.client["bench"]
+
+async def reset():
+    await fake_redis.flushall()
+    install_fake_mongo()
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+def rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else 0.0
+
+def percentiles(samples, points=(50, 95, 99)) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {f"p{p}_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 3) for p in points}
+    result["mean_ms"] = round(statistics.fmean(ordered) * 1000, 3)
+    return result
@@ -0,0 +1,204 @@
+"""Offline throughput/latency benchmarks for QueueService, Worker and events.
+
+Runs against fakeredis and mongomock-motor, so no services are needed:
+
+    cd backend && pip install -r bench/requirements.txt
+    python -m bench.run --output bench.json
+    python -m bench.run --baseline bench.json   # adds change_pct vs an earlier run
+
+Absolute numbers reflect the fakes, not production; compare runs of the same
+scenario against each other.
+"""
+from bench.harness import Timer, fake_redis, percentiles, rate, reset # Must come first
+
+import argparse
+import asyncio
+import json
+import platform
+import time
+from datetime import datetime, timedelta
+from app.core.config import settings
+from app.core.queues import NORMAL_QUEUE, QUEUES
+from app.models.job import JobCreate
+from app.services.delayed_promoter import delayed_promoter, DELAYED_KEY, DELAYED_TARGET_KEY
+from app.services.events import event_bus, event_broadcaster
+from app.services.fair_queue import fair_queue
+from app.services.handlers import handler_registry
+from app.services.queue_service import queue_service
+
+BENCH_TYPE = "bench.noop"
+
+@handler_registry.register(BENCH_TYPE)
+async def noop(payload: dict):
+    return {}
+
+def make_jobs(count: int, **overrides):
+    fields = {"type": BENCH_TYPE, "payload": {"n": 1}, "user_id": "bench"}
+    fields.update(overrides)
+    return [JobCreate(**fields) for _ in range(count)]
+
+async def bench_enqueue(jobs: int, batch_size: int) -> dict:
+    await reset()
+    with Timer() as single:
+        for job in make_jobs(jobs):
+            await queue_service.enqueue_job(job)
+
+    await reset()
+    pending = make_jobs(jobs)
+    with Timer() as batched:
+        for start in range(0, jobs, batch_size):
+            await queue_service.enqueue_many(pending[start:start + batch_size])
+
+    return {
+        "jobs": jobs,
+        "batch_size": batch_size,
+        "single_jobs_per_s": rate(jobs, single.elapsed),
+        "batch_jobs_per_s": rate(jobs, batched.elapsed),
+    }
+
+async def bench_end_to_end(jobs: int, workers: int) -> dict:
+    from app.worker import Worker
+
+    await reset()
+    results = await queue_service.enqueue_many(make_jobs(jobs))
+    enqueued_at = {r.job_id: time.perf_counter() for r in results}
+    latencies = []
+
+    async def pop():
+        # Non-blocking version of Worker.pop, so idle workers exit instead of waiting
+        if settings.FAIR_SCHEDULING or settings.RELIABLE_QUEUE:
+            popped = await fair_queue.dequeue(QUEUES, settings.WORKER_ID, aging=settings.QUEUE_AGING_SECONDS)
+            return popped[0] if popped else (None, None)
+        return NORMAL_QUEUE, await fake_redis.rpop(NORMAL_QUEUE)
+
+    async def run_worker():
+        worker = Worker()
+        while len(latencies) < jobs:
+            queue, popped = await pop()
+            if not popped:
+                return
+            await worker.process_job(popped, queue)
+            latencies.append(time.perf_counter() - enqueued_at[popped])
+
+    with Timer() as total:
+        await asyncio.gather(*(run_worker() for _ in range(workers)))
+
+    return {"jobs": jobs, "workers": workers, "jobs_per_s": rate(len(latencies), total.elapsed), **percentiles(latencies)}
+
+async def bench_promotion(due: int, batch_size: int) -> dict:
+    await reset()
+    past = (datetime.utcnow() - timedelta(seconds=60)).timestamp()
+    for start in range(0, due, 10000):
+        ids = [f"job-{i}" for i in range(start, min(start + 10000, due))]
+        pipe = fake_redis.pipeline(transaction=False)
+        pipe.zadd(DELAYED_KEY, {job_id: past for job_id in ids})
+        pipe.hset(DELAYED_TARGET_KEY, mapping={job_id: NORMAL_QUEUE for job_id in ids})
+        await pipe.execute()
+
+    with Timer() as t:
+        moved = await delayed_promoter.promote_all_due(batch_size)
+    return {"due": due, "batch_size": batch_size, "promoted": moved, "seconds": round(t.elapsed, 4), "jobs_per_s": rate(moved, t.elapsed)}
+
+async def bench_boost_cancel(queue_size: int, ops: int) -> dict:
+    await reset()
+    results = await queue_service.enqueue_many(make_jobs(ops * 2))
+    job_ids = [r.job_id for r in results]
+    # Bury the real jobs under filler entries
+    for start in range(0, queue_size, 10000):
+        await fake_redis.lpush(NORMAL_QUEUE, *[f"filler-{i}" for i in range(start, min(start + 10000, queue_size))])
+
+    with Timer() as boost:
+        for job_id in job_ids[:ops]:
+            await queue_service.boost_job(job_id)
+    with Timer() as cancel:
+        for job_id in job_ids[ops:]:
+            await queue_service.cancel_job(job_id)
+    with Timer() as lrem:
+        for job_id in job_ids[ops:ops + min(ops, 20)]:
+            await fake_redis.lrem(NORMAL_QUEUE, 0, job_id)
+
+    return {
+        "queue_size": queue_size,
+        "ops": ops,
+        "boost_ms_per_op": round(boost.elapsed / ops * 1000, 3),
+        "cancel_ms_per_op": round(cancel.elapsed / ops * 1000, 3),
+        "lrem_ms_per_op": round(lrem.elapsed / min(ops, 20) * 1000, 3),
+    }
+
+async def bench_fanout(clients: int, events: int) -> dict:
+    await reset()
+    subs = [event_broadcaster.subscribe() for _ in range(clients)]
+    for i in range(events):
+        await event_bus.publish({"job_id": f"job-{i % 100}", "status": "active"})
+    entries = await fake_redis.xrange("events:jobs", count=events)
+
+    # Drive the broadcaster's dispatch directly; fakeredis XREAD BLOCK timing isn't representative
+    with Timer() as t:
+        for event_id, fields in entries:
+            event_broadcaster.dispatch(event_bus.decode(event_id, fields))
+        delivered = 0
+        for sub in subs:
+            delivered += len(await sub.get())
+    for sub in subs:
+        event_broadcaster.unsubscribe(sub)
+
+    return {
+        "clients": clients,
+        "events": events,
+        "delivered": delivered,
+        "dropped": sum(sub.dropped for sub in subs),
+        "seconds": round(t.elapsed, 4),
+        "deliveries_per_s": rate(clients * len(entries), t.elapsed),
+    }
+
+SCENARIOS = {
+    "enqueue": lambda a: bench_enqueue(a.jobs, a.batch_size),
+    "end_to_end": lambda a: bench_end_to_end(a.jobs, a.workers),
+    "promotion": lambda a: bench_promotion(a.due, settings.PROMOTER_BATCH_SIZE),
+    "boost_cancel": lambda a: bench_boost_cancel(a.queue_size, a.ops),
+    "fanout": lambda a: bench_fanout(a.clients, a.events),
+}
+
+def compare(report: dict, baseline: dict) -> dict:
+    changes = {}
+    for scenario, metrics in report["results"].items():
+        old = baseline.get("results", {}).get(scenario, {})
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and isinstance(old.get(name), (int, float)) and old[name]:
+                changes[f"{scenario}.{name}"] = round((value - old[name]) / old[name] * 100, 1)
+    return changes
+
+async def main(args):
+    names = list(SCENARIOS) if args.scenario == "all" else args.scenario.split(",")
+    report = {
+        "python": platform.python_version(),
+        "started_at": datetime.utcnow().isoformat(),
+        "results": {},
+    }
+    for name in names:
+        report["results"][name] = await SCENARIOS[name](args)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["change_pct"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job scheduler benchmarks (offline, fake Redis/Mongo)")
+    parser.add_argument("--scenario", default="all", help=f"all or a comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--due", type=int, default=100_000)
+    parser.add_argument("--queue-size", type=int, default=200_000)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    asyncio.run(main(parser.parse_args()))
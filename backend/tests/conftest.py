@@ -0,0 +1,30 @@
+"""Runs the services against the bench harness's fakeredis/mongomock stand-ins.
+
+Tests are plain functions that drive a coroutine through the `run` fixture,
+which resets both stores first.
+"""
+import bench.harness as harness # Must come first: services bind redis_client at import time
+
+import asyncio
+import pytest
+from app.services.handlers import handler_registry
+
+@handler_registry.register("test.ok")
+async def ok(payload: dict):
+    return {"ok": True}
+
+@handler_registry.register("test.fail", max_retries=0)
+async def fail(payload: dict):
+    raise RuntimeError(f"timeout after {payload.get('ms', 0)}ms")
+
+@pytest.fixture(scope="session")
+def loop():
+    # One loop for the session: module-level clients outlive a single test
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture
+def run(loop):
+    loop.run_until_complete(harness.reset())
+    return loop.run_until_complete
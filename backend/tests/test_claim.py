@@ -0,0 +1,47 @@
+from app.core.queues import HIGH_QUEUE, NORMAL_QUEUE
+from app.models.job import JobCreate, JobStatus
+from app.services.job_store import CANCELLED, CLAIMED, LOCKED, STALE, job_store
+from app.services.queue_service import queue_service
+from app.worker import Worker
+
+async def enqueue(**fields) -> str:
+    job = await queue_service.enqueue_job(JobCreate(type="test.ok", payload={}, user_id="u", **fields))
+    return job.id
+
+def test_claim_takes_the_lock_once(run):
+    async def scenario():
+        job_id = await enqueue()
+        assert await job_store.claim(job_id, NORMAL_QUEUE, "w1", 30) == CLAIMED
+        assert await job_store.claim(job_id, NORMAL_QUEUE, "w2", 30) == LOCKED
+    run(scenario())
+
+def test_cancelled_job_is_dropped_at_pop(run):
+    async def scenario():
+        job_id = await enqueue()
+        await queue_service.cancel_job(job_id)
+        assert await job_store.claim(job_id, NORMAL_QUEUE, "w1", 30) == CANCELLED
+
+        worker = Worker()
+        popped = await worker.pop(1)
+        assert popped == [(NORMAL_QUEUE, job_id)] # The entry stays in the list...
+        await worker.process_job(job_id, NORMAL_QUEUE)
+        job = await job_store.get(job_id)
+        assert job["status"] == JobStatus.CANCELLED # ...but the job never runs
+    run(scenario())
+
+def test_boost_leaves_a_stale_entry(run):
+    async def scenario():
+        job_id = await enqueue()
+        assert await queue_service.boost_job(job_id)
+        assert await job_store.claim(job_id, NORMAL_QUEUE, "w1", 30) == STALE
+        assert await job_store.claim(job_id, HIGH_QUEUE, "w1", 30) == CLAIMED
+    run(scenario())
+
+def test_retry_clears_the_tombstone(run):
+    async def scenario():
+        job_id = await enqueue()
+        await job_store.tombstone(job_id)
+        await job_store.update(job_id, {"status": JobStatus.FAILED})
+        assert await queue_service.retry_job(job_id)
+        assert await job_store.claim(job_id, NORMAL_QUEUE, "w1", 30) == CLAIMED
+    run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+from app.core.config import settings
+from app.core.database import db
+from app.core.queues import DEAD_LETTER_QUEUE
+from app.models.dead_letter import DeadLetterFilter
+from app.models.job import JobCreate, JobStatus
+from app.services.dead_letter import dead_letter_queue
+from app.services.job_store import job_store
+from app.services.queue_service import queue_service
+from app.worker import Worker
+from bench.harness import fake_redis
+
+async def dead_letter(count: int, job_type: str = "test.fail") -> list:
+    worker = Worker()
+    ids = []
+    for i in range(count):
+        job = await queue_service.enqueue_job(JobCreate(type=job_type, payload={"ms": i}, user_id="u"))
+        ids.append(job.id)
+    while popped := await worker.pop(1):
+        await worker.process_job(popped[0][1], popped[0][0])
+    assert await fake_redis.zcard(DEAD_LETTER_QUEUE) == count
+    return ids
+
+async def failed_docs() -> list:
+    return [doc async for doc in db.db["jobs"].find({"status": JobStatus.FAILED}, {"priority": 1, "user_id": 1})]
+
+def test_groups_by_error_signature(run):
+    async def scenario():
+        await dead_letter(3)
+        groups = await dead_letter_queue.groups(DeadLetterFilter(), 10)
+        assert [group["count"] for group in groups] == [3]
+    run(scenario())
+
+def test_requeue_operation_runs_in_chunks(run, monkeypatch):
+    monkeypatch.setattr(settings, "DLQ_CHUNK_SIZE", 2)
+
+    async def scenario():
+        ids = await dead_letter(5)
+        await job_store.tombstone(ids[0])
+        op = await dead_letter_queue.start("requeue", DeadLetterFilter(), rate=1000)
+        await dead_letter_queue._operations_step()
+        op = await dead_letter_queue.operation(op.operation_id)
+        assert (op.status, op.processed) == ("done", 5)
+        assert await fake_redis.zcard(DEAD_LETTER_QUEUE) == 0
+        assert not await fake_redis.exists(job_store.tombstone_key(ids[0])) # Cleared like retry_job does
+        statuses = [(await job_store.get(job_id))["status"] for job_id in ids]
+        assert statuses == [JobStatus.QUEUED] * 5
+    run(scenario())
+
+def test_overlapping_requeues_push_each_job_once(run):
+    async def scenario():
+        await dead_letter(3)
+        docs = await failed_docs()
+        await asyncio.gather(dead_letter_queue.requeue_chunk(docs), dead_letter_queue.requeue_chunk(docs))
+        await dead_letter_queue.requeue_chunk(docs) # Nothing is failed any more
+        popped = await Worker().pop(10)
+        assert sorted(job_id for _, job_id in popped) == sorted(str(doc["_id"]) for doc in docs)
+    run(scenario())
+
+def test_purge_skips_jobs_requeued_meanwhile(run):
+    async def scenario():
+        ids = await dead_letter(3)
+        docs = await failed_docs()
+        await queue_service.retry_job(ids[0])
+        await dead_letter_queue.purge_chunk(docs)
+        assert await db.db["jobs"].count_documents({}) == 1
+        assert await fake_redis.exists(job_store.key(ids[0])) # Its cache entry is kept
+        assert (await job_store.get(ids[0]))["status"] == JobStatus.QUEUED
+        assert await fake_redis.zcard(DEAD_LETTER_QUEUE) == 0
+    run(scenario())
@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime, timedelta
+from app.core.queues import NORMAL_QUEUE
+from app.models.job import JobCreate
+from app.services.delayed_promoter import DELAYED_KEY, delayed_promoter
+from app.services.queue_service import queue_service
+from bench.harness import fake_redis
+
+async def schedule(seconds: float) -> str:
+    job = await queue_service.enqueue_job(JobCreate(
+        type="test.ok", payload={}, user_id="u", scheduled_at=datetime.utcnow() + timedelta(seconds=seconds)
+    ))
+    return job.id
+
+def test_promotes_due_jobs_once(run):
+    async def scenario():
+        due = await schedule(-1)
+        later = await schedule(3600)
+        # Overlapping passes (e.g. a promoter that lost its lease) must not push twice
+        moved = await asyncio.gather(delayed_promoter.promote_all_due(100), delayed_promoter.promote_all_due(100))
+        assert sum(moved) == 1
+        assert await delayed_promoter.promote_all_due(100) == 0
+        assert await fake_redis.lrange(NORMAL_QUEUE, 0, -1) == [due]
+        assert await fake_redis.zrange(DELAYED_KEY, 0, -1) == [later]
+    run(scenario())
+
+def test_promotes_in_bounded_batches(run):
+    async def scenario():
+        for _ in range(5):
+            await schedule(-1)
+        assert await delayed_promoter.promote_all_due(2) == 5
+        assert await fake_redis.llen(NORMAL_QUEUE) == 5
+    run(scenario())
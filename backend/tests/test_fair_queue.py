@@ -0,0 +1,50 @@
+import asyncio
+from app.core.config import settings
+from app.core.queues import HIGH_QUEUE, LOW_QUEUE, QUEUES, queue_for_priority
+from app.services.fair_queue import TENANT_WEIGHTS_KEY, fair_queue
+from bench.harness import fake_redis
+
+async def push(priority: int, user_id: str, count: int):
+    await fair_queue.push(queue_for_priority(priority, user_id), [f"{user_id}-{i}" for i in range(count)])
+
+def tenants(popped):
+    return [job_id.split("-")[0] for _, job_id in popped]
+
+def test_tenants_take_turns(run, monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_SCHEDULING", True)
+
+    async def scenario():
+        await push(2, "a", 6)
+        await push(2, "b", 2)
+        popped = await fair_queue.dequeue(QUEUES, "w1", count=8)
+        assert tenants(popped) == ["a", "b", "a", "b", "a", "a", "a", "a"]
+    run(scenario())
+
+def test_tenant_weight_is_pops_per_turn(run, monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_SCHEDULING", True)
+
+    async def scenario():
+        await fake_redis.hset(TENANT_WEIGHTS_KEY, "b", 2)
+        await push(2, "a", 4)
+        await push(2, "b", 4)
+        popped = await fair_queue.dequeue(QUEUES, "w1", count=6)
+        assert tenants(popped) == ["a", "b", "b", "a", "b", "b"]
+    run(scenario())
+
+def test_strict_priority_without_aging(run):
+    async def scenario():
+        await push(3, "high", 3)
+        await push(1, "low", 1)
+        popped = await fair_queue.dequeue(QUEUES, "w1", count=4, aging=0)
+        assert [queue for queue, _ in popped] == [HIGH_QUEUE] * 3 + [LOW_QUEUE]
+    run(scenario())
+
+def test_aging_serves_a_starved_priority(run):
+    async def scenario():
+        await push(3, "high", 3)
+        await push(1, "low", 1)
+        # The first pop starts the low queue's clock
+        assert (await fair_queue.dequeue(QUEUES, "w1", aging=0.05))[0][0] == HIGH_QUEUE
+        await asyncio.sleep(0.06)
+        assert (await fair_queue.dequeue(QUEUES, "w1", aging=0.05))[0][0] == LOW_QUEUE
+    run(scenario())
@@ -0,0 +1,38 @@
+import asyncio
+from app.core.queues import NORMAL_QUEUE, QUEUES
+from app.services.fair_queue import fair_queue
+from app.services.reliable_queue import LEASES_KEY, reliable_queue
+from bench.harness import fake_redis
+
+async def lease(job_id: str, lease_ttl: float):
+    await fair_queue.push(NORMAL_QUEUE, [job_id])
+    assert await fair_queue.dequeue(QUEUES, "w1", lease_ttl) == [(NORMAL_QUEUE, job_id)]
+
+def test_reaper_requeues_expired_leases(run):
+    async def scenario():
+        await lease("j1", 0.001)
+        assert await fake_redis.llen(NORMAL_QUEUE) == 0
+        await asyncio.sleep(0.01)
+        assert await reliable_queue.reap(10) == ["j1"]
+        assert await fake_redis.lrange(NORMAL_QUEUE, 0, -1) == ["j1"]
+        assert await fake_redis.zcard(LEASES_KEY) == 0
+        assert await reliable_queue.reap(10) == [] # Nothing left to reap
+    run(scenario())
+
+def test_heartbeat_extends_only_own_leases(run):
+    async def scenario():
+        await lease("j1", 0.001)
+        assert await reliable_queue.heartbeat(["j1"], "w2", 60) == 0
+        assert await reliable_queue.heartbeat(["j1"], "w1", 60) == 1
+        await asyncio.sleep(0.01)
+        assert await reliable_queue.reap(10) == []
+    run(scenario())
+
+def test_acked_jobs_are_not_reaped(run):
+    async def scenario():
+        await lease("j1", 0.001)
+        await reliable_queue.ack("j1", "w1")
+        await asyncio.sleep(0.01)
+        assert await reliable_queue.reap(10) == []
+        assert await fake_redis.llen(reliable_queue.processing_key("w1")) == 0
+    run(scenario())